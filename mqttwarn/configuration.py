@@ -99,6 +99,9 @@ class Config(RawConfigParser):
 
         self.configuration_path = None
 
+        # Incremented on each modification, so that derived data structures can be rebuilt.
+        self.generation = 0
+
         configuration_path = os.path.dirname(configuration_file) if configuration_file else None
         RawConfigParser.__init__(self, interpolation=VariableInterpolation(configuration_path))
         if configuration_file is not None:
@@ -129,6 +132,19 @@ class Config(RawConfigParser):
 
         self.functions = None
         self.num_workers = 1
+        self.routing_workers = 0
+        self.routing_processes = 0
+        self.runtime = "threads"
+        self.priority_aging = 10.0
+
+        self.queue_max_jobs = 0
+        self.queue_max_bytes = 0
+        self.queue_overflow = "block"
+        self.queue_drop_below = None
+
+        self.spool = None
+        self.spool_sync = "normal"
+        self.shutdown_timeout = 10.0
 
         self.ca_certs = None
         self.tls_version = None
@@ -172,6 +188,28 @@ class Config(RawConfigParser):
 
             self.functions = load_functions(functions_file)
 
+    def _read(self, fp, fpname):
+        RawConfigParser._read(self, fp, fpname)  # ty: ignore[unresolved-attribute]
+        self.generation += 1
+
+    def add_section(self, section: str):
+        RawConfigParser.add_section(self, section)
+        self.generation += 1
+
+    def remove_section(self, section: str) -> bool:
+        existed = RawConfigParser.remove_section(self, section)
+        self.generation += 1
+        return existed
+
+    def set(self, section: str, option: str, value: t.Optional[str] = None):  # noqa:A003
+        RawConfigParser.set(self, section, option, value)
+        self.generation += 1
+
+    def remove_option(self, section: str, option: str) -> bool:
+        existed = RawConfigParser.remove_option(self, section, option)
+        self.generation += 1
+        return existed
+
     def level2number(self, level: str) -> int:
         levels = {
             "CRITICAL": 50,
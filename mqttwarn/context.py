@@ -7,7 +7,9 @@ import attr
 
 from mqttwarn.configuration import Config
 from mqttwarn.model import Service, TdataType, TopicTargetType
-from mqttwarn.util import load_function, sanitize_function_name
+from mqttwarn.plan import SectionPlan, ServicePlan, UserFunction, compile_section, compile_service
+from mqttwarn.topic import TopicTrie
+from mqttwarn.util import load_function
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +25,56 @@ class RuntimeContext:
     config: Config = attr.ib()
     invoker: t.Optional["FunctionInvoker"] = attr.ib()
 
+    # Subscription index, mapping topic filters to sections, and the configuration generation it was built from.
+    _subscriptions: t.Optional[TopicTrie] = attr.ib(default=None, init=False, repr=False)
+    _subscriptions_generation: t.Optional[int] = attr.ib(default=None, init=False, repr=False)
+
+    # Compiled section and service plans, and the configuration generation they were compiled from.
+    _plans: t.Dict[str, SectionPlan] = attr.ib(factory=dict, init=False, repr=False)
+    _service_plans: t.Dict[str, ServicePlan] = attr.ib(factory=dict, init=False, repr=False)
+    _plans_generation: t.Optional[int] = attr.ib(default=None, init=False, repr=False)
+
+    def compile(self):  # noqa:A003
+        """
+        Compile all configuration sections into immutable plans, which are used
+        when processing messages, instead of accessing the configuration object.
+        """
+        self._plans = {}
+        self._service_plans = {}
+        self._plans_generation = self.config.generation
+        for section in self.config.sections():
+            if section.startswith("config:"):
+                service = section[len("config:") :]
+                self._service_plans[service] = compile_service(self.config, service)
+            else:
+                self._plans[section] = compile_section(self.config, section)
+
+    def _check_plans(self):
+        if self._plans_generation != getattr(self.config, "generation", None):
+            self._plans = {}
+            self._service_plans = {}
+            self._plans_generation = getattr(self.config, "generation", None)
+
+    def get_plan(self, section: str) -> SectionPlan:
+        """
+        Return the compiled plan for a configuration section.
+        """
+        self._check_plans()
+        plan = self._plans.get(section)
+        if plan is None:
+            plan = self._plans[section] = compile_section(self.config, section)
+        return plan
+
+    def get_service_plan(self, service: str) -> ServicePlan:
+        """
+        Return the compiled plan for a `[config:<service>]` configuration section.
+        """
+        self._check_plans()
+        plan = self._service_plans.get(service)
+        if plan is None:
+            plan = self._service_plans[service] = compile_service(self.config, service)
+        return plan
+
     def get_sections(self) -> t.List[str]:
         sections = []
         for section in self.config.sections():
@@ -40,73 +92,96 @@ class RuntimeContext:
                 logger.warning("Section `%s' has no targets defined" % section)
         return sections
 
+    def build_subscriptions(self) -> TopicTrie:
+        """
+        Build the index for resolving the sections matching an inbound message topic.
+        """
+        subscriptions = TopicTrie()
+        for index, section in enumerate(self.get_sections()):
+            subscriptions.add(self.get_topic(section), (index, section))
+        self._subscriptions = subscriptions
+        self._subscriptions_generation = self.config.generation
+        return subscriptions
+
+    def get_matching_sections(self, topic: str) -> t.List[str]:
+        """
+        Return the names of all sections whose topic matches `topic`, in configuration file order.
+        The subscription index is rebuilt when the configuration has been modified.
+        """
+        subscriptions = self._subscriptions
+        if subscriptions is None or self._subscriptions_generation != self.config.generation:
+            subscriptions = self.build_subscriptions()
+        return [section for _, section in sorted(subscriptions.match(topic))]
+
     def get_topic(self, section: str) -> str:
-        if self.config.has_option(section, "topic"):
-            return self.config.get(section, "topic")
-        return section
+        return self.get_plan(section).topic
 
     def get_qos(self, section: str) -> int:
-        qos = 0
-        if self.config.has_option(section, "qos"):
-            qos = int(self.config.get(section, "qos"))
-        return qos
+        return self.get_plan(section).qos
 
     def get_timeout(self, section: str) -> int:
-        timeout = -1
-        if self.config.has_option(section, "timeout"):
-            timeout = int(self.config.get(section, "timeout"))
-        return timeout
+        return self.get_plan(section).timeout
 
     def get_notify_only_on_timeout(self, section: str) -> bool:
-        notify_only_on_timeout = False
-        if self.config.has_option(section, "notify_only_on_timeout"):
-            notify_only_on_timeout = bool(self.config.get(section, "notify_only_on_timeout"))
-        return notify_only_on_timeout
+        return self.get_plan(section).notify_only_on_timeout
+
+    def get_job_priority(self, section: str, service: str) -> int:
+        """
+        Return the scheduling priority of jobs dispatched from `section` to `service`.
+        Higher numbers are more urgent, like the `priority` of notifications.
+
+        The constant `priority` of the section takes precedence over the
+        `job_priority` of the service.
+        """
+        priority = self.get_plan(section).job_priority
+        if priority is None:
+            priority = self.get_service_plan(service).job_priority
+        return priority
 
     def get_config(self, section: str, name: str) -> t.Any:
-        value = None
-        if self.config.has_option(section, name):
-            value = self.config.get(section, name)
-        return value
+        return self.get_plan(section).get(name)
+
+    def has_filter(self, section: str) -> bool:
+        return self.get_plan(section).filter is not None
 
-    def is_filtered(self, section: str, topic: str, payload: t.AnyStr) -> bool:
-        if self.config.has_option(section, "filter"):
+    def is_filtered(self, section: str, topic: str, payload: t.Union[str, bytes]) -> bool:
+        function = self.get_plan(section).filter
+        if function is not None:
             try:
                 assert self.invoker
-                name = sanitize_function_name(self.config.get(section, "filter"))
-                return self.invoker.filter(name, topic, payload, section)
+                return self.invoker.filter(function, topic, payload, section)
             except Exception as e:
-                logger.exception("Cannot invoke filter function '%s' defined in '%s': %s" % (name, section, e))
+                logger.exception("Cannot invoke filter function '%s' defined in '%s': %s" % (function, section, e))
         return False
 
     def get_topic_data(self, section: str, data: TdataType) -> t.Optional[TdataType]:
-        if self.config.has_option(section, "datamap"):
+        function = self.get_plan(section).datamap
+        if function is not None:
             try:
                 assert self.invoker
-                name = sanitize_function_name(self.config.get(section, "datamap"))
-                return self.invoker.datamap(name, data)
+                return self.invoker.datamap(function, data)
             except Exception as e:
-                logger.exception("Cannot invoke datamap function '%s' defined in '%s': %s" % (name, section, e))
+                logger.exception("Cannot invoke datamap function '%s' defined in '%s': %s" % (function, section, e))
         return None
 
     def get_all_data(self, section: str, topic: str, data: TdataType) -> t.Optional[TdataType]:
-        if self.config.has_option(section, "alldata"):
+        function = self.get_plan(section).alldata
+        if function is not None:
             try:
                 assert self.invoker
-                name = sanitize_function_name(self.config.get(section, "alldata"))
-                return self.invoker.alldata(name, topic, data)
+                return self.invoker.alldata(function, topic, data)
             except Exception as e:
-                logger.exception("Cannot invoke alldata function '%s' defined in '%s': %s" % (name, section, e))
+                logger.exception("Cannot invoke alldata function '%s' defined in '%s': %s" % (function, section, e))
         return None
 
     def get_topic_targets(self, section: str, topic: str, data: TdataType) -> TopicTargetType:
         """
         Topic targets function invoker.
         """
-        if self.config.has_option(section, "targets"):
+        name = self.get_plan(section).targets_function
+        if name is not None:
             try:
                 assert self.invoker
-                name = sanitize_function_name(self.config.get(section, "targets"))
                 return self.invoker.topic_target_list(name, topic, data)
             except Exception as ex:
                 error = repr(ex)
@@ -117,10 +192,10 @@ class RuntimeContext:
         return None
 
     def get_service_config(self, service: str) -> t.Dict[str, t.Any]:
-        config = self.config.config("config:" + service)
-        if config is None:
-            return {}
-        return dict(config)
+        plan = self.get_service_plan(service)
+        if not plan.exists:
+            raise KeyError(f"Configuration section does not exist: config:{service}")
+        return dict(plan.config)
 
     def get_service_targets(self, service: str) -> t.List[TopicTargetType]:
         """
@@ -128,7 +203,7 @@ class RuntimeContext:
 
         2021-10-18 [amo]: Be more graceful with jobs w/o any target address information.
         """
-        targets: t.List[TopicTargetType] = self.config.getdict("config:" + service, "targets")
+        targets: t.List[TopicTargetType] = self.get_service_plan(service).targets  # ty: ignore[invalid-assignment]
 
         # TODO: The target address descriptor may be of any type these days,
         #       and not necessarily a list.
@@ -148,7 +223,16 @@ class FunctionInvoker:
     config: Config = attr.ib()
     srv: t.Optional[Service] = attr.ib()
 
-    def datamap(self, name: str, data: TdataType) -> TdataType:
+    def load(self, name: t.Union[str, UserFunction]) -> t.Callable:
+        """
+        Resolve function "name", either by a reference compiled beforehand,
+        or by looking it up from the "functions" Python module.
+        """
+        if isinstance(name, UserFunction):
+            return name.resolve()
+        return load_function(name=name, py_mod=self.config.functions)
+
+    def datamap(self, name: t.Union[str, UserFunction], data: TdataType) -> TdataType:
         """
         Invoke function "name" loaded from the "functions" Python module.
 
@@ -158,7 +242,7 @@ class FunctionInvoker:
         """
 
         try:
-            func = load_function(name=name, py_mod=self.config.functions)
+            func = self.load(name)
             try:
                 val = func(data, self.srv)  # new version
             except TypeError:
@@ -168,7 +252,7 @@ class FunctionInvoker:
 
         return val
 
-    def alldata(self, name: str, topic: str, data: TdataType) -> TdataType:
+    def alldata(self, name: t.Union[str, UserFunction], topic: str, data: TdataType) -> TdataType:
         """
         Invoke function "name" loaded from the "functions" Python module.
 
@@ -180,14 +264,14 @@ class FunctionInvoker:
 
         val = None
         try:
-            func = load_function(name=name, py_mod=self.config.functions)
+            func = self.load(name)
             val = func(topic, data, self.srv)
         except:
             raise
 
         return val
 
-    def topic_target_list(self, name: str, topic: str, data: TdataType) -> TopicTargetType:
+    def topic_target_list(self, name: t.Union[str, UserFunction], topic: str, data: TdataType) -> TopicTargetType:
         """
         Invoke function "name" loaded from the "functions" Python module.
         Computes dynamic topic subscription targets.
@@ -201,14 +285,20 @@ class FunctionInvoker:
 
         val = None
         try:
-            func = load_function(name=name, py_mod=self.config.functions)
+            func = self.load(name)
             val = func(topic=topic, data=data, srv=self.srv)
         except:
             raise
 
         return val
 
-    def filter(self, name: str, topic: str, payload: t.AnyStr, section: t.Optional[str] = None) -> bool:  # noqa:A003
+    def filter(  # noqa:A003
+        self,
+        name: t.Union[str, UserFunction],
+        topic: str,
+        payload: t.Union[str, bytes],
+        section: t.Optional[str] = None,
+    ) -> bool:
         """
         Invoke function "name" loaded from the "functions" Python module.
         Return whether the outbound notification should be suppressed.
@@ -231,7 +321,7 @@ class FunctionInvoker:
 
         rc = False
         try:
-            func = load_function(name=name, py_mod=self.config.functions)
+            func = self.load(name)
             try:
                 rc = func(topic, payload_decoded, section, self.srv)  # new version
             except TypeError:
@@ -7,6 +7,8 @@ try:
 except ImportError:
     from importlib_resources import files as resource_files  # ty: ignore[unresolved-import]
 
+import asyncio
+import inspect
 import logging
 import os
 import socket
@@ -14,8 +16,7 @@ import sys
 import threading
 import time
 import typing as t
-from builtins import chr, str
-from datetime import datetime, timezone
+from builtins import str
 from queue import Queue
 
 import paho.mqtt.client as paho
@@ -25,16 +26,27 @@ from paho.mqtt.client import MQTTMessage
 import mqttwarn.configuration
 from mqttwarn.context import FunctionInvoker, RuntimeContext
 from mqttwarn.cron import PeriodicThread
-from mqttwarn.model import Job, Service, StatusInformation, Struct, TdataType
+from mqttwarn.eventloop import CoroutineRunner, EventLoopThread, MqttEventLoopDriver
+from mqttwarn.execution import Batcher, DeadlineMonitor, ServiceExecutor, ServiceOverloaded, ServiceQueue
+from mqttwarn.plan import SectionPlan, Template, compile_template
+from mqttwarn.processes import ProcessPool
+from mqttwarn.spool import JobSpool
+from mqttwarn.model import (
+    Job,
+    MessageEnvelope,
+    Rendering,
+    Service,
+    StatusInformation,
+    Struct,
+    TdataType,
+    TransformationData,
+)
 from mqttwarn.util import (
-    Formatter,
     asbool,
     load_function,
     load_module_by_name,
     load_module_from_file,
     parse_cron_options,
-    sanitize_function_name,
-    timeout,
     truncate,
 )
 from mqttwarn.topic import TopicTimeout
@@ -60,6 +72,10 @@ logger = logging.getLogger(__name__)
 # Name of calling program
 SCRIPTNAME = "mqttwarn"
 
+# Runtime for driving the MQTT client, one of `RUNTIMES`
+RUNTIMES = ["threads", "asyncio"]
+runtime = "threads"
+
 # Global runtime context object
 context: RuntimeContext
 context = None  # ty: ignore[invalid-assignment]
@@ -76,6 +92,15 @@ mqttc = None  # ty: ignore[invalid-assignment]
 q_in: Queue = Queue(maxsize=0)
 exit_flag = False
 
+# Queue of inbound messages, and routing workers operating on it, when enabled.
+# It is unbounded, so that the network loop never blocks. `queue_max_jobs` bounds the jobs after routing.
+ingest_queue: Queue = Queue(maxsize=0)
+routers: t.List[threading.Thread] = []
+
+# Pool of routing processes, and the function receiving the jobs they produce, when enabled
+routing_pool: t.Optional[ProcessPool] = None
+job_sink: t.Optional[t.Callable[[Job], None]] = None
+
 # Instances of PeriodicThread objects
 ptlist: t.Dict[str, PeriodicThread] = {}
 
@@ -85,8 +110,25 @@ topic_timeout_list: t.Dict[str, TopicTimeout] = {}
 # Instances of loaded service plugins
 service_plugins: t.Dict[str, t.Dict[str, t.Any]] = dict()
 
+# Job queues and workers per service, worker pools invoking service
+# plugins, and the monitor watching their deadlines
+service_queues: t.Dict[str, ServiceQueue] = dict()
+service_executors: t.Dict[str, ServiceExecutor] = dict()
+
+# Batches of jobs per service and target, for plugins implementing `plugin_batch`
+service_batchers: t.Dict[t.Tuple[str, str], Batcher] = dict()
+deadline_monitor: t.Optional[DeadlineMonitor] = None
+
+# Event loop invoking coroutine plugins, and their runners per service
+event_loop: t.Optional[EventLoopThread] = None
+service_runners: t.Dict[str, CoroutineRunner] = dict()
+
+# Durable spool of jobs, when configured
+spool: t.Optional[JobSpool] = None
+executor_lock = threading.Lock()
+
 
-def make_service(name: str, mqttc: t.Optional[paho.Client] = None) -> Service:
+def make_service(name: str, mqttc: t.Optional[paho.Client] = None, state: t.Any = None) -> Service:
     """
     Service object factory.
     Prepare service object for plugin.
@@ -94,14 +136,390 @@ def make_service(name: str, mqttc: t.Optional[paho.Client] = None) -> Service:
 
     :param mqttc: Instance of PAHO MQTT client object.
     :param name:  Name used for obtaining a logger instance.
+    :param state: State of the service plugin, returned by its `setup` hook.
     :return:      Service object ready for being passed to plugin instance.
     """
     name = name or "unknown"
     logger = logging.getLogger(name)
-    service = Service(mqttc=mqttc, logger=logger, mwcore=globals(), program=SCRIPTNAME)
+    service = Service(
+        mqttc=mqttc, logger=logger, mwcore=globals(), program=SCRIPTNAME, state=state, durable=spool is not None
+    )
     return service
 
 
+def get_plugin_service(service: str) -> Service:
+    """
+    Return the service object for invoking the plugin of a service.
+
+    It is created once per loaded service, and shared by all invocations of its plugin,
+    while the context of each job travels on the item.
+    """
+    plugin = service_plugins.get(service)
+    if plugin is None:
+        return make_service(mqttc=mqttc, name=get_service_logger_name(service))
+    srv = plugin.get("srv")
+    if srv is None:
+        name = get_service_logger_name(service)
+        srv = plugin["srv"] = make_service(mqttc=mqttc, name=name, state=plugin.get("state"))
+    return srv
+
+
+def setup_service(service: str):
+    """
+    Invoke the `setup(srv, config)` hook of a service plugin, and keep its outcome as state of the service.
+    """
+    plugin = service_plugins[service]
+    srv = get_plugin_service(service)
+    plugin["state"] = srv.state = None
+    setup = getattr(plugin.get("module"), "setup", None)
+    if setup is None:
+        return
+    try:
+        plugin["state"] = srv.state = setup(srv, plugin.get("config") or {})
+        logger.debug(f"Set up service `{service}'")
+    except Exception:
+        logger.exception(f"Setting up service failed. service={service}")
+
+
+def teardown_service(service: str):
+    """
+    Invoke the `teardown(srv)` hook of a service plugin, when it has been set up.
+    """
+    plugin = service_plugins.get(service, {})
+    if "state" not in plugin:
+        return
+    teardown = getattr(plugin.get("module"), "teardown", None)
+    try:
+        if teardown is not None:
+            teardown(get_plugin_service(service))
+            logger.debug(f"Tore down service `{service}'")
+    except Exception:
+        logger.exception(f"Tearing down service failed. service={service}")
+    finally:
+        del plugin["state"]
+        if "srv" in plugin:
+            plugin["srv"].state = None
+
+
+def teardown_services():
+    """
+    Invoke the `teardown` hooks of all service plugins.
+    """
+    for service in list(service_plugins):
+        teardown_service(service)
+
+
+def get_service_health() -> t.Dict[str, t.Any]:
+    """
+    Invoke the `health(srv)` hooks of all service plugins implementing it, and report their outcomes.
+
+    Hooks failing with an exception are reported as `False`.
+    """
+    health: t.Dict[str, t.Any] = {}
+    for service, plugin in list(service_plugins.items()):
+        check = getattr(plugin.get("module"), "health", None)
+        if check is None:
+            continue
+        try:
+            health[service] = check(get_plugin_service(service))
+        except Exception:
+            logger.exception(f"Checking health of service failed. service={service}")
+            health[service] = False
+    return health
+
+
+def get_service_workers(service: str) -> int:
+    """
+    Return the number of workers of a service, defaulting to `num_workers`.
+    """
+    workers = context.get_service_plan(service).workers
+    if workers is None:
+        workers = cf.num_workers
+    return workers
+
+
+def get_service_queue(service: str) -> ServiceQueue:
+    """
+    Return the job queue of a service, creating it and its workers on first use.
+    """
+    queue = service_queues.get(service)
+    if queue is None:
+        with executor_lock:
+            queue = service_queues.get(service)
+            if queue is None:
+                plan = context.get_service_plan(service)
+                workers = get_service_workers(service)
+                logger.info(f"Starting {workers} worker threads for service `{service}'")
+
+                # Options of the service take precedence over the `[defaults]` section.
+                def option(value, default):
+                    return default if value is None else value
+
+                queue = service_queues[service] = ServiceQueue(
+                    name=service,
+                    handler=handle_job,
+                    workers=workers,
+                    aging=float(cf.priority_aging),
+                    max_jobs=int(option(plan.queue_max_jobs, cf.queue_max_jobs)),
+                    max_bytes=int(option(plan.queue_max_bytes, cf.queue_max_bytes)),
+                    overflow=option(plan.queue_overflow, cf.queue_overflow),
+                    drop_below=option(plan.queue_drop_below, cf.queue_drop_below),
+                    on_drop=acknowledge_job,
+                    shard=get_shard_function(plan.shard_key),
+                )
+    return queue
+
+
+def get_shard_function(shard_key):
+    """
+    Return a function computing the shard key of a job, for the `shard_key` option of a service.
+    """
+    if shard_key is None:
+        return None
+    if shard_key == "topic":
+        return lambda job: job.topic
+    if shard_key == "section":
+        return lambda job: job.section
+    field = shard_key[len("data:") :]
+    return lambda job: str((job.data or {}).get(field))
+
+
+def get_service_batcher(service: str, target: str) -> Batcher:
+    """
+    Return the batcher accumulating jobs for a service and target, creating it on first use.
+    """
+    key = (service, target)
+    batcher = service_batchers.get(key)
+    if batcher is None:
+        with executor_lock:
+            batcher = service_batchers.get(key)
+            if batcher is None:
+                plan = context.get_service_plan(service)
+                batcher = service_batchers[key] = Batcher(
+                    name=f"{service}:{target}",
+                    flush=lambda entries: deliver_batch(service, entries),
+                    size=plan.batch_size,
+                    linger=plan.batch_linger,
+                )
+    return batcher
+
+
+def uses_batches(service: str, target: str) -> bool:
+    """
+    Whether jobs for a service and target are accumulated into batches.
+
+    This is the case when the plugin implements `plugin_batch`, and the `batch`
+    option of the service is enabled, or lists the target. When the option is
+    not set, the plugin's `batch_default` attribute applies, `True` by default.
+    """
+    module = service_plugins.get(service, {}).get("module")
+    if not hasattr(module, "plugin_batch"):
+        return False
+    batch = context.get_service_plan(service).batch
+    if batch is None:
+        batch = getattr(module, "batch_default", True)
+    if isinstance(batch, (list, tuple)):
+        return target in batch
+    return bool(batch)
+
+
+def deliver_batch(service: str, entries: t.List[t.Tuple[Job, Struct]]) -> t.List[bool]:
+    """
+    Invoke the `plugin_batch` entry point of a service plugin with a batch of items,
+    and acknowledge the corresponding jobs which have been delivered afterwards.
+
+    The plugin returns either a list of outcomes per item, or a single outcome for all of them.
+    """
+    items = [item for _, item in entries]
+    outcomes = [False] * len(items)
+    logger.info("Invoking service plugin for `%s' with batch of %s items" % (service, len(items)))
+    try:
+        module = service_plugins[service]["module"]
+        srv = get_plugin_service(service)
+        result = get_service_executor(service).call(module.plugin_batch, (srv, items))
+        if isinstance(result, (list, tuple)):
+            if len(result) != len(items):
+                raise ValueError(f"Plugin returned {len(result)} outcomes for {len(items)} items")
+            outcomes = [bool(outcome) for outcome in result]
+        else:
+            outcomes = [bool(result)] * len(items)
+    except ServiceOverloaded as ex:
+        logger.error(f"Invoking service rejected. Reason: {ex}. service={service}")
+    except Exception as ex:
+        logger.exception(f"Invoking service failed. Reason: {ex}. service={service}")
+
+    for (job, item), outcome in zip(entries, outcomes):
+        if outcome:
+            acknowledge_job(job)
+        else:
+            logger.warning(f"Notification failed or timed out. service={service}, topic={job.topic}")
+    return outcomes
+
+
+def get_service_logger_name(service: str) -> str:
+    if "." in service:
+        return service
+    return "mqttwarn.services.{}".format(service)
+
+
+def acknowledge_job(job: Job):
+    """
+    Remove a job from the durable spool, after it has been delivered, or rejected permanently.
+
+    Jobs whose delivery failed are kept in the spool, so that they are retried on the next start.
+    """
+    if spool is not None and job.spool_id is not None:
+        try:
+            spool.acknowledge(job.spool_id)
+        except Exception:
+            logger.exception(f"Acknowledging job failed. service={job.service}")
+
+
+def drain_queues(timeout: t.Optional[float] = None) -> bool:
+    """
+    Wait until all jobs have been processed, or `timeout` seconds have passed.
+
+    Return whether all jobs have been processed.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining() -> t.Optional[float]:
+        return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+    with ingest_queue.all_tasks_done:
+        while ingest_queue.unfinished_tasks:
+            if remaining() == 0:
+                return False
+            ingest_queue.all_tasks_done.wait(remaining())
+    if routing_pool is not None and not routing_pool.join(timeout=remaining()):
+        return False
+    with q_in.all_tasks_done:
+        while q_in.unfinished_tasks:
+            if remaining() == 0:
+                return False
+            q_in.all_tasks_done.wait(remaining())
+    for queue in list(service_queues.values()):
+        if not queue.join(timeout=remaining()):
+            return False
+    if event_loop is not None and not event_loop.join_pending(timeout=remaining()):
+        return False
+    return True
+
+
+def get_service_stats() -> t.Dict[str, t.Dict[str, t.Any]]:
+    """
+    Report queue depth, worker utilization, and plugin invocation outcomes per service.
+    """
+    stats: t.Dict[str, t.Dict[str, t.Any]] = {}
+    for service, queue in list(service_queues.items()):
+        stats[service] = queue.stats()
+    for service, executor in list(service_executors.items()):
+        stats.setdefault(service, {})["plugin"] = executor.stats()
+    for service, runner in list(service_runners.items()):
+        stats.setdefault(service, {})["plugin"] = runner.stats()
+    for (service, target), batcher in list(service_batchers.items()):
+        stats.setdefault(service, {}).setdefault("batch", {})[target] = batcher.stats()
+    return stats
+
+
+def get_service_executor(service: str) -> ServiceExecutor:
+    """
+    Return the worker pool for invoking the plugin of a service, creating it on first use.
+    """
+    global deadline_monitor
+    executor = service_executors.get(service)
+    if executor is None:
+        with executor_lock:
+            executor = service_executors.get(service)
+            if executor is None:
+                if deadline_monitor is None:
+                    deadline_monitor = DeadlineMonitor()
+                    deadline_monitor.start()
+                plan = context.get_service_plan(service)
+                executor = service_executors[service] = ServiceExecutor(
+                    name=service,
+                    monitor=deadline_monitor,
+                    workers=get_service_workers(service),
+                    timeout=plan.plugin_timeout,
+                    max_hung=plan.plugin_max_hung,
+                )
+    return executor
+
+
+def get_service_runner(service: str) -> CoroutineRunner:
+    """
+    Return the runner for invoking the coroutine plugin of a service, creating it, and the event loop, on first use.
+    """
+    global event_loop
+    runner = service_runners.get(service)
+    if runner is None:
+        with executor_lock:
+            runner = service_runners.get(service)
+            if runner is None:
+                if event_loop is None:
+                    event_loop = EventLoopThread()
+                    event_loop.start()
+                plan = context.get_service_plan(service)
+                runner = service_runners[service] = CoroutineRunner(
+                    name=service,
+                    loop=event_loop,
+                    concurrency=plan.plugin_max_concurrency,
+                    timeout=plan.plugin_timeout,
+                )
+    return runner
+
+
+def invoke_coroutine_plugin(job: Job, plugin: t.Callable, srv: Service, item: Struct):
+    """
+    Invoke a service plugin implemented as coroutine function on the event loop,
+    and acknowledge the job when it has been delivered, without waiting for it.
+    """
+    service = job.service
+
+    def done(notified, exception):
+        if exception is not None and not isinstance(exception, asyncio.TimeoutError):
+            logger.error(
+                f"Invoking service failed. Reason: {exception}. service={service}, topic={job.topic}",
+                exc_info=exception,
+            )
+        if notified:
+            acknowledge_job(job)
+        else:
+            logger.warning(f"Notification failed or timed out. service={service}, topic={job.topic}")
+
+    get_service_runner(service).submit(plugin, (srv, item), on_done=done)
+
+
+def shutdown_service_executors():
+    """
+    Flush pending batches, and stop the job queue workers, and the worker pools of all services.
+    """
+    with executor_lock:
+        batchers = list(service_batchers.values())
+        service_batchers.clear()
+    for batcher in batchers:
+        batcher.close()
+    with executor_lock:
+        for queue in service_queues.values():
+            queue.shutdown()
+        service_queues.clear()
+        for executor in service_executors.values():
+            executor.shutdown()
+        service_executors.clear()
+        stop_event_loop()
+
+
+def stop_event_loop():
+    """
+    Stop the event loop invoking coroutine plugins, cancelling the calls still running.
+    """
+    global event_loop
+    if event_loop is not None:
+        event_loop.stop()
+        event_loop = None
+    service_runners.clear()
+
+
 def render_template(filename: str, data: TdataType) -> t.Optional[str]:
     text = None
     if HAVE_JINJA is True:
@@ -184,7 +602,16 @@ def on_disconnect(mosq: MqttClient, userdata: t.Dict[str, str], result_code: int
     if result_code == 0:
         logger.info("Clean disconnection from broker")
     else:
-        send_failover("brokerdisconnected", b"Broker connection lost. Will attempt to reconnect in 5s")
+        message = b"Broker connection lost. Will attempt to reconnect in 5s"
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        # When the MQTT client is driven by an event loop, don't block it. Its driver waits before reconnecting.
+        if loop is not None:
+            loop.run_in_executor(None, send_failover, "brokerdisconnected", message)
+            return
+        send_failover("brokerdisconnected", message)
         # TODO: Review this.
         time.sleep(5)
 
@@ -195,6 +622,13 @@ def on_message(mosq: MqttClient, userdata: t.Optional[t.Dict[str, str]], msg: MQ
     """
     userdata = userdata or {}
     try:
+        # When routing workers are running, only copy the message into an envelope,
+        # and hand it over to them, so that the network loop does not block.
+        if routers:
+            ingest_queue.put(
+                MessageEnvelope(topic=msg.topic, payload=msg.payload, qos=msg.qos, retain=bool(msg.retain))
+            )
+            return
         return on_message_handler(mosq, userdata, msg)
     except:
         logger.exception("Receiving and decoding MQTT message failed")
@@ -204,12 +638,22 @@ def on_message_handler(mosq: MqttClient, userdata: t.Dict[str, str], msg: MQTTMe
     """
     Message received from the broker
     """
+    envelope = MessageEnvelope(topic=msg.topic, payload=msg.payload, qos=msg.qos, retain=bool(msg.retain))
+    return route_message(envelope)
+
+
+def route_message(envelope: MessageEnvelope):
+    """
+    Dispatch an inbound message to the targets of all matching sections.
+
+    The message is decoded at most once, and shared by all matching sections.
+    """
 
-    topic = msg.topic
-    payload = msg.payload
+    topic = envelope.topic
+    payload = envelope.payload
     logger.debug(f"Message received on {topic}: {truncate(payload)}")
 
-    if msg.retain == 1:
+    if envelope.retain:
         if cf.skipretained:
             logger.debug("Skipping retained message on %s" % topic)
             return
@@ -222,21 +666,35 @@ def on_message_handler(mosq: MqttClient, userdata: t.Dict[str, str], msg: MQTTMe
             if topic_timeout_list[match_topic].notify_only_on_timeout:
                 return
 
-    # Try to find matching settings for this topic
-    for section in context.get_sections():
-        # Get the topic for this section (usually the section name but optionally overridden)
-        match_topic = context.get_topic(section)
-        if paho.topic_matches_sub(match_topic, topic):
-            logger.debug("Section [%s] matches message on %s, processing it" % (section, topic))
-            # Check for any message filters
-            if context.is_filtered(section, topic, payload):
-                logger.log(
-                    cf.filteredmessagesloglevelnumber,
-                    "Filter in section [%s] has skipped message on %s" % (section, topic),
-                )
-                continue
-            # Send the message to any targets specified
-            send_to_targets(section, topic, payload)
+    # When routing processes are running, hand the raw message over to one of them, by
+    # its topic, so that messages on the same topic are routed in order. When all of
+    # them have exited, and could not be replaced, route messages here.
+    if routing_pool is not None and routing_pool.is_alive():
+        routing_pool.submit((topic, payload, envelope.qos, envelope.retain), key=topic)
+        return
+
+    route_sections(envelope)
+
+
+def route_sections(envelope: MessageEnvelope):
+    """
+    Dispatch an inbound message to the targets of the sections matching its topic.
+    """
+    topic = envelope.topic
+    payload = envelope.payload
+
+    # Find the sections matching this topic, using the subscription index
+    for section in context.get_matching_sections(topic):
+        logger.debug("Section [%s] matches message on %s, processing it" % (section, topic))
+        # Check for any message filters
+        if context.has_filter(section) and context.is_filtered(section, topic, envelope.text):
+            logger.log(
+                cf.filteredmessagesloglevelnumber,
+                "Filter in section [%s] has skipped message on %s" % (section, topic),
+            )
+            continue
+        # Send the message to any targets specified
+        send_to_targets(section, topic, payload, envelope=envelope)
 
 
 # End of MQTT broker callbacks
@@ -249,28 +707,28 @@ def send_failover(reason: str, message: t.AnyStr):
     send_to_targets("failover", reason, message)
 
 
-def send_to_targets(section: str, topic: str, payload: t.AnyStr):
+def send_to_targets(
+    section: str, topic: str, payload: t.Union[str, bytes], envelope: t.Optional[MessageEnvelope] = None
+):
     if cf.has_section(section) is False:
         logger.warning(
             "Section [%s] does not exist in your INI file, skipping message on topic '%s'" % (section, topic)
         )
         return
 
+    if envelope is None:
+        envelope = MessageEnvelope(topic=topic, payload=payload)
+
     # decode raw payload into transformation data
-    data = decode_payload(section, topic, payload)
+    data = decode_payload(section, topic, payload, envelope=envelope)
 
-    # Probe if it's a function name.
-    function_name = None
-    try:
-        function_name = sanitize_function_name(context.get_config(section, "targets"))
-    except:
-        pass
-    dispatcher_dict = cf.getdict(section, "targets")
+    plan = context.get_plan(section)
 
     targetlist: t.List[str]
 
     # `targets` is a function symbol.
-    if function_name is not None:
+    if plan.targets_function is not None:
+        function_name = plan.targets_function.name
         targetlist = t.cast(t.List[str], context.get_topic_targets(section, topic, data))
 
         # Make sure the function returned a target _list_ of elements.
@@ -284,37 +742,20 @@ def send_to_targets(section: str, topic: str, payload: t.AnyStr):
             return
 
     # `targets` is a dictionary.
-    elif isinstance(dispatcher_dict, dict) and dispatcher_dict:
-
-        def get_key(item):
-            # precede a key with the number of topic levels and then use reverse alphabetic sort order
-            # '+' is after '#' in ascii table
-            # caveat: for instance space is allowed in topic name but will be less specific than '+', '#'
-            # so replace '#' with first ascii character and '+' with second ascii character
-            # http://public.dhe.ibm.com/software/dw/webservices/ws-mqtt/mqtt-v3r1.html#appendix-a
-
-            # item[0] represents topic. replace wildcard characters to ensure the right order
-            modified_topic = item[0].replace("#", chr(0x01)).replace("+", chr(0x02))
-            levels = len(item[0].split("/"))
-            # concatenate levels with leading zeros and modified topic and return as a key
-            return "{:03d}{}".format(levels, modified_topic)
-
-        # produce a sorted list of topic/targets with longest and more specific first
-        sorted_dispatcher = sorted(list(dispatcher_dict.items()), key=get_key, reverse=True)
-        for match_topic, targets in sorted_dispatcher:
-            if paho.topic_matches_sub(match_topic, topic):
-                # hocus pocus, let targets become a list
-                targetlist = t.cast(t.List[str], targets if isinstance(targets, list) else [targets])
-                logger.debug("Most specific match %s dispatched to %s" % (match_topic, targets))
-                # first most specific topic matches then stops processing
-                break
-        else:
+    elif plan.targets_dispatcher is not None:
+        # the first, most specific topic matches
+        match = plan.targets_dispatcher.match(topic)
+        if match is None:
             # Not found then no action. This could be configured intentionally.
             logger.debug("Dispatcher definition does not contain matching topic/target pair in section [%s]" % section)
             return
+        match_topic, targets = match
+        # hocus pocus, let targets become a list
+        targetlist = t.cast(t.List[str], targets if isinstance(targets, list) else [targets])
+        logger.debug("Most specific match %s dispatched to %s" % (match_topic, targets))
 
     else:
-        targetlist = t.cast(t.List[str], cf.getlist(section, "targets"))
+        targetlist = t.cast(t.List[str], plan.targets_list)
 
         # Make sure targets are actually a _list_ of elements.
         # TODO: Not tested yet. How can this code be reached?
@@ -330,7 +771,7 @@ def send_to_targets(section: str, topic: str, payload: t.AnyStr):
     targetlist_resolved = []
     for target in targetlist:
         try:
-            target = target.format(**data)
+            target = target.format_map(data)
             targetlist_resolved.append(target)
         except Exception as ex:
             error = repr(ex)
@@ -341,6 +782,9 @@ def send_to_targets(section: str, topic: str, payload: t.AnyStr):
             )
     targetlist = targetlist_resolved
 
+    # All jobs dispatched from this section share the rendered outbound message fields.
+    rendering = Rendering()
+
     for item in targetlist:
         logger.debug("Message on %s going to %s" % (topic, item))
         # Each target is either "service" or "service:target"
@@ -361,13 +805,17 @@ def send_to_targets(section: str, topic: str, payload: t.AnyStr):
             logger.error("Invalid configuration: Topic '%s' points to non-existing service '%s'" % (topic, service))
             continue
 
-        service_config = context.get_service_config(service)
         payload_out: t.Union[str, bytes]
-        if asbool(service_config.get("decode_utf8", True)) and isinstance(payload, bytes):
-            payload_out = payload.decode("utf-8")
+        if context.get_service_plan(service).decode_utf8 and isinstance(payload, bytes):
+            payload_out = envelope.text
+            if isinstance(payload_out, bytes):
+                # Decoding failed beforehand, so let it fail loudly again.
+                payload_out = payload.decode("utf-8")
         else:
             payload_out = payload
 
+        priority = context.get_job_priority(section, service)
+
         sendtos = None
         if target is None:
             sendtos = context.get_service_targets(service)
@@ -376,34 +824,61 @@ def send_to_targets(section: str, topic: str, payload: t.AnyStr):
 
         for sendto in sendtos:
             logger.debug("New `%s:%s' job: %s" % (service, sendto, topic))
-            job = Job(1, service, section, topic, payload_out, data, sendto)
-            q_in.put(job)
+            job = Job(priority, service, section, topic, payload_out, data, sendto, rendering=rendering)
+            submit_job(job)
 
 
-def builtin_transform_data(topic: str, payload: t.Union[str, bytes]) -> TdataType:
-    """Return a dict with initial transformation data which is made
-    available to all plugins"""
+def submit_job(job: Job):
+    """
+    Spool a job, when configured, and submit it to the inbound job queue.
+
+    Within a routing process, the job is handed over to the `job_sink` instead.
+    """
+    if job_sink is not None:
+        job_sink(job)
+        return
+    if spool is not None:
+        job.spool_id = spool.append(job)
+    enqueue_job(job)
+
 
-    tdata: TdataType = {}
-    dt = datetime.now()
+def enqueue_job(job: Job):
+    """
+    Submit a job to the inbound job queue, to be dispatched to the job queue of its service.
+
+    Jobs of sharded services are submitted to the job queue of their service right
+    away, so that concurrent dispatchers do not reorder them.
+    """
+    try:
+        sharded = context.get_service_plan(job.service).shard_key is not None
+    except Exception:
+        sharded = False
+    if sharded:
+        get_service_queue(job.service).put(job)
+    else:
+        q_in.put(job)
 
-    tdata["topic"] = topic
-    tdata["payload"] = payload
-    tdata["_dtepoch"] = int(time.time())  # 1392628581
-    tdata["_dtiso"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")  # 2014-02-17T10:38:43.910691Z
-    tdata["_ltiso"] = datetime.now().isoformat()  # local time in iso format
-    tdata["_dthhmm"] = dt.strftime("%H:%M")  # 10:16
-    tdata["_dthhmmss"] = dt.strftime("%H:%M:%S")  # hhmmss=10:16:21
 
-    return tdata
+def builtin_transform_data(topic: str, payload: t.Union[str, bytes]) -> TdataType:
+    """Return a dict with initial transformation data which is made
+    available to all plugins. The timestamp fields `_dtepoch`, `_dtiso`,
+    `_ltiso`, `_dthhmm` and `_dthhmmss` are computed on demand."""
+
+    tdata = TransformationData(topic=topic, payload=payload)
+    return tdata.defer_timestamps(time.time())
 
 
-def xform(function: str, orig_value: t.Any, transform_data: TdataType) -> t.Union[TdataType, str, None]:
+def xform(
+    function: t.Union[Template, str, None], orig_value: t.Any, transform_data: TdataType
+) -> t.Union[TdataType, str, None]:
     """
     Attempt transformation on orig_value.
 
     - 1st. function()
     - 2nd. inline {xxxx}
+
+    `function` is a template compiled beforehand, see `SectionPlan`, or
+    an option value, which will get compiled on the fly.
     """
 
     if orig_value is None:
@@ -412,19 +887,19 @@ def xform(function: str, orig_value: t.Any, transform_data: TdataType) -> t.Unio
     res = orig_value
 
     if function is not None:
-        try:
-            function_name = sanitize_function_name(function)
+        if not isinstance(function, Template):
+            function = compile_template(context.config, function)
+
+        if function.function is not None:
             try:
                 assert context.invoker
-                res = context.invoker.datamap(function_name, transform_data)
+                res = context.invoker.datamap(function.function, transform_data)
                 return res
             except:
                 logger.exception(f"Invoking function failed: {function}")
-        except:
-            pass
 
         try:
-            res = Formatter().format(function, **transform_data)
+            res = function.format.format(transform_data)
         except:
             logger.exception(f"Formatting message with function failed: {function}")
 
@@ -434,18 +909,24 @@ def xform(function: str, orig_value: t.Any, transform_data: TdataType) -> t.Unio
     return res
 
 
-def decode_payload(section: str, topic: str, payload: t.Union[str, bytes]) -> TdataType:
+def decode_payload(
+    section: str, topic: str, payload: t.Union[str, bytes], envelope: t.Optional[MessageEnvelope] = None
+) -> TdataType:
     """
     Decode message payload through transformation machinery.
+
+    The decoded payload, the builtin transformation data, and the data decoded
+    from JSON, are obtained from the message envelope, which computes them only
+    once per message. The section-specific data is layered onto a copy of them.
     """
 
-    if isinstance(payload, bytes):
-        try:
-            payload = payload.decode("utf-8")
-        except Exception as ex:
-            logger.debug(f"Decoding from UTF-8 failed: {ex}. payload={truncate(payload)}")
+    if envelope is None:
+        envelope = MessageEnvelope(topic=topic, payload=payload)
 
-    transform_data = builtin_transform_data(topic, payload)
+    if envelope.base_data is None:
+        envelope.base_data = builtin_transform_data(topic, envelope.text)
+
+    transform_data = t.cast(TransformationData, envelope.base_data).copy()
 
     topic_data = context.get_topic_data(section, transform_data)
     if topic_data is not None and isinstance(topic_data, dict):
@@ -465,33 +946,168 @@ def decode_payload(section: str, topic: str, payload: t.Union[str, bytes]) -> Td
     # Gracefully attempt to decode the payload from JSON. If it's possible, add
     # the JSON keys into item to pass to the plugin, and create the outgoing
     # (i.e. transformed) message.
-    try:
-        if isinstance(payload, str):
-            payload = payload.rstrip("\0")
-        payload_data = json.loads(payload)
+    payload_data = envelope.copy_payload_data()
+    if payload_data is not None:
         transform_data.update(payload_data)
-    except Exception as ex:
-        logger.debug(f"Decoding JSON failed: {ex}. payload={truncate(payload)}")
 
     return transform_data
 
 
+def router(worker_id=None):
+    """
+    Queue runner. Pull an inbound message from the ingest queue, and route it.
+    """
+    while True:
+        envelope = ingest_queue.get()
+        try:
+            if envelope is None:
+                break
+            route_message(envelope)
+        except:
+            logger.exception("Receiving and decoding MQTT message failed")
+        finally:
+            ingest_queue.task_done()
+    logger.debug("Routing thread exiting")
+
+
+def route_in_process(message: t.Tuple[str, t.Union[str, bytes], int, bool]) -> t.List[Job]:
+    """
+    Route a raw message within a routing process, and return the jobs dispatched from it.
+
+    The outbound message fields of the jobs are rendered here, so that the user-defined
+    functions and templates are evaluated outside the parent process.
+    """
+    global job_sink
+    topic, payload, qos, retain = message
+    jobs: t.List[Job] = []
+    job_sink = jobs.append
+    try:
+        route_sections(MessageEnvelope(topic=topic, payload=payload, qos=qos, retain=retain))
+    finally:
+        job_sink = None
+    for job in jobs:
+        render_job(job)
+    return jobs
+
+
+def init_routing_process():
+    """
+    Release the resources inherited by a routing process, which are owned by the parent process.
+    """
+    global spool
+    # Writing to the socket of the MQTT client would corrupt the connection of the parent process.
+    if mqttc is not None:
+        sock = mqttc.socket()
+        if sock is not None:
+            sock.close()
+    if spool is not None:
+        spool.release()
+        spool = None
+
+
+def submit_jobs(jobs: t.List[Job]):
+    """
+    Submit the jobs received from a routing process.
+    """
+    for job in jobs:
+        submit_job(job)
+
+
+def start_routing_processes():
+    """
+    Fork the routing processes, when enabled by the `routing_processes` setting.
+    """
+    global routing_pool
+    stop_routing_processes()
+    processes = int(cf.routing_processes)
+    if processes <= 0:
+        return
+    logger.info("Starting %s routing processes" % processes)
+    routing_pool = ProcessPool(
+        name="mqttwarn-routing",
+        handler=route_in_process,
+        deliver=submit_jobs,
+        processes=processes,
+        initializer=init_routing_process,
+    )
+
+
+def stop_routing_processes():
+    """
+    Stop the routing processes, after they routed the messages received so far.
+    """
+    global routing_pool
+    if routing_pool is not None:
+        routing_pool.shutdown()
+        routing_pool = None
+
+
+def start_routers():
+    """
+    Launch the routing workers, when enabled by the `routing_workers` setting.
+    """
+    stop_routers()
+    workers = int(cf.routing_workers)
+    # When the MQTT client is driven by an event loop, route messages off the loop,
+    # so that blocking job queues do not stall it.
+    if runtime == "asyncio":
+        workers = max(workers, 1)
+    if workers <= 0:
+        return
+    logger.info("Starting %s routing threads" % workers)
+    for i in range(workers):
+        thread = threading.Thread(target=router, kwargs={"worker_id": i}, name=f"mqttwarn-router-{i}", daemon=True)
+        thread.start()
+        routers.append(thread)
+
+
+def stop_routers():
+    """
+    Stop the routing workers, after they routed the messages received so far.
+    """
+    for _ in routers:
+        ingest_queue.put(None)
+    routers.clear()
+
+
+def handle_job(job: Job, worker_id=None):
+    """
+    Process a job on behalf of the workers of its service, and acknowledge it, when it has been
+    delivered, or rejected permanently.
+    """
+    # Jobs handed over to a batch, or to the event loop, are acknowledged once they have been delivered.
+    if process_job(job=job, worker_id=worker_id):
+        acknowledge_job(job)
+
+
 def processor(worker_id=None):
     """
-    Queue runner. Pull a job from the queue, find the module in charge
-    of handling the service, and invoke the module's plugin to do so.
+    Queue runner. Pull a job from the queue, and dispatch it to the job
+    queue of its service, where the service's own workers will find
+    the module in charge of handling the service, and invoke the
+    module's plugin to do so.
     """
     while not exit_flag:
         logger.debug("Job queue has %s items to process" % q_in.qsize())
         job = q_in.get()
-        if process_job(job=job, worker_id=worker_id):
-            q_in.task_done()
+        try:
+            # Blocks when the job queue of the service is full, and its overflow
+            # policy is `block`, which propagates backpressure to the MQTT ingest.
+            get_service_queue(job.service).put(job)
+        except Exception:
+            logger.exception(f"Dispatching job failed. service={job.service}")
+        q_in.task_done()
     logger.debug("Worker thread exiting")
 
 
 def process_job(job, worker_id=None):
     """
     Process a single job item.
+
+    Return `None` when the job has been accumulated into a batch, or handed over
+    to the event loop, which will deliver it later. Otherwise, return whether it
+    is done with, either delivered, or rejected permanently, as opposed to having
+    failed.
     """
 
     if True:
@@ -526,81 +1142,119 @@ def process_job(job, worker_id=None):
         else:
             addrs = service_targets[target]
 
-        item = {
-            "service": service,
-            "section": section,
-            "target": target,
-            "config": service_config,
-            "addrs": addrs,
-            "topic": topic,
-            "payload": job.payload,
-            "data": None,
-            "title": None,
-            "image": None,
-            "message": None,
-            "priority": None,
-        }
-
-        transform_data = job.data
-        item["data"] = dict(list(transform_data.items()))
-
-        origin_title = "{}: {}".format(SCRIPTNAME, topic)
-        item["title"] = xform(context.get_config(section, "title"), origin_title, transform_data)
-        item["image"] = xform(context.get_config(section, "image"), "", transform_data)
-        item["message"] = xform(context.get_config(section, "format"), job.payload, transform_data)
+        # Render the outbound message fields once per message and section, and share
+        # them across all jobs dispatched from it. Jobs whose input differs, like the
+        # payload being decoded differently per service, get their own rendition.
+        rendered = render_job(job)
 
-        try:
-            item["priority"] = int(
-                xform(context.get_config(section, "priority"), 0, transform_data)  # ty: ignore[invalid-argument-type]
-            )
-        except:
-            item["priority"] = 0
-            logger.exception("Failed to determine the priority, defaulting to zero")
-
-        if HAVE_JINJA is False and context.get_config(section, "template"):
-            logger.warning("Templating not possible because Jinja2 is not installed")
-
-        if HAVE_JINJA is True:
-            template = context.get_config(section, "template")
-            if template is not None:
-                try:
-                    text = render_template(template, transform_data)
-                    if text is not None:
-                        item["message"] = text
-                except:
-                    logger.exception(f"Rendering template failed: {template}")
-
-        msg = item.get("message")
+        msg = rendered.get("message")
         if msg is not None and len(t.cast(str, msg)) > 0:
-            st = Struct(**item)
+            # Jobs get a shallow copy of the transformation data, which keeps
+            # the builtin timestamp fields lazy, and can be modified by plugins.
+            st = Struct(
+                service=service,
+                section=section,
+                target=target,
+                config=service_config,
+                addrs=addrs,
+                topic=topic,
+                payload=job.payload,
+                data=job.data.copy(),
+                **rendered,
+            )
+
+            # Accumulate jobs for service plugins implementing the batch entry point.
+            module = service_plugins.get(service, {}).get("module")
+            if uses_batches(service, target):
+                get_service_batcher(service, target).add((job, st))
+                return None
+
             notified = False
             logger.info("Invoking service plugin for `%s'" % service)
+
+            # Coroutine plugins run on the event loop, and the job is acknowledged when they complete.
+            plugin = getattr(module, "plugin", None)
+            if plugin is not None and inspect.iscoroutinefunction(plugin):
+                srv = get_plugin_service(service)
+                invoke_coroutine_plugin(job, plugin, srv, st)
+                return None
+
             try:
-                # Fire the plugin in a separate thread and kill it if it doesn't return in 10s
+                # Fire the plugin on the service's worker pool, and give up waiting when it
+                # doesn't return within `plugin_timeout` seconds, 10 by default.
                 module = service_plugins[service]["module"]
-                if "." in service:
-                    service_logger_name = service
-                else:
-                    service_logger_name = "mqttwarn.services.{}".format(service)
-                srv = make_service(mqttc=mqttc, name=service_logger_name)
-                notified = timeout(module.plugin, (srv, st))
+                srv = get_plugin_service(service)
+                notified = get_service_executor(service).call(module.plugin, (srv, st))
+            except ServiceOverloaded as ex:
+                logger.error(f"Invoking service rejected. Reason: {ex}. service={service}, topic={topic}")
             except Exception as ex:
                 logger.exception(f"Invoking service failed. Reason: {ex}. service={service}, topic={topic}")
 
             if not notified:
                 logger.warning(f"Notification failed or timed out. service={service}, topic={topic}")
+                return False
         else:
             logger.info(f"Notification suppressed. Reason: Payload is empty. service={service}, topic={topic}")
 
         return True
 
 
+def render_job(job: Job) -> t.Dict[str, t.Any]:
+    """
+    Return the outbound message fields of a job.
+
+    They are rendered once per message and section, and shared across all jobs
+    dispatched from it. Jobs whose input differs, like the payload being decoded
+    differently per service, get their own rendition.
+    """
+    if job.rendering is None:
+        job.rendering = Rendering()
+    return job.rendering.get(
+        job.payload, lambda: render_message(context.get_plan(job.section), job.topic, job.payload, job.data)
+    )
+
+
+def render_message(plan: SectionPlan, topic: str, payload: t.Any, transform_data: TdataType) -> t.Dict[str, t.Any]:
+    """
+    Render the outbound message fields `title`, `image`, `message`, and `priority`.
+    """
+    rendered: t.Dict[str, t.Any] = {}
+
+    origin_title = "{}: {}".format(SCRIPTNAME, topic)
+    rendered["title"] = xform(plan.title, origin_title, transform_data)
+    rendered["image"] = xform(plan.image, "", transform_data)
+    rendered["message"] = xform(plan.format, payload, transform_data)
+
+    try:
+        rendered["priority"] = int(xform(plan.priority, 0, transform_data))  # ty: ignore[invalid-argument-type]
+    except:
+        rendered["priority"] = 0
+        logger.exception("Failed to determine the priority, defaulting to zero")
+
+    if HAVE_JINJA is False and plan.template:
+        logger.warning("Templating not possible because Jinja2 is not installed")
+
+    if HAVE_JINJA is True:
+        template = plan.template
+        if template is not None:
+            try:
+                text = render_template(template, transform_data)
+                if text is not None:
+                    rendered["message"] = text
+            except:
+                logger.exception(f"Rendering template failed: {template}")
+
+    return rendered
+
+
 def load_services(services):
     if services is None:
         logger.warning("No services defined")
         return
 
     for service in services:
+        # Release the resources of a plugin loaded beforehand.
+        teardown_service(service)
         service_plugins[service] = {}
 
         service_config = cf.config("config:" + service)
@@ -656,6 +1310,11 @@ def load_services(services):
             logger.critical(msg)
             raise ImportError(msg)
 
+    # Create the service object of each plugin once, and let plugins prepare
+    # long-lived resources, like connection pools and clients, kept as their state.
+    for service in services:
+        setup_service(service)
+
 
 def connect():
     """
@@ -713,6 +1372,11 @@ def connect():
         raise RuntimeError("Cannot connect to MQTT broker")
     context.invoker.srv.mqttc = mqttc
 
+    # Likewise, update the service objects of the loaded service plugins.
+    for plugin in service_plugins.values():
+        if "srv" in plugin:
+            plugin["srv"].mqttc = mqttc
+
     # Publish status information to `mqttwarn/$SYS` topic.
     publish_status_information()
 
@@ -724,6 +1388,13 @@ def connect():
 
 def subscribe_forever():
     mqttc = connect()
+
+    # Drive the MQTT client from an asyncio event loop on the main thread.
+    if runtime == "asyncio":
+        driver = MqttEventLoopDriver(client=mqttc)
+        asyncio.run(driver.run(stopped=lambda: exit_flag))
+        return
+
     while not exit_flag:
         reconnect_interval = 5
 
@@ -781,13 +1452,28 @@ def publish_status_information():
 
 
 def start_workers():
-    # Launch worker threads to operate on queue
+    # Bound the inbound queue, so that blocking job queues of services will block the MQTT ingest
+    q_in.maxsize = int(cf.queue_max_jobs)
+
+    # Fork processes for routing inbound messages, if enabled. This happens before
+    # starting any other threads, because forking a multithreaded process is unsafe.
+    start_routing_processes()
+
+    # Launch worker threads to operate on queue, dispatching jobs to the job
+    # queues of their services, whose workers are started on demand.
     logger.info("Starting %s worker threads" % cf.num_workers)
     for i in range(cf.num_workers):
         t = threading.Thread(target=processor, kwargs={"worker_id": i})
         t.daemon = True
         t.start()
 
+    # Process jobs left over from the previous run, before routing new messages
+    # and running periodic tasks, so that new jobs do not overtake them.
+    replay_spool()
+
+    # Launch worker threads for routing inbound messages off the network thread, if enabled
+    start_routers()
+
     # If the config file has a [cron] section, the key names therein are
     # functions from 'myfuncs.py' which should be invoked periodically.
     # The key's value (must be numeric!) is the period in seconds.
@@ -828,8 +1514,18 @@ def cleanup(signum=None, frame=None):
     mqttc.loop_stop()
     mqttc.disconnect()
 
+    # When jobs are spooled, don't wait forever, they will be replayed on the next start.
     logger.info("Waiting for queue to drain")
-    q_in.join()
+    if spool is None:
+        drain_queues()
+    elif not drain_queues(timeout=float(cf.shutdown_timeout)):
+        logger.warning(f"Queue did not drain within {cf.shutdown_timeout} seconds, {len(spool)} jobs remain spooled")
+    stop_routers()
+    stop_routing_processes()
+    shutdown_service_executors()
+    teardown_services()
+    if spool is not None:
+        spool.close()
 
     # Send exit signal to subsystems _after_ queue was drained.
     # TODO: Refactor this elsewhere.
@@ -842,13 +1538,50 @@ def cleanup(signum=None, frame=None):
     sys.exit(signum)
 
 
+def open_spool():
+    """
+    Open the durable spool of jobs, when configured by the `spool` setting.
+    """
+    global spool
+    if spool is not None:
+        spool.close()
+        spool = None
+    if cf.spool:
+        logger.info(f"Spooling jobs to {cf.spool}")
+        spool = JobSpool(path=cf.spool, sync=cf.spool_sync)
+
+
+def replay_spool():
+    """
+    Replay jobs from the durable spool, which have not been processed on the previous run.
+    """
+    if spool is None:
+        return
+    jobs = list(spool.replay())
+    if jobs:
+        logger.info(f"Replaying {len(jobs)} jobs from spool")
+    for job in jobs:
+        enqueue_job(job)
+
+
 def bootstrap(config, scriptname=None):
     # FIXME: Remove global variables
-    global context, cf, SCRIPTNAME
+    global context, cf, runtime, SCRIPTNAME
+    if config.runtime not in RUNTIMES:
+        raise ValueError(f"Invalid runtime '{config.runtime}', use one of {', '.join(RUNTIMES)}")
     # NOTE: this is called before we connect to the MQTT broker, so mqttc is not initialised yet
     invoker = FunctionInvoker(config=config, srv=make_service(name="mqttwarn.context"))
     context = RuntimeContext(config=config, invoker=invoker)
+    context.compile()
+    context.build_subscriptions()
     cf = config
+    runtime = config.runtime
+    # Worker pools are configured per service, so start over with a new configuration.
+    stop_routers()
+    stop_routing_processes()
+    shutdown_service_executors()
+    teardown_services()
+    open_spool()
     if scriptname is not None:
         SCRIPTNAME = scriptname
 
@@ -874,25 +1607,24 @@ def run_plugin(config, name: str, options=None, data=None, message=None):
 
     # Load designated service plugins
     load_services([name])
-    if "." in name:
-        service_logger_name = name
-    else:
-        service_logger_name = "mqttwarn.services.{}".format(name)
-    srv = make_service(name=service_logger_name)
+    srv = get_plugin_service(name)
 
     # Build a mimikry item instance for feeding to the service plugin
     item = Struct(**options or {})
     # TODO: Read configuration optionally from data.
-    item.config = config.config("config:" + name)  # ty: ignore[unresolved-attribute]
-    item.service = srv  # ty: ignore[unresolved-attribute]
-    item.target = "mqttwarn"  # ty: ignore[unresolved-attribute]
-    item.data = data or {}  # ty: ignore[unresolved-attribute]
+    item.config = config.config("config:" + name)
+    item.service = srv
+    item.target = "mqttwarn"
+    item.data = data or {}
     if not hasattr(item, "message"):
-        item.message = message  # ty: ignore[invalid-assignment]
+        item.message = message
 
     # Launch plugin
     module = service_plugins[name]["module"]
-    response = module.plugin(srv, item)
+    try:
+        response = module.plugin(srv, item)
+    finally:
+        teardown_service(name)
     logger.info("Plugin response: {}".format(response))
     if response is False:
         sys.exit(1)
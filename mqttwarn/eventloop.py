@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import asyncio
+import concurrent.futures
+import logging
+import socket
+import threading
+import typing as t
+
+import paho.mqtt.client as paho
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopThread(threading.Thread):
+    """
+    An asyncio event loop, running on its own thread.
+
+    Coroutines are submitted from other threads, and their outcome is
+    reported through a `concurrent.futures.Future`.
+    """
+
+    def __init__(self, name: str = "mqttwarn-asyncio"):
+        super().__init__(name=name, daemon=True)
+        self.loop = asyncio.new_event_loop()
+        self._lock = threading.Lock()
+        self._all_done = threading.Condition(self._lock)
+        self._pending = 0
+
+    def run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def submit(self, coroutine: t.Coroutine) -> concurrent.futures.Future:
+        with self._lock:
+            self._pending += 1
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if not self._pending:
+                self._all_done.notify_all()
+
+    def join_pending(self, timeout: t.Optional[float] = None) -> bool:
+        """
+        Wait until all submitted coroutines have completed, or `timeout` seconds have passed.
+
+        Return whether all coroutines have completed.
+        """
+        with self._lock:
+            return self._all_done.wait_for(lambda: not self._pending, timeout)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Cancel the coroutines still running, and stop the event loop.
+        """
+
+        async def cancel():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.is_alive():
+            try:
+                asyncio.run_coroutine_threadsafe(cancel(), self.loop).result(timeout)
+            except Exception:
+                logger.exception("Cancelling coroutines failed")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.join(timeout)
+
+
+class CoroutineRunner:
+    """
+    Invoke coroutine functions of a service plugin on an event loop thread.
+
+    The number of concurrent calls is bounded by `concurrency`. Submitting
+    more calls blocks the submitting thread, until a call has completed.
+    Calls which do not complete within `timeout` seconds are cancelled.
+    """
+
+    def __init__(self, name: str, loop: EventLoopThread, concurrency: int = 100, timeout: float = 10.0):
+        self.name = name
+        self.loop = loop
+        self.concurrency = max(concurrency, 1)
+        self.timeout = timeout
+
+        self.calls = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.in_flight = 0
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    def submit(
+        self,
+        func: t.Callable[..., t.Coroutine],
+        args=(),
+        on_done: t.Optional[t.Callable[[t.Any, t.Optional[BaseException]], None]] = None,
+    ) -> None:
+        """
+        Invoke `func(*args)` on the event loop, and report its outcome to `on_done(result, exception)`.
+        """
+        self._slots.acquire()
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+        try:
+            future = self.loop.submit(asyncio.wait_for(func(*args), self.timeout))
+        except BaseException:
+            self._release()
+            raise
+
+        def done(future: concurrent.futures.Future):
+            result, exception = None, None
+            try:
+                result = future.result()
+            except asyncio.TimeoutError as ex:
+                exception = ex
+                with self._lock:
+                    self.timeouts += 1
+                logger.error(f"Invoking service plugin timed out after {self.timeout} seconds. service={self.name}")
+            except BaseException as ex:
+                exception = ex
+                with self._lock:
+                    self.failures += 1
+            self._release()
+            if on_done is not None:
+                try:
+                    on_done(result, exception)
+                except Exception:
+                    logger.exception(f"Completing service plugin call failed. service={self.name}")
+
+        future.add_done_callback(done)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+            }
+
+
+class MqttEventLoopDriver:
+    """
+    Drive the network loop of a Paho MQTT client from an asyncio event loop,
+    instead of its own thread, using its socket callbacks.
+
+    The socket is read when it becomes readable, and written when the client
+    has data to send. Housekeeping, like keepalive pings, happens each second,
+    and the connection is reestablished each `reconnect_interval` seconds
+    after it has been lost.
+
+    The socket callbacks are also invoked by threads publishing messages, so
+    they are handed over to the event loop thread, which owns the selector.
+    """
+
+    def __init__(self, client: paho.Client, reconnect_interval: float = 5.0):
+        self.client = client
+        self.reconnect_interval = reconnect_interval
+        self.loop: t.Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: t.Optional[int] = None
+
+    def _on_loop(self, func: t.Callable, *args: t.Any) -> None:
+        """
+        Invoke `func(*args)` right away when on the event loop thread, otherwise schedule it on the loop.
+        """
+        if threading.get_ident() == self._thread_id:
+            func(*args)
+            return
+        try:
+            t.cast(asyncio.AbstractEventLoop, self.loop).call_soon_threadsafe(func, *args)
+        except RuntimeError:
+            # The event loop has been closed already.
+            pass
+
+    def _read(self) -> None:
+        """
+        Read from the socket, including records which have already been decrypted into the TLS buffer,
+        because they will not make the socket readable again.
+        """
+        client = self.client
+        while client.loop_read() == paho.MQTT_ERR_SUCCESS:
+            pending = getattr(client.socket(), "pending", None)
+            if pending is None or not pending():
+                break
+
+    def _add_reader(self, sock: socket.socket) -> None:
+        # When scheduled from another thread, the socket may have been replaced meanwhile.
+        if self.client.socket() is sock:
+            t.cast(asyncio.AbstractEventLoop, self.loop).add_reader(sock, self._read)
+
+    def _add_writer(self, sock: socket.socket) -> None:
+        if self.client.socket() is sock:
+            t.cast(asyncio.AbstractEventLoop, self.loop).add_writer(sock, self.client.loop_write)
+
+    def _on_socket_open(self, client: paho.Client, userdata: t.Any, sock: socket.socket) -> None:
+        self._on_loop(self._add_reader, sock)
+
+    def _on_socket_close(self, client: paho.Client, userdata: t.Any, sock: socket.socket) -> None:
+        # Refer to the file descriptor, because the socket is closed right after this callback.
+        self._on_loop(t.cast(asyncio.AbstractEventLoop, self.loop).remove_reader, sock.fileno())
+
+    def _on_socket_register_write(self, client: paho.Client, userdata: t.Any, sock: socket.socket) -> None:
+        self._on_loop(self._add_writer, sock)
+
+    def _on_socket_unregister_write(self, client: paho.Client, userdata: t.Any, sock: socket.socket) -> None:
+        self._on_loop(t.cast(asyncio.AbstractEventLoop, self.loop).remove_writer, sock.fileno())
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Register the socket callbacks of the client, including its current socket.
+
+        Must be invoked on the thread running the event loop.
+        """
+        self.loop = loop
+        self._thread_id = threading.get_ident()
+        client = self.client
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        sock = client.socket()
+        if sock is not None:
+            self._on_socket_open(client, None, sock)
+            if client.want_write():
+                self._on_socket_register_write(client, None, sock)
+
+    async def run(self, stopped: t.Callable[[], bool]) -> None:
+        """
+        Process network events of the client, until `stopped()` returns `True`.
+        """
+        self.attach(asyncio.get_running_loop())
+        while not stopped():
+            if self.client.loop_misc() == paho.MQTT_ERR_NO_CONN and not stopped():
+                logger.warning(f"MQTT server disconnected, trying to reconnect each {self.reconnect_interval} seconds")
+                await asyncio.sleep(self.reconnect_interval)
+                try:
+                    self.client.reconnect()
+                except Exception as ex:
+                    logger.error(f"Reconnecting to MQTT broker failed: {ex.__class__.__name__}({ex})")
+            else:
+                await asyncio.sleep(1)
@@ -0,0 +1,663 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import heapq
+import itertools
+import logging
+import threading
+import time
+import typing as t
+import zlib
+from queue import Queue
+
+logger = logging.getLogger(__name__)
+
+# Marks entries of a `ServiceQueue`, whose job has been taken out of the queue.
+REMOVED = object()
+
+
+class ServiceOverloaded(RuntimeError):
+    """
+    Raised when submitting work to a service which has too many hung calls.
+    """
+
+    pass
+
+
+class PluginCall:
+    """
+    A single invocation of a service plugin, submitted to a `ServiceExecutor`.
+
+    The outcome is either the result, an exception, or expiry, whichever
+    comes first. The deadline of a call starts when it starts running, so
+    waiting for a worker does not count against its timeout. A call which
+    expired while running keeps occupying its worker thread until it returns,
+    and is accounted as hung meanwhile.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    EXPIRED = "expired"
+
+    __slots__ = ("func", "args", "kwargs", "timeout", "deadline", "state", "result", "exception", "_lock", "_done")
+
+    def __init__(self, func: t.Callable, args=(), kwargs=None, timeout: float = 10.0):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.timeout = timeout
+        self.deadline = 0.0
+        self.state = self.PENDING
+        self.result: t.Any = None
+        self.exception: t.Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self, on_start: t.Optional[t.Callable[["PluginCall"], None]] = None) -> bool:
+        """
+        Run the call on behalf of a worker thread.
+
+        `on_start` is invoked once the deadline of the call has been set, right
+        before it starts running. Return whether the call expired while it was
+        running, i.e. whether it hung.
+        """
+        with self._lock:
+            if self.state != self.PENDING:
+                return False
+            self.state = self.RUNNING
+            self.deadline = time.monotonic() + self.timeout
+        if on_start is not None:
+            on_start(self)
+        try:
+            result, exception = self.func(*self.args, **self.kwargs), None
+        except Exception as ex:
+            result, exception = None, ex
+        with self._lock:
+            if self.state == self.EXPIRED:
+                return True
+            self.state = self.DONE
+            self.result = result
+            self.exception = exception
+        self._done.set()
+        return False
+
+    def expire(self, on_expire: t.Callable[["PluginCall", str], None]) -> None:
+        """
+        Expire the call on behalf of the deadline monitor, unless it already completed.
+
+        `on_expire` is invoked with the state the call was in when it expired,
+        before the caller waiting for the outcome is woken up.
+        """
+        with self._lock:
+            if self.state in (self.DONE, self.EXPIRED):
+                return
+            state = self.state
+            self.state = self.EXPIRED
+        try:
+            on_expire(self, state)
+        finally:
+            self._done.set()
+
+    def wait(self) -> None:
+        self._done.wait()
+
+
+class DeadlineMonitor(threading.Thread):
+    """
+    A single thread watching the deadlines of all plugin calls in flight,
+    instead of each call waiting on its own thread.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name="mqttwarn-deadline-monitor", daemon=True)
+        self._condition = threading.Condition()
+        self._deadlines: t.List[t.Tuple[float, int, PluginCall, "ServiceExecutor"]] = []
+        self._counter = itertools.count()
+
+    def track(self, call: PluginCall, executor: "ServiceExecutor") -> None:
+        with self._condition:
+            heapq.heappush(self._deadlines, (call.deadline, next(self._counter), call, executor))
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._deadlines:
+                    self._condition.wait()
+                deadline, _, call, executor = self._deadlines[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0 and call.state not in (PluginCall.DONE, PluginCall.EXPIRED):
+                    self._condition.wait(remaining)
+                    continue
+                heapq.heappop(self._deadlines)
+            call.expire(executor.expired)
+
+
+class ServiceExecutor:
+    """
+    A long-lived pool of worker threads invoking the plugin of a single service.
+
+    Each call gets a deadline, watched by the `DeadlineMonitor`. When a call
+    expires while running, its worker thread is accounted as hung, and a
+    replacement worker is started, so that the pool keeps its capacity. When
+    the hung call eventually returns, its worker retires, while the replacement
+    keeps serving. When the number of hung calls reaches `max_hung`, new work
+    is rejected until some of them return, so that the number of threads
+    stays bounded.
+    """
+
+    def __init__(self, name: str, monitor: DeadlineMonitor, workers: int = 1, timeout: float = 10.0, max_hung: int = 5):
+        self.name = name
+        self.monitor = monitor
+        self.workers = max(int(workers), 1)
+        self.timeout = float(timeout)
+        self.max_hung = max(int(max_hung), 1)
+
+        self.calls = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hung = 0
+
+        self._queue: Queue = Queue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._shutdown = False
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        self._threads += 1
+        thread = threading.Thread(target=self._work, name=f"mqttwarn-service-{self.name}", daemon=True)
+        thread.start()
+
+    def _work(self) -> None:
+        while True:
+            call = self._queue.get()
+            if call is None:
+                break
+            hung = call.run(on_start=self._track)
+            if not hung:
+                continue
+            with self._lock:
+                self.hung -= 1
+                logger.info(f"Hung call to service plugin returned. service={self.name}")
+                # A replacement has been started while this worker was hung, so retire it, unless the
+                # pool would fall short of its capacity. Only formerly hung workers retire, so that the
+                # replacements keep serving the queue while other calls are still hanging.
+                if self._threads - self.hung > self.workers and not self._shutdown:
+                    self._threads -= 1
+                    return
+        with self._lock:
+            self._threads -= 1
+
+    def _track(self, call: PluginCall) -> None:
+        self.monitor.track(call, self)
+
+    def submit(self, func: t.Callable, args=(), kwargs=None) -> PluginCall:
+        """
+        Submit a call to the pool. Its deadline is handed over to the monitor once it starts running.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(f"Executor for service '{self.name}' has been shut down")
+            if self.hung >= self.max_hung:
+                self.rejected += 1
+                raise ServiceOverloaded(
+                    f"Service '{self.name}' has {self.hung} hung calls, rejecting new work until they return"
+                )
+            self.calls += 1
+        call = PluginCall(func, args, kwargs, timeout=self.timeout)
+        self._queue.put(call)
+        return call
+
+    def call(self, func: t.Callable, args=(), kwargs=None, default: t.Any = False) -> t.Any:
+        """
+        Invoke `func` on the pool, and wait for its outcome.
+
+        Return its result, or `default` when it did not return in time.
+        Exceptions raised by `func` are propagated to the caller.
+        """
+        call = self.submit(func, args, kwargs)
+        call.wait()
+        if call.state == PluginCall.EXPIRED:
+            return default
+        if call.exception is not None:
+            raise call.exception
+        return call.result
+
+    def expired(self, call: PluginCall, state: str) -> None:
+        """
+        Account for an expired call, on behalf of the deadline monitor.
+        """
+        with self._lock:
+            self.timeouts += 1
+            if state == PluginCall.RUNNING:
+                self.hung += 1
+                if not self._shutdown:
+                    self._spawn()
+        logger.warning(
+            f"Invoking service plugin timed out after {self.timeout} seconds. "
+            f"service={self.name}, hung={self.hung}/{self.max_hung}"
+        )
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "hung": self.hung,
+                "threads": self._threads,
+                "queued": self._queue.qsize(),
+            }
+
+    def shutdown(self) -> None:
+        """
+        Stop all idle workers. Hung workers will exit when their call returns.
+        """
+        with self._lock:
+            self._shutdown = True
+            threads = self._threads
+        for _ in range(threads):
+            self._queue.put(None)
+
+
+def job_size(job: t.Any) -> int:
+    """
+    Estimate the memory footprint of a job by the size of its payload.
+    """
+    payload = getattr(job, "payload", None)
+    if isinstance(payload, (bytes, bytearray, str)):
+        return len(payload)
+    return 0
+
+
+class ServiceQueue:
+    """
+    A job queue of a single service, served by its own set of workers.
+
+    Services are isolated from each other like bulkheads, so that a slow
+    service only exhausts its own workers, without stalling other services.
+
+    Jobs are scheduled by their priority `prio`, where higher numbers are more
+    urgent. To prevent starvation of less urgent jobs, each priority level is
+    worth `aging` seconds of waiting time, i.e. a job is scheduled as if it
+    had been queued `prio * aging` seconds earlier than it actually was.
+
+    The queue is bounded by the number of jobs `max_jobs`, and by the total
+    size of their payloads `max_bytes`, where zero means unbounded. When it
+    is full, jobs below the priority `drop_below` are dropped first, either
+    the incoming job, or the least urgent queued job. Then, the `overflow`
+    policy applies, which is one of `block`, `drop_oldest`, or `drop_newest`.
+    Blocking will propagate backpressure to the caller. Producers blocked on
+    a full queue are released when it is shut down, without queueing their
+    jobs.
+
+    By default, all workers take jobs from a shared queue, so jobs may be
+    delivered out of order. When a `shard` function is given, it computes a
+    key for each job, and the queue is split into one shard per worker. Jobs
+    are assigned to shards by a stable hash of their key, so that jobs with
+    the same key are processed in order, by the same worker. Within a shard,
+    jobs are processed in the order they have been submitted, without
+    regard to their priority.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+    def __init__(
+        self,
+        name: str,
+        handler: t.Callable,
+        workers: int = 1,
+        aging: float = 10.0,
+        max_jobs: int = 0,
+        max_bytes: int = 0,
+        overflow: str = "block",
+        drop_below: t.Optional[int] = None,
+        on_drop: t.Optional[t.Callable[[t.Any], None]] = None,
+        shard: t.Optional[t.Callable[[t.Any], str]] = None,
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy '{overflow}', use one of {', '.join(self.OVERFLOW_POLICIES)}")
+        self.name = name
+        self.handler = handler
+        self.workers = max(int(workers), 1)
+        self.aging = float(aging)
+        self.max_jobs = int(max_jobs)
+        self.max_bytes = int(max_bytes)
+        self.overflow = overflow
+        self.drop_below = drop_below
+        self.on_drop = on_drop
+        self.shard = shard
+
+        self.processed = 0
+        self.busy = 0
+        self.dropped: t.Dict[str, int] = {}
+
+        # One heap per shard, whose entries are lists of (key, seq, enqueued, priority, size, shard, job).
+        # Evicted entries are removed lazily, by replacing their job with `REMOVED`.
+        shards = self.workers if shard is not None else 1
+        self._shards: t.List[t.List[t.List[t.Any]]] = [[] for _ in range(shards)]
+        self._assigned = [0] * shards
+        self._queued = [0] * shards
+        # Heaps indexing the eviction candidates by (enqueued, seq, entry), and (priority, enqueued, seq, entry),
+        # so that finding the job to evict does not scan the whole queue.
+        self._oldest: t.List[t.Tuple] = []
+        self._least_urgent: t.List[t.Tuple] = []
+        self._count = 0
+        self._bytes = 0
+        self._unfinished = 0
+        self._closed = False
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._not_empty = [threading.Condition(self._lock) for _ in range(shards)]
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self._busy_time = 0.0
+        self._started = time.monotonic()
+        self._waits: t.Dict[int, t.List[float]] = {}
+        for worker_id in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, args=(worker_id,), name=f"mqttwarn-queue-{self.name}-{worker_id}", daemon=True
+            )
+            thread.start()
+
+    def _work(self, worker_id: int) -> None:
+        index = worker_id % len(self._shards)
+        heap = self._shards[index]
+        while True:
+            with self._lock:
+                while not self._queued[index] and not self._closed:
+                    self._not_empty[index].wait()
+                if not self._queued[index]:
+                    break
+                entry = heapq.heappop(heap)
+                while entry[6] is REMOVED:
+                    entry = heapq.heappop(heap)
+                _, _, enqueued, priority, size, _, job = entry
+                self._remove(entry)
+                self._not_full.notify_all()
+                started = time.monotonic()
+                self.busy += 1
+                # Count, total, and maximum waiting time per priority.
+                wait = self._waits.setdefault(priority, [0, 0.0, 0.0])
+                wait[0] += 1
+                wait[1] += started - enqueued
+                wait[2] = max(wait[2], started - enqueued)
+            try:
+                self.handler(job, worker_id=f"{self.name}/{worker_id}")
+            except Exception:
+                logger.exception(f"Processing job failed. service={self.name}")
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                    self.processed += 1
+                    self._busy_time += time.monotonic() - started
+                    self._task_done()
+
+    def _task_done(self) -> None:
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._all_done.notify_all()
+
+    def _is_full(self, size: int) -> bool:
+        if not self._count:
+            return False
+        if self.max_jobs > 0 and self._count >= self.max_jobs:
+            return True
+        if self.max_bytes > 0 and self._bytes + size > self.max_bytes:
+            return True
+        return False
+
+    def _drop(self, job: t.Any, reason: str) -> None:
+        section = str(getattr(job, "section", None))
+        self.dropped[section] = self.dropped.get(section, 0) + 1
+        logger.debug(f"Dropped job ({reason}). service={self.name}, section={section}")
+        if self.on_drop is not None:
+            self.on_drop(job)
+
+    def _remove(self, entry: t.List[t.Any]) -> None:
+        self._queued[entry[5]] -= 1
+        self._count -= 1
+        self._bytes -= entry[4]
+        entry[6] = REMOVED
+
+    def _evict(self, index: t.List[t.Tuple], reason: str) -> bool:
+        """
+        Evict the first job of an eviction index, skipping entries which have already been removed.
+
+        Return whether a job has been evicted.
+        """
+        while index:
+            entry = heapq.heappop(index)[-1]
+            if entry[6] is REMOVED:
+                continue
+            job = entry[6]
+            self._remove(entry)
+            self._drop(job, reason)
+            self._task_done()
+            return True
+        return False
+
+    def _compact(self) -> None:
+        """
+        Purge removed entries from the shards and eviction indexes, once they outnumber the queued ones.
+        """
+        for shard, heap in enumerate(self._shards):
+            if len(heap) > 2 * self._queued[shard] + 64:
+                heap[:] = [entry for entry in heap if entry[6] is not REMOVED]
+                heapq.heapify(heap)
+        for index in (self._oldest, self._least_urgent):
+            if len(index) > 2 * self._count + 64:
+                index[:] = [item for item in index if item[-1][6] is not REMOVED]
+                heapq.heapify(index)
+
+    def put(self, job: t.Any) -> bool:
+        """
+        Submit a job to the queue, applying the overflow policy when it is full.
+
+        Return whether the job has been queued, or `False` when it has been dropped.
+        """
+        priority = int(getattr(job, "prio", None) or 0)
+        size = job_size(job)
+        with self._lock:
+            while self._is_full(size) and not self._closed:
+                if self.drop_below is not None:
+                    if priority < self.drop_below:
+                        self._drop(job, "below priority")
+                        return False
+                    # Evict the least urgent, and then the oldest job.
+                    if self._evict(self._least_urgent, "below priority"):
+                        continue
+                if self.overflow == "drop_newest":
+                    self._drop(job, "newest")
+                    return False
+                if self.overflow == "drop_oldest":
+                    self._evict(self._oldest, "oldest")
+                    continue
+                self._not_full.wait()
+            if self._closed:
+                logger.debug(f"Rejected job, queue has been shut down. service={self.name}")
+                return False
+            shard = 0
+            if self.shard is not None:
+                shard = zlib.crc32(str(self.shard(job)).encode("utf-8")) % len(self._shards)
+            enqueued = time.monotonic()
+            # Shards keep their jobs in order of submission, regardless of their priority.
+            key = 0.0 if self.shard is not None else enqueued - priority * self.aging
+            seq = next(self._counter)
+            entry = [key, seq, enqueued, priority, size, shard, job]
+            heapq.heappush(self._shards[shard], entry)
+            if self.overflow == "drop_oldest":
+                heapq.heappush(self._oldest, (enqueued, seq, entry))
+            if self.drop_below is not None and priority < self.drop_below:
+                heapq.heappush(self._least_urgent, (priority, enqueued, seq, entry))
+            self._compact()
+            self._assigned[shard] += 1
+            self._queued[shard] += 1
+            self._count += 1
+            self._bytes += size
+            self._unfinished += 1
+            self._not_empty[shard].notify()
+        return True
+
+    def join(self, timeout: t.Optional[float] = None) -> bool:
+        """
+        Wait until all jobs have been processed, or `timeout` seconds have passed.
+
+        Return whether all jobs have been processed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._all_done.wait(remaining)
+        return True
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        """
+        Report queue depth, worker utilization, both current, and averaged
+        over the lifetime of the queue, waiting times per priority, and
+        dropped jobs per section.
+
+        When sharded, report the number of jobs assigned to each shard, and
+        the imbalance, i.e. the ratio of the busiest shard to the average.
+        """
+        with self._lock:
+            uptime = max(time.monotonic() - self._started, 1e-9)
+            stats = {
+                "queued": self._count,
+                "queued_bytes": self._bytes,
+                "workers": self.workers,
+                "busy": self.busy,
+                "processed": self.processed,
+                "utilization": round(min(self._busy_time / (uptime * self.workers), 1.0), 4),
+                "wait": {
+                    priority: {"count": count, "mean": round(total / count, 6), "max": round(maximum, 6)}
+                    for priority, (count, total, maximum) in sorted(self._waits.items())
+                },
+                "dropped": dict(self.dropped),
+            }
+            if self.shard is not None:
+                mean = sum(self._assigned) / len(self._assigned)
+                stats["shards"] = {
+                    "queued": list(self._queued),
+                    "assigned": list(self._assigned),
+                    "imbalance": round(max(self._assigned) / mean, 4) if mean else 1.0,
+                }
+            return stats
+
+    def shutdown(self) -> None:
+        """
+        Stop all workers, after they processed the jobs queued so far, and release blocked producers.
+        """
+        with self._lock:
+            self._closed = True
+            for not_empty in self._not_empty:
+                not_empty.notify_all()
+            self._not_full.notify_all()
+
+
+class Batcher:
+    """
+    Accumulate entries into batches, which are flushed when reaching `size`
+    entries, or when `linger` seconds have passed since the first entry has
+    been added, whichever comes first.
+
+    `flush` is invoked with a list of entries, and returns a list of outcomes
+    per entry, which are counted as delivered, or failed. Full batches are
+    flushed by the caller adding the last entry, lingering ones by a single
+    long-lived flusher thread per batcher, which runs until it is closed.
+    """
+
+    def __init__(
+        self, name: str, flush: t.Callable[[t.List[t.Any]], t.List[bool]], size: int = 100, linger: float = 1.0
+    ):
+        self.name = name
+        self.flush_callback = flush
+        self.size = max(int(size), 1)
+        self.linger = float(linger)
+
+        self.batches = 0
+        self.delivered = 0
+        self.failed = 0
+
+        self._entries: t.List[t.Any] = []
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._deadline: t.Optional[float] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"mqttwarn-batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._closed and (self._deadline is None or self._deadline > time.monotonic()):
+                    self._condition.wait(None if self._deadline is None else self._deadline - time.monotonic())
+                entries = self._take()
+                closed = self._closed
+            if entries:
+                self._flush(entries)
+            if closed:
+                break
+
+    def add(self, entry: t.Any) -> None:
+        """
+        Add an entry to the current batch, flushing it when it is full.
+        """
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) < self.size and not self._closed:
+                if self._deadline is None:
+                    self._deadline = time.monotonic() + self.linger
+                    self._condition.notify()
+                return
+            entries = self._take()
+        self._flush(entries)
+
+    def flush(self) -> None:
+        """
+        Flush the current batch, if any.
+        """
+        with self._lock:
+            entries = self._take()
+        if entries:
+            self._flush(entries)
+
+    def close(self) -> None:
+        """
+        Flush the current batch, if any, and stop the flusher thread.
+        """
+        with self._lock:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _take(self) -> t.List[t.Any]:
+        entries, self._entries = self._entries, []
+        self._deadline = None
+        return entries
+
+    def _flush(self, entries: t.List[t.Any]) -> None:
+        try:
+            outcomes = self.flush_callback(entries)
+        except Exception:
+            logger.exception(f"Flushing batch failed. name={self.name}, size={len(entries)}")
+            outcomes = [False] * len(entries)
+        with self._lock:
+            self.batches += 1
+            delivered = sum(1 for outcome in outcomes if outcome)
+            self.delivered += delivered
+            self.failed += len(entries) - delivered
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        with self._lock:
+            return {
+                "pending": len(self._entries),
+                "batches": self.batches,
+                "delivered": self.delivered,
+                "failed": self.failed,
+            }
@@ -1,21 +1,162 @@
 # -*- coding: utf-8 -*-
 # (c) 2021-2023 The mqttwarn developers
 import dataclasses
+import json
+import logging
 import platform
 import sys
+import threading
 import typing as t
 from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from functools import total_ordering
 from logging import Logger
 from typing import Dict, Optional, Union
 
 from mqttwarn import __version__
+from mqttwarn.util import truncate
+
+logger = logging.getLogger(__name__)
 
 # Type definitions.
 
 # The venerable transformation data dictionary.
 TdataType = t.Dict[str, t.Union[t.AnyStr, int]]
 
+# Builtin transformation data fields, computed from a clock reading.
+TIMESTAMP_FIELDS: t.Dict[str, t.Callable[[float], t.Union[str, int]]] = {
+    # 1392628581
+    "_dtepoch": lambda clock: int(clock),
+    # 2014-02-17T10:38:43.910691Z
+    "_dtiso": lambda clock: datetime.fromtimestamp(clock, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+    # local time in iso format
+    "_ltiso": lambda clock: datetime.fromtimestamp(clock).isoformat(),
+    # 10:16
+    "_dthhmm": lambda clock: datetime.fromtimestamp(clock).strftime("%H:%M"),
+    # hhmmss=10:16:21
+    "_dthhmmss": lambda clock: datetime.fromtimestamp(clock).strftime("%H:%M:%S"),
+}
+
+
+class TransformationData(dict):
+    """
+    The transformation data dictionary, which computes the builtin timestamp
+    fields lazily, from a single clock reading, only when they are accessed.
+
+    Looking up individual keys, like `str.format_map` is doing, computes only
+    the requested field. All other ways of accessing the whole mapping, like
+    iterating it, unpacking it using `**`, or serializing it to JSON, compute
+    all pending fields beforehand.
+    """
+
+    __slots__ = ("_clock",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._clock: t.Optional[float] = None
+
+    def defer_timestamps(self, clock: float) -> "TransformationData":
+        """
+        Provide the builtin timestamp fields lazily, based on the clock reading `clock`.
+        """
+        self._clock = clock
+        return self
+
+    def _materialize(self):
+        clock = self._clock
+        if clock is not None:
+            self._clock = None
+            for key, compute in TIMESTAMP_FIELDS.items():
+                if not dict.__contains__(self, key):
+                    dict.__setitem__(self, key, compute(clock))
+
+    def __missing__(self, key):
+        if self._clock is not None and key in TIMESTAMP_FIELDS:
+            value = TIMESTAMP_FIELDS[key](self._clock)
+            dict.__setitem__(self, key, value)
+            return value
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (self._clock is not None and key in TIMESTAMP_FIELDS)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def __iter__(self):
+        self._materialize()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._materialize()
+        return dict.__len__(self)
+
+    def __eq__(self, other):
+        self._materialize()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        self._materialize()
+        return dict.__ne__(self, other)
+
+    def __or__(self, other):
+        self._materialize()
+        return dict.__or__(self, other)
+
+    def __repr__(self):
+        self._materialize()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        self._materialize()
+        return self.__class__, (dict(dict.items(self)),)
+
+    def __delitem__(self, key):
+        self._materialize()
+        dict.__delitem__(self, key)
+
+    def keys(self):
+        self._materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self._materialize()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize()
+        return dict.items(self)
+
+    def pop(self, *args):
+        self._materialize()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._materialize()
+        return dict.popitem(self)
+
+    def clear(self):
+        self._clock = None
+        dict.clear(self)
+
+    def copy(self) -> "TransformationData":
+        """
+        Return a shallow copy, which keeps the pending timestamp fields lazy.
+        """
+        data = TransformationData(dict.items(self))
+        data._clock = self._clock
+        return data
+
+
 # Covering old- and new-style configuration layouts. `addrs` has
 # originally been a list of strings, has been expanded to be a
 # list of dictionaries (Apprise), to be a dictionary (Pushsafer),
@@ -26,31 +167,62 @@ TopicTargetType = t.Union[t.List, t.Dict[str, t.Any], str, None]
 class Struct:
     """
     Data container for feeding information into service plugins - V1.
+
+    The fields populated by the core are stored in slots. Other attributes,
+    assigned by plugins or by `run_plugin`, are stored in an instance
+    dictionary, which is only allocated on demand.
     """
 
     # Convert Python dict to object?
     # http://stackoverflow.com/questions/1305532/
 
+    FIELDS = (
+        "service",
+        "section",
+        "target",
+        "config",
+        "addrs",
+        "topic",
+        "payload",
+        "data",
+        "title",
+        "image",
+        "message",
+        "priority",
+    )
+
+    __slots__ = FIELDS + ("__dict__",)
+
     def __init__(self, **entries):
-        self.__dict__.update(entries)
+        for key, value in entries.items():
+            setattr(self, key, value)
+
+    def _items(self) -> t.Iterator[t.Tuple[str, t.Any]]:
+        for key in self.FIELDS:
+            try:
+                yield key, getattr(self, key)
+            except AttributeError:
+                pass
+        yield from self.__dict__.items()
 
     def __repr__(self):
-        return "<%s>" % str("\n ".join("%s: %s" % (k, repr(v)) for (k, v) in list(self.__dict__.items())))
+        return "<%s>" % str("\n ".join("%s: %s" % (k, repr(v)) for (k, v) in self._items()))
 
     def get(self, key, default=None):
-        if key in self.__dict__ and self.__dict__[key] is not None:
-            return self.__dict__[key]
+        if key in self.FIELDS:
+            value = getattr(self, key, None)
+        else:
+            value = self.__dict__.get(key)
+        if value is not None:
+            return value
         else:
             return default
 
     def enum(self):
-        item = {}
-        for k, v in list(self.__dict__.items()):
-            item[k] = v
-        return item
+        return dict(self._items())
 
 
-@dataclass
+@dataclass(**({"slots": True} if sys.version_info >= (3, 10) else {}))
 class ProcessorItem:
     """
     Data container for feeding information into service plugins - V2.
@@ -86,6 +258,88 @@ class ProcessorItem:
         )
 
 
+def copy_json(value: t.Any) -> t.Any:
+    """
+    Copy a value decoded from JSON, including nested lists and dictionaries.
+    """
+    if isinstance(value, dict):
+        return {key: copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_json(item) for item in value]
+    return value
+
+
+class MessageEnvelope:
+    """
+    An inbound message, which is decoded at most once, and shared by all
+    sections, filters, and jobs processing it.
+
+    The payload is decoded from UTF-8, and from JSON, lazily on first
+    access. The builtin transformation data is computed once, and
+    attached by the core on first use, see `core.decode_payload`.
+    Each section gets its own overlay of it, so it is never modified.
+    """
+
+    __slots__ = ("topic", "payload", "qos", "retain", "_text", "_payload_data", "base_data")
+
+    _UNSET = object()
+
+    def __init__(self, topic: str, payload: t.Union[str, bytes], qos: int = 0, retain: bool = False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self._text: t.Any = self._UNSET
+        self._payload_data: t.Any = self._UNSET
+        self.base_data: t.Optional[TdataType] = None
+
+    def __repr__(self):
+        return f"<MessageEnvelope topic={self.topic!r} payload={truncate(self.payload)!r}>"
+
+    @property
+    def text(self) -> t.Union[str, bytes]:
+        """
+        The payload decoded from UTF-8. When decoding fails, the raw payload is returned.
+        """
+        if self._text is self._UNSET:
+            payload = self.payload
+            if isinstance(payload, bytes):
+                try:
+                    payload = payload.decode("utf-8")
+                except Exception as ex:
+                    logger.debug(f"Decoding from UTF-8 failed: {ex}. payload={truncate(payload)}")
+            self._text = payload
+        return self._text
+
+    @property
+    def payload_data(self) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        The payload decoded from JSON, or `None`, when it is not a JSON object.
+        """
+        if self._payload_data is self._UNSET:
+            payload = self.text
+            payload_data = None
+            try:
+                if isinstance(payload, str):
+                    payload = payload.rstrip("\0")
+                payload_data = dict(json.loads(payload))
+            except Exception as ex:
+                logger.debug(f"Decoding JSON failed: {ex}. payload={truncate(payload)}")
+            self._payload_data = payload_data
+        return self._payload_data
+
+    def copy_payload_data(self) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        A copy of the payload decoded from JSON, for layering it onto the transformation
+        data of a section. Nested lists and dictionaries are copied as well, so that user
+        functions mutating them never change what other sections see.
+        """
+        payload_data = self.payload_data
+        if payload_data is None:
+            return None
+        return t.cast(t.Dict[str, t.Any], copy_json(payload_data))
+
+
 @dataclasses.dataclass
 class StatusInformation:
     """
@@ -102,7 +356,7 @@ class Service:
     Class with helper functions which is passed to each plugin and its global instantiation.
     """
 
-    def __init__(self, mqttc, logger, mwcore, program):
+    def __init__(self, mqttc, logger, mwcore, program, state=None, durable=False):
         # Reference to MQTT client object.
         self.mqttc = mqttc
 
@@ -115,10 +369,54 @@ class Service:
         # Name of self ("mqttwarn", mostly).
         self.SCRIPTNAME = program
 
+        # State of the service plugin, returned by its `setup` hook.
+        self.state = state
+
+        # Whether jobs are spooled, so that plugins must only report success once their outcome is durable.
+        self.durable = durable
+
+
+class Rendering:
+    """
+    The outbound message fields rendered from a single message for a section,
+    shared by all jobs dispatched from it, so that they are rendered only once.
+
+    Renditions are keyed by their input which may differ between jobs,
+    like the payload, which may or may not be decoded, per service.
+    """
+
+    __slots__ = ("_lock", "_renditions")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._renditions: t.Dict[t.Any, t.Dict[str, t.Any]] = {}
+
+    def get(self, key: t.Any, render: t.Callable[[], t.Dict[str, t.Any]]) -> t.Dict[str, t.Any]:
+        """
+        Return the rendition for `key`, invoking `render` to produce it on first access.
+        """
+        rendition = self._renditions.get(key)
+        if rendition is None:
+            with self._lock:
+                rendition = self._renditions.get(key)
+                if rendition is None:
+                    rendition = self._renditions[key] = render()
+        return rendition
+
+    def __getstate__(self):
+        # Renditions are carried over from routing processes, while locks are not.
+        return (self._renditions,)
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        (self._renditions,) = state
+
 
 @total_ordering
 class Job:
-    def __init__(self, prio, service, section, topic, payload, data, target):
+    __slots__ = ("prio", "service", "section", "topic", "payload", "data", "target", "rendering", "spool_id")
+
+    def __init__(self, prio, service, section, topic, payload, data, target, rendering=None):
         self.prio = prio
         self.service = service
         self.section = section
@@ -126,6 +424,8 @@ class Job:
         self.payload = payload  # raw payload
         self.data = data  # decoded payload
         self.target = target
+        self.rendering: t.Optional[Rendering] = rendering  # shared outbound message fields
+        self.spool_id: t.Optional[int] = None  # identifier within the durable job spool
 
     # The `__cmp__()` special method is no longer honored in Python 3.
     # https://portingguide.readthedocs.io/en/latest/comparisons.html#rich-comparisons
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import dataclasses
+import logging
+import types
+import typing as t
+
+from mqttwarn.configuration import Config
+from mqttwarn.topic import TopicDispatcher
+from mqttwarn.util import PreparedFormat, asbool, load_function, sanitize_function_name
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class UserFunction:
+    """
+    A reference to a user-defined function, resolved when compiling the configuration.
+
+    When resolving the function failed, the error is retained, and raised again
+    on invocation, so that it is reported in the context of processing a message.
+    """
+
+    name: str
+    func: t.Optional[t.Callable] = None
+    error: t.Optional[Exception] = None
+
+    def __str__(self):
+        return self.name
+
+    def resolve(self) -> t.Callable:
+        if self.func is None:
+            raise self.error or ValueError(f"Function not resolved: {self.name}")
+        return self.func
+
+
+@dataclasses.dataclass(frozen=True)
+class Template:
+    """
+    A compiled `format`, `title`, `image`, or `priority` option value.
+
+    When the value references a user-defined function, it is resolved at
+    compile time. The format string is used when there is no function, or
+    when invoking it failed.
+    """
+
+    value: str
+    format: PreparedFormat  # noqa:A003
+    function: t.Optional[UserFunction] = None
+
+    def __str__(self):
+        return self.value
+
+
+@dataclasses.dataclass(frozen=True)
+class SectionPlan:
+    """
+    The compiled representation of a configuration section, which is
+    read when processing messages, instead of the configuration object.
+    """
+
+    name: str
+    exists: bool = False
+    options: t.Mapping[str, str] = dataclasses.field(default_factory=lambda: types.MappingProxyType({}))
+    topic: str = ""
+    qos: int = 0
+    timeout: int = -1
+    notify_only_on_timeout: bool = False
+
+    # User-defined functions.
+    filter: t.Optional[UserFunction] = None  # noqa:A003
+    datamap: t.Optional[UserFunction] = None
+    alldata: t.Optional[UserFunction] = None
+
+    # Topic targets, either computed by a function, defined by a dispatcher dictionary, or by a list.
+    targets_function: t.Optional[UserFunction] = None
+    targets_dict: t.Optional[t.Mapping[str, t.Any]] = None
+    targets_dispatcher: t.Optional[TopicDispatcher] = None
+    targets_list: t.Optional[t.Tuple[str, ...]] = None
+
+    # Templates for the outbound message.
+    title: t.Optional[Template] = None
+    image: t.Optional[Template] = None
+    format: t.Optional[Template] = None  # noqa:A003
+    priority: t.Optional[Template] = None
+    template: t.Optional[str] = None
+
+    # Scheduling priority of jobs, when `priority` is a constant number.
+    job_priority: t.Optional[int] = None
+
+    def get(self, name: str, default: t.Any = None) -> t.Any:
+        return self.options.get(name, default)
+
+
+@dataclasses.dataclass(frozen=True)
+class ServicePlan:
+    """
+    The compiled representation of a `[config:<service>]` configuration section.
+    """
+
+    name: str
+    exists: bool = False
+    config: t.Mapping[str, t.Any] = dataclasses.field(default_factory=lambda: types.MappingProxyType({}))
+    targets: t.Optional[t.Mapping[str, t.Any]] = None
+    decode_utf8: bool = True
+    plugin_timeout: float = 10.0
+    plugin_max_hung: int = 5
+    plugin_max_concurrency: int = 100
+    workers: t.Optional[int] = None
+    job_priority: int = 0
+
+    # Assign jobs to workers by `topic`, `section`, or `data:<field>`, preserving their order per key.
+    shard_key: t.Optional[str] = None
+
+    # Bounds and overflow policy of the job queue, overriding the `[defaults]` section.
+    queue_max_jobs: t.Optional[int] = None
+    queue_max_bytes: t.Optional[int] = None
+    queue_overflow: t.Optional[str] = None
+    queue_drop_below: t.Optional[int] = None
+
+    # Windows for accumulating jobs of services whose plugins implement `plugin_batch`,
+    # and whether to use it, for all targets, or for the listed ones.
+    batch: t.Union[bool, t.Tuple[str, ...], None] = None
+    batch_size: int = 100
+    batch_linger: float = 1.0
+
+
+def resolve_function(config: Config, value: t.Any) -> UserFunction:
+    """
+    Resolve a user-defined function by its reference like `myfunction()`.
+    """
+    try:
+        name = sanitize_function_name(value)
+    except ValueError as ex:
+        return UserFunction(name=str(value), error=ex)
+    try:
+        func = load_function(name=name, py_mod=config.functions)
+    except Exception as ex:
+        return UserFunction(name=name, error=ex)
+    return UserFunction(name=name, func=func)
+
+
+def is_function_reference(value: t.Any) -> bool:
+    """
+    Whether a configuration value references a user-defined function.
+    """
+    try:
+        sanitize_function_name(value)
+        return True
+    except ValueError:
+        return False
+
+
+def compile_template(config: Config, value: t.Any) -> Template:
+    """
+    Compile a `format`, `title`, `image`, or `priority` option value.
+    """
+    value = str(value)
+    function = None
+    if is_function_reference(value):
+        function = resolve_function(config, value)
+    return Template(value=value, format=PreparedFormat(value), function=function)
+
+
+def optional_int(value: t.Any) -> t.Optional[int]:
+    if value is None:
+        return None
+    return int(value)
+
+
+def constant_priority(value: t.Optional[str]) -> t.Optional[int]:
+    """
+    Return the value of a `priority` option when it is a constant number,
+    i.e. it does not reference any transformation data or functions.
+    """
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def compile_section(config: Config, section: str) -> SectionPlan:
+    """
+    Compile a configuration section into a `SectionPlan`.
+    """
+    if not config.has_section(section):
+        return SectionPlan(name=section, topic=section)
+
+    options: t.Dict[str, str] = {}
+    for option in config.options(section):
+        try:
+            options[option] = config.get(section, option)
+        except Exception as ex:
+            logger.warning(f"Unable to read option `{option}' in section `{section}': {ex}")
+
+    def function_option(option: str) -> t.Optional[UserFunction]:
+        if option not in options:
+            return None
+        return resolve_function(config, options[option])
+
+    def template_option(option: str) -> t.Optional[Template]:
+        if option not in options:
+            return None
+        return compile_template(config, options[option])
+
+    targets_function = None
+    targets_dict = None
+    targets_dispatcher = None
+    targets_list = None
+    targets = options.get("targets")
+    if targets is not None:
+        if is_function_reference(targets):
+            targets_function = resolve_function(config, targets)
+        else:
+            dispatcher_dict = config.getdict(section, "targets")
+            if isinstance(dispatcher_dict, dict) and dispatcher_dict:
+                targets_dict = types.MappingProxyType(dispatcher_dict)
+                targets_dispatcher = TopicDispatcher(dispatcher_dict)
+            else:
+                targets_list = tuple(target.strip() for target in targets.split(","))
+
+    return SectionPlan(
+        name=section,
+        exists=True,
+        options=types.MappingProxyType(options),
+        topic=options.get("topic", section),
+        qos=int(options.get("qos", 0)),
+        timeout=int(options.get("timeout", -1)),
+        notify_only_on_timeout=bool(options.get("notify_only_on_timeout", False)),
+        filter=function_option("filter"),
+        datamap=function_option("datamap"),
+        alldata=function_option("alldata"),
+        targets_function=targets_function,
+        targets_dict=targets_dict,
+        targets_dispatcher=targets_dispatcher,
+        targets_list=targets_list,
+        title=template_option("title"),
+        image=template_option("image"),
+        format=template_option("format"),
+        priority=template_option("priority"),
+        template=options.get("template"),
+        job_priority=constant_priority(options.get("priority")),
+    )
+
+
+def shard_key(value: t.Optional[str]) -> t.Optional[str]:
+    """
+    Validate the value of a `shard_key` option.
+    """
+    if value is None:
+        return None
+    value = str(value)
+    if value in ("topic", "section") or (value.startswith("data:") and value[5:]):
+        return value
+    raise ValueError(f"Invalid shard key '{value}', use one of topic, section, data:<field>")
+
+
+def batch_option(value: t.Any) -> t.Union[bool, t.Tuple[str, ...], None]:
+    """
+    Validate the value of a `batch` option, which is a boolean, or a list of target names.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return tuple(str(target) for target in value)
+    return asbool(value)
+
+
+def compile_service(config: Config, service: str) -> ServicePlan:
+    """
+    Compile a `[config:<service>]` configuration section into a `ServicePlan`.
+    """
+    section = "config:" + service
+    if not config.has_section(section):
+        return ServicePlan(name=service)
+    service_config = dict(config.config(section) or {})
+    return ServicePlan(
+        name=service,
+        exists=True,
+        config=types.MappingProxyType(service_config),
+        targets=config.getdict(section, "targets"),
+        decode_utf8=asbool(service_config.get("decode_utf8", True)),
+        plugin_timeout=float(service_config.get("plugin_timeout", 10.0)),
+        plugin_max_hung=int(service_config.get("plugin_max_hung", 5)),
+        plugin_max_concurrency=int(service_config.get("plugin_max_concurrency", 100)),
+        workers=optional_int(service_config.get("workers")),
+        job_priority=int(service_config.get("job_priority", 0)),
+        shard_key=shard_key(service_config.get("shard_key")),
+        queue_max_jobs=optional_int(service_config.get("queue_max_jobs")),
+        queue_max_bytes=optional_int(service_config.get("queue_max_bytes")),
+        queue_overflow=service_config.get("queue_overflow"),
+        queue_drop_below=optional_int(service_config.get("queue_drop_below")),
+        batch=batch_option(service_config.get("batch")),
+        batch_size=int(service_config.get("batch_size", 100)),
+        batch_linger=float(service_config.get("batch_linger", 1.0)),
+    )
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import threading
+import typing as t
+import zlib
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerProcess:
+    """
+    The state of a worker process, as seen from the parent process.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.pid: t.Optional[int] = None
+        self.inbox: t.Optional[Connection] = None
+        self.outbox: t.Optional[Connection] = None
+        self.send_lock = threading.Lock()
+        self.in_flight = 0
+        self.processed = 0
+        self.exited = False
+
+
+class ProcessPool:
+    """
+    A pool of forked worker processes, which run CPU-bound work outside the
+    global interpreter lock of the parent process.
+
+    Items are submitted to a worker process, selected by a stable hash of
+    their key, so that items with the same key are handled in order. Each
+    worker process sends the results of `handler(item)` back over a pipe,
+    which are passed to `deliver(results)` on a collector thread of the
+    parent process. Pipes are bounded, so that busy worker processes will
+    block submitting more items.
+
+    Forking a multithreaded process may leave locks held by other threads
+    locked forever in the child. So, when the pool is created, before the
+    parent process starts any threads, it forks a single-threaded supervisor
+    process, which inherits the state of the parent process, like loaded
+    modules, and runs the `initializer`, if given, to release inherited
+    resources which must not be used. Worker processes are forked from the
+    supervisor process, on request of the parent process, which hands over
+    their ends of the pipes. When a worker process exits unexpectedly, the
+    items it has been handling are lost, and it is replaced by a new worker
+    process, which takes over its keys.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: t.Callable[[t.Any], t.Any],
+        deliver: t.Callable[[t.Any], None],
+        processes: int = 1,
+        initializer: t.Optional[t.Callable[[], None]] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.deliver = deliver
+        self.initializer = initializer
+        self.lost = 0
+        self.respawned = 0
+
+        self._context = multiprocessing.get_context("fork")
+        self._lock = threading.Lock()
+        self._all_done = threading.Condition(self._lock)
+        self._closed = False
+        self._workers = [WorkerProcess(index) for index in range(max(processes, 1))]
+
+        self._control_lock = threading.Lock()
+        self._control, control = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._supervisor = self._context.Process(
+            target=self._supervise, args=(control,), name=f"{name}-supervisor", daemon=True
+        )
+        self._supervisor.start()
+        control.close()
+
+        for worker in self._workers:
+            self._spawn(worker)
+        self._collectors = []
+        for worker in self._workers:
+            collector = threading.Thread(
+                target=self._collect, args=(worker,), name=f"{name}-collector-{worker.index}", daemon=True
+            )
+            collector.start()
+            self._collectors.append(collector)
+
+    def _spawn(self, worker: WorkerProcess) -> None:
+        """
+        Request the supervisor process to fork a worker process, handing over its ends of the pipes.
+        """
+        inbox_reader, inbox_writer = self._context.Pipe(duplex=False)
+        outbox_reader, outbox_writer = self._context.Pipe(duplex=False)
+        try:
+            with self._control_lock:
+                reduction.sendfds(self._control, [inbox_reader.fileno(), outbox_writer.fileno()])
+                self._control.sendall(struct.pack("!I", worker.index))
+                response = self._control.recv(4, socket.MSG_WAITALL)
+            if len(response) != 4:
+                raise RuntimeError(f"Supervisor process of pool '{self.name}' has exited")
+        except BaseException:
+            inbox_writer.close()
+            outbox_reader.close()
+            raise
+        finally:
+            # The ends of the pipes used by the worker process belong to it alone.
+            inbox_reader.close()
+            outbox_writer.close()
+        (worker.pid,) = struct.unpack("!I", response)
+        worker.inbox, worker.outbox = inbox_writer, outbox_reader
+
+    def _supervise(self, control: socket.socket) -> None:
+        """
+        The main loop of the supervisor process, forking worker processes on request.
+        """
+        # The parent process is in charge of shutting down.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        # Release the end of the control connection of the parent process, inherited by forking.
+        self._control.close()
+
+        if self.initializer is not None:
+            self.initializer()
+
+        children = set()
+        while True:
+            try:
+                inbox, outbox = reduction.recvfds(control, 2)
+                (index,) = struct.unpack("!I", control.recv(4, socket.MSG_WAITALL))
+            except (EOFError, OSError, RuntimeError, struct.error):
+                break
+            # Reap worker processes which have exited meanwhile.
+            for pid in list(children):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    children.discard(pid)
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    control.close()
+                    self._serve(index, Connection(inbox, writable=False), Connection(outbox, readable=False))
+                    status = 0
+                finally:
+                    os._exit(status)
+            os.close(inbox)
+            os.close(outbox)
+            children.add(pid)
+            control.sendall(struct.pack("!I", pid))
+        for pid in children:
+            os.waitpid(pid, 0)
+
+    def _serve(self, index: int, inbox: Connection, outbox: Connection) -> None:
+        """
+        The main loop of a worker process.
+        """
+        while True:
+            try:
+                item = inbox.recv()
+            except EOFError:
+                break
+            if item is None:
+                break
+            try:
+                results = self.handler(item)
+            except Exception:
+                logger.exception(f"Handling item failed. name={self.name}, process={index}")
+                results = None
+            try:
+                outbox.send(results)
+            except Exception:
+                logger.exception(f"Returning results failed. name={self.name}, process={index}")
+                outbox.send(None)
+
+    def _collect(self, worker: WorkerProcess) -> None:
+        """
+        Receive results from a worker process, until it has exited, and replace it, unless shutting down.
+        """
+        while True:
+            outbox = t.cast(Connection, worker.outbox)
+            while True:
+                try:
+                    results = outbox.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    if results is not None:
+                        self.deliver(results)
+                except Exception:
+                    logger.exception(f"Delivering results failed. name={self.name}, process={worker.index}")
+                self._finish(worker, 1)
+
+            # Block submitting items to the worker process, until it has been replaced.
+            with worker.send_lock:
+                with self._lock:
+                    closed = self._closed
+                    if not closed:
+                        logger.error(
+                            f"Worker process exited unexpectedly. name={self.name}, "
+                            f"process={worker.index}, pid={worker.pid}, lost={worker.in_flight}"
+                        )
+                self._finish(worker, worker.in_flight, lost=True)
+                if closed:
+                    with self._lock:
+                        worker.exited = True
+                    return
+                t.cast(Connection, worker.inbox).close()
+                outbox.close()
+                try:
+                    self._spawn(worker)
+                except Exception:
+                    logger.exception(f"Respawning worker process failed. name={self.name}, process={worker.index}")
+                    with self._lock:
+                        worker.exited = True
+                    return
+                with self._lock:
+                    self.respawned += 1
+                logger.info(f"Respawned worker process. name={self.name}, process={worker.index}, pid={worker.pid}")
+
+    def _finish(self, worker: WorkerProcess, count: int, lost: bool = False) -> None:
+        with self._lock:
+            worker.in_flight -= count
+            if lost:
+                self.lost += count
+            else:
+                worker.processed += count
+            if not any(worker.in_flight for worker in self._workers):
+                self._all_done.notify_all()
+
+    def submit(self, item: t.Any, key: str) -> None:
+        """
+        Submit an item to the worker process selected by its key.
+
+        Blocks while the pipe to the worker process is full, or while it is being replaced.
+        """
+        checksum = zlib.crc32(key.encode("utf-8"))
+        worker = self._workers[checksum % len(self._workers)]
+        if worker.exited:
+            # Hand over the keys of a worker process which could not be replaced to the remaining ones.
+            alive = [worker for worker in self._workers if not worker.exited]
+            if not alive:
+                raise RuntimeError(f"All worker processes of pool '{self.name}' have exited")
+            worker = alive[checksum % len(alive)]
+        with worker.send_lock:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError(f"Process pool '{self.name}' has been shut down")
+                if worker.exited:
+                    raise RuntimeError(f"Worker process {worker.index} of pool '{self.name}' has exited")
+                worker.in_flight += 1
+            try:
+                t.cast(Connection, worker.inbox).send(item)
+            except Exception:
+                self._finish(worker, 1, lost=True)
+                raise
+
+    def is_alive(self) -> bool:
+        """
+        Return whether any worker process is still running, or can be replaced.
+        """
+        return not self._closed and not all(worker.exited for worker in self._workers)
+
+    def join(self, timeout: t.Optional[float] = None) -> bool:
+        """
+        Wait until all submitted items have been handled, or `timeout` seconds have passed.
+
+        Return whether all items have been handled.
+        """
+        with self._lock:
+            return self._all_done.wait_for(lambda: not any(worker.in_flight for worker in self._workers), timeout)
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        """
+        Report items being handled, and handled so far, per worker process, lost items, and respawned worker processes.
+        """
+        with self._lock:
+            return {
+                "processes": len(self._workers),
+                "alive": sum(1 for worker in self._workers if not worker.exited),
+                "in_flight": [worker.in_flight for worker in self._workers],
+                "processed": [worker.processed for worker in self._workers],
+                "respawned": self.respawned,
+                "lost": self.lost,
+            }
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """
+        Stop the worker processes, after they handled the items submitted so far, and the supervisor process.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for worker in self._workers:
+            with worker.send_lock:
+                try:
+                    t.cast(Connection, worker.inbox).send(None)
+                except Exception:
+                    pass
+        for worker, collector in zip(self._workers, self._collectors):
+            collector.join(timeout)
+            if collector.is_alive() and worker.pid is not None:
+                logger.warning(f"Terminating worker process. name={self.name}, process={worker.index}")
+                try:
+                    os.kill(worker.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+                collector.join()
+        with self._control_lock:
+            self._control.close()
+        self._supervisor.join(timeout)
+        if self._supervisor.is_alive():
+            self._supervisor.terminate()
+            self._supervisor.join()
+        for worker in self._workers:
+            t.cast(Connection, worker.inbox).close()
+            t.cast(Connection, worker.outbox).close()
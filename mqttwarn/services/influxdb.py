@@ -5,28 +5,42 @@ __author__    = 'Ben Jones <ben.jones12()gmail.com>'
 __copyright__ = 'Copyright 2016 Ben Jones'
 __license__   = 'Eclipse Public License - v 1.0 (http://www.eclipse.org/legal/epl-v10.html)'
 
+import calendar
+import gzip
+import math
+import time
+from datetime import datetime
+
 import requests
 import logging
 
 # disable info logging in requests module (e.g. connection pool message for every post request)
 logging.getLogger("requests").setLevel(logging.WARNING)
 
+# Deliver points one by one, unless enabled by the `batch` option.
+batch_default = False
 
-def plugin(srv, item):
-    ''' addrs: (measurement) '''
+# Microseconds per unit of timestamp precision.
+PRECISION_MICROSECONDS = {'u': 1, 'ms': 1000, 's': 10 ** 6, 'm': 60 * 10 ** 6, 'h': 3600 * 10 ** 6}
+
+
+def setup(srv, config):
+    # Keep connections to the InfluxDB server alive across requests.
+    return requests.Session()
+
+
+def teardown(srv):
+    if srv.state is not None:
+        srv.state.close()
 
-    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
+
+def write_url(item):
+    ''' Return the URL of the write endpoint for an item, and its timestamp precision '''
 
     host        = item.config['host']
     port        = item.config['port']
-    username    = item.config['username']
-    password    = item.config['password']
     database    = item.config['database']
 
-    measurement = item.addrs[0]
-    tag         = "topic=" + item.topic.replace('/', '_')
-    value       = item.message
-
     # retention policy - "&rp=" is valid in the url, so default=''
     rp          = item.config.get('rp', '')
     # precision=[ns,u,ms,s,m,h] - optional, default=nanosecond
@@ -43,48 +57,196 @@ def plugin(srv, item):
             if (len(item.addrs) > 3):
                 precision = item.addrs[3] or precision
 
-    try:
-        url = "%s://%s:%d/write?db=%s&rp=%s&precision=%s" % (protocol, host, port, database, rp, precision)
+    url = "%s://%s:%d/write?db=%s&rp=%s&precision=%s" % (protocol, host, port, database, rp, precision)
+    return url, precision
 
-        # influxdb line protocol:
-        # measurement,tagKey1=tagVal1,tagKey2=tagVal2 field1=value1,field2=value2 Timestamp
-        # sample format in .ini file; no quotes
 
-        if (item.message == item.payload) or (not (' ' in  item.message) and not (',' in item.message)):
-            # if no format has been set, default to "value={payload}"
-            # or if format has been set to output simple value, without additional tags or multiple fields
-            # format = {json_attribute}
-            data = measurement + ',' + tag + ' value=' + value
+def escape_key(text):
+    ''' Escape measurement names, tag keys, tag values, and field keys '''
+    return str(text).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
 
-        elif (',' in item.message) and (not ' ' in item.message):
-            # if format does not include any additional tags or a timestamp, but includes one or multiple non-default fields
-            # format = field1=value1,field2=value2
-            data = measurement + ',' + tag + ' ' + item.message
 
-        else:
-            # if format includes additional tags and one or multiple non-default fields and an optional timestamp, either group separated by whitespace from each other
-            # format = tagKey1=tagVal1,tagKey2=tagVal2 field1=value1,field2=value2
-            data = measurement + ',' + tag + ',' + item.message
+def field_value(value):
+    ''' Encode a field value, or return `None` for values which can not be stored '''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return None
+        return repr(float(value))
+    if isinstance(value, str):
+        return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+    return None
 
-        srv.logging.debug(url)
-        srv.logging.debug(data)
 
-        if username is None:
-            r = requests.post(url, data=data)
-        else:
-            r = requests.post(url, data=data, auth=(username, password))
-        
+def data_keys(option):
+    ''' Map names of tags or fields to keys of the transformation data '''
+    if not option:
+        return {}
+    if isinstance(option, dict):
+        return option
+    return dict((key, key) for key in option)
+
+
+def format_point(srv, item, measurement, tag):
+    ''' Build a point from the `tags` and `fields` transformation data keys of the service '''
+
+    data = item.data or {}
+    line = escape_key(measurement) + ',' + tag
+
+    for name, key in sorted(data_keys(item.config.get('tags')).items()):
+        value = data.get(key)
+        if value is not None and value != '':
+            line += ',' + escape_key(name) + '=' + escape_key(value)
+
+    fields = []
+    for name, key in sorted(data_keys(item.config.get('fields')).items()):
+        value = field_value(data.get(key))
+        if value is not None:
+            fields.append(escape_key(name) + '=' + value)
+
+    if not fields:
+        srv.logging.warning("No fields to write to InfluxDB for topic %s" % item.topic)
+        return None
+
+    return line + ' ' + ','.join(fields)
+
+
+def format_line(srv, item):
+    ''' Return the line-protocol record of an item, or `None` when it has nothing to write '''
+
+    measurement = item.addrs[0]
+    tag         = "topic=" + item.topic.replace('/', '_')
+    value       = item.message
+
+    if item.config.get('fields'):
+        return format_point(srv, item, measurement, tag)
+
+    # influxdb line protocol:
+    # measurement,tagKey1=tagVal1,tagKey2=tagVal2 field1=value1,field2=value2 Timestamp
+    # sample format in .ini file; no quotes
+
+    if (item.message == item.payload) or (not (' ' in  item.message) and not (',' in item.message)):
+        # if no format has been set, default to "value={payload}"
+        # or if format has been set to output simple value, without additional tags or multiple fields
+        # format = {json_attribute}
+        return measurement + ',' + tag + ' value=' + value
+
+    elif (',' in item.message) and (not ' ' in item.message):
+        # if format does not include any additional tags or a timestamp, but includes one or multiple non-default fields
+        # format = field1=value1,field2=value2
+        return measurement + ',' + tag + ' ' + item.message
+
+    else:
+        # if format includes additional tags and one or multiple non-default fields and an optional timestamp, either group separated by whitespace from each other
+        # format = tagKey1=tagVal1,tagKey2=tagVal2 field1=value1,field2=value2
+        return measurement + ',' + tag + ',' + item.message
+
+
+def has_timestamp(line):
+    parts = line.rsplit(' ', 2)
+    return len(parts) == 3 and parts[2].isdigit()
+
+
+def timestamp(item, precision):
+    ''' The time the message of an item has been received, in units of the timestamp precision '''
+    try:
+        received = datetime.strptime(item.data['_dtiso'], "%Y-%m-%dT%H:%M:%S.%fZ")
+        micros = calendar.timegm(received.timetuple()) * 10 ** 6 + received.microsecond
+    except Exception:
+        micros = time.time_ns() // 1000
+    if precision not in PRECISION_MICROSECONDS:
+        return micros * 1000
+    return micros // PRECISION_MICROSECONDS[precision]
+
+
+def write(srv, item, url, lines):
+    ''' Send line-protocol records to InfluxDB, retrying failed requests with backoff '''
+
+    username    = item.config['username']
+    password    = item.config['password']
+    retries     = int(item.config.get('retries', 2))
+    backoff     = float(item.config.get('retry_backoff', 0.5))
+
+    data = '\n'.join(lines).encode('utf-8')
+    headers = {}
+    if item.config.get('gzip', False):
+        data = gzip.compress(data)
+        headers['Content-Encoding'] = 'gzip'
+
+    session = getattr(srv, 'state', None) or requests
+    auth = None if username is None else (username, password)
+
+    srv.logging.debug(url)
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            r = session.post(url, data=data, headers=headers, auth=auth)
+        except Exception as e:
+            srv.logging.warning("Failed to send POST request to InfluxDB server using %s: %s" % (url, e))
+            continue
+
         # success
         if r.status_code == 204:
             return True
-            
+
         # request accepted but couldn't be completed (200) or failed (otherwise)
         if r.status_code == 200:
-            srv.logging.warn("POST request could not be completed: %s" % (r.text))
+            srv.logging.warning("POST request could not be completed: %s" % (r.text))
         else:
-            srv.logging.warn("POST request failed: (%s) %s" % (r.status_code, r.text))
-        
-    except Exception as e:
-        srv.logging.warn("Failed to send POST request to InfluxDB server using %s: %s" % (url, e))
+            srv.logging.warning("POST request failed: (%s) %s" % (r.status_code, r.text))
+
+        # only retry when the server is unavailable or overloaded
+        if r.status_code < 500 and r.status_code != 429:
+            break
 
     return False
+
+
+def plugin(srv, item):
+    ''' addrs: (measurement) '''
+
+    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
+
+    try:
+        url, precision = write_url(item)
+        data = format_line(srv, item)
+    except Exception as e:
+        srv.logging.warning("InfluxDB target incorrectly configured: %s" % e)
+        return False
+    if data is None:
+        return False
+
+    srv.logging.debug(data)
+    return write(srv, item, url, [data])
+
+
+def plugin_batch(srv, items):
+    ''' Write the points of a batch of items, using one request per database, rp, and precision '''
+
+    srv.logging.debug("*** MODULE=%s: batch of %s items", __file__, len(items))
+
+    outcomes = [False] * len(items)
+    writes = {}
+    for index, item in enumerate(items):
+        try:
+            url, precision = write_url(item)
+            line = format_line(srv, item)
+        except Exception as e:
+            srv.logging.warning("InfluxDB target incorrectly configured: %s" % e)
+            continue
+        if line is None:
+            continue
+
+        # Points without timestamps would all get the same one from the server.
+        if not has_timestamp(line):
+            line += ' %d' % timestamp(item, precision)
+        writes.setdefault(url, []).append((index, line))
+
+    for url, points in writes.items():
+        if write(srv, items[points[0][0]], url, [line for _, line in points]):
+            for index, _ in points:
+                outcomes[index] = True
+
+    return outcomes
@@ -5,62 +5,29 @@ __author__ = 'Jan-Piet Mens <jpmens()gmail.com>'
 __copyright__ = 'Copyright 2014 Jan-Piet Mens'
 __license__ = 'Eclipse Public License - v 1.0 (http://www.eclipse.org/legal/epl-v10.html)'
 
-import MySQLdb  # ty: ignore[unresolved-import, unused-ignore-comment, unused-ignore-comment]
+from mqttwarn.services.mysql_util import add_table_rows, close_pool, open_pool, store_rows
 
+# Deliver items one by one, unless enabled by the `batch` option.
+batch_default = False
 
-# https://mail.python.org/pipermail/tutor/2010-December/080701.html
-def add_row(srv, cursor, tablename, rowdict):
-    # XXX tablename not sanitized
-    # XXX test for allowed keys is case-sensitive
 
-    unknown_keys = None
+def setup(srv, config):
+    return open_pool(config)
 
-    # filter out keys that are not column names
-    cursor.execute("describe %s" % tablename)
-    allowed_keys = set(row[0] for row in cursor.fetchall())
-    keys = allowed_keys.intersection(rowdict)
 
-    if len(rowdict) > len(keys):
-        unknown_keys = set(rowdict) - allowed_keys
+def teardown(srv):
+    close_pool(srv.state)
 
-    columns = ", ".join(keys)
-    values_template = ", ".join(["%s"] * len(keys))
 
-    sql = "insert into %s (%s) values (%s)" % (tablename, columns, values_template)
-    values = tuple(rowdict[key] for key in keys)
-    srv.logging.debug("adding row with sql '%s' and values: %s", sql, values)
-    cursor.execute(sql, values)
-
-    return unknown_keys
-
-
-def plugin(srv, item):
-    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
-
-    host = item.config.get('host', 'localhost')
-    port = item.config.get('port', 3306)
-    user = item.config.get('user')
-    passwd = item.config.get('pass')
-    dbname = item.config.get('dbname')
-    srv.logging.debug("Connecting to MySql host '%s' and database '%s' as user '%s'", host, dbname, user)
+def decode_item(srv, item):
+    """ Return the table name and column data of an item, or `None` when misconfigured """
 
     try:
         table_name = item.addrs[0].format(**item.data)
         fallback_col = item.addrs[1].format(**item.data)
     except:
-        srv.logging.warn("mysql target incorrectly configured")
-        return False
-
-    try:
-        conn = MySQLdb.connect(host=host,
-                               user=user,
-                               passwd=passwd,
-                               db=dbname,
-                               port=port)
-        cursor = conn.cursor()
-    except Exception as e:
-        srv.logging.warn("Cannot connect to mysql: %s" % e)
-        return False
+        srv.logging.warning("mysql target incorrectly configured")
+        return None
 
     text = item.message
 
@@ -71,7 +38,7 @@ def plugin(srv, item):
     }
 
     if fallback_col == 'NOP':
-        del (col_data['fallback_col'])
+        del (col_data[fallback_col])
 
     if item.data is not None:
         for key in list(item.data.keys()):
@@ -80,18 +47,22 @@ def plugin(srv, item):
             except Exception as e:
                 col_data[key] = item.data[key]
 
-    try:
-        unknown_keys = add_row(srv, cursor, table_name, col_data)
-        if unknown_keys is not None:
-            srv.logging.debug("Skipping unused keys %s" % ",".join(unknown_keys))
-        conn.commit()
-    except Exception as e:
-        srv.logging.warn("Cannot add mysql row: %s" % e)
-        cursor.close()
-        conn.close()
+    return table_name, col_data
+
+
+def plugin(srv, item):
+    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
+
+    decoded = decode_item(srv, item)
+    if decoded is None:
         return False
+    table_name, col_data = decoded
+
+    return store_rows(srv, item, table_name, [col_data])
+
 
-    cursor.close()
-    conn.close()
+def plugin_batch(srv, items):
+    """ Insert the rows of a batch of items, using one transaction per table """
 
-    return True
+    srv.logging.debug("*** MODULE=%s: batch of %s items", __file__, len(items))
+    return add_table_rows(srv, items, decode_item)
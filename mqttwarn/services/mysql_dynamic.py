@@ -15,8 +15,21 @@ import time
 import traceback
 import MySQLdb  # ty: ignore[unresolved-import, unused-ignore-comment, unused-ignore-comment]
 
+from mqttwarn.services.mysql_util import close_pool, open_pool, pool_for
 
-def add_row(srv, cursor, index_table_name, table_name, rowdict, ignorekeys):
+# Deliver items one by one, unless enabled by the `batch` option.
+batch_default = False
+
+
+def setup(srv, config):
+    return open_pool(config)
+
+
+def teardown(srv):
+    close_pool(srv.state)
+
+
+def clean_keys(rowdict, ignorekeys):
     keys = []
     clean_key = re.compile(r'[^\d\w_-]+')
     for k, v in list(rowdict.items()):
@@ -25,89 +38,89 @@ def add_row(srv, cursor, index_table_name, table_name, rowdict, ignorekeys):
 
         key = clean_key.sub('', k)
         keys.append({'ori': k, 'clean': key})
+    return keys
+
+
+def create_table(srv, cursor, table_name, keys, rowdict):
+    colspec = ['`id` INT AUTO_INCREMENT']
+    for k in keys:
+        if isinstance(rowdict[k['ori']], int):
+            colspec.append('`%s` LONG' % k['clean'])
+        elif isinstance(rowdict[k['ori']], (float)):
+            colspec.append('`%s` FLOAT' % k['clean'])
+        else:
+            colspec.append('`%s` TEXT' % k['clean'])
+
+    query = 'create table `%s` (' % table_name
+    query += ','.join(colspec)
+    query += ', PRIMARY KEY ID(`id`)) CHARSET=utf8'
 
     try:
-        cursor.execute("describe %s" % table_name)
+        cursor.execute(query)
     except Exception as e:
-        colspec = ['`id` INT AUTO_INCREMENT']
-        for k in keys:
-            if isinstance(rowdict[k['ori']], int):
-                colspec.append('`%s` LONG' % k['clean'])
-            elif isinstance(rowdict[k['ori']], (float)):
-                colspec.append('`%s` FLOAT' % k['clean'])
-            else:
-                colspec.append('`%s` TEXT' % k['clean'])
-
-        query = 'create table `%s` (' % table_name
-        query += ','.join(colspec)
-        query += ', PRIMARY KEY ID(`id`)) CHARSET=utf8'
-
-        try:
-            cursor.execute(query)
-        except Exception as e:
-            srv.logging.warn("Mysql target incorrectly configured. Could not create table %s: %s" % table_name, e)
-            return False
-    try:
-        columns = ''
-        values_template = ''
-        sql = ''
-        values = tuple()
+        srv.logging.warning("Mysql target incorrectly configured. Could not create table %s: %s" % (table_name, e))
+        return False
+    return True
 
-        for i in range(len(keys)):
-            if i > 0:
-                columns += ","
-                values_template += ","
 
-            columns += " " + keys[i]['clean']
-            values_template += " %s"
-            values += (MySQLdb._mysql.escape_string(str(rowdict[keys[i]['ori']])),)
+def add_rows(srv, pool, cursor, table_name, rows):
+    """
+    Insert rows into a table, creating it when it does not exist yet, using
+    one `executemany` per set of columns. `rows` are pairs of column data and
+    keys to ignore.
+    """
+    entries = [(clean_keys(rowdict, ignorekeys), rowdict) for rowdict, ignorekeys in rows]
 
-        sql = "insert into %s (%s) values (%s)" % (table_name, columns, values_template)
+    # Whether the table exists is cached, it is only described on first use.
+    try:
+        pool.table_columns(cursor, table_name)
+    except Exception:
+        keys, rowdict = entries[0]
+        if not create_table(srv, cursor, table_name, keys, rowdict):
+            return False
 
-        cursor.execute(sql, values)
-    except Exception as e:
-        srv.logging.warn("Could not insert value into table %s. Query: %s, values: %s, Error: %s" % \
-                         (table_name, sql, values, e))
-        return False
+    groups = {}
+    for keys, rowdict in entries:
+        columns = tuple(k['clean'] for k in keys)
+        values = tuple(MySQLdb._mysql.escape_string(str(rowdict[k['ori']])) for k in keys)
+        groups.setdefault(columns, []).append(values)
 
+    sql = ''
+    values = []
     try:
-        now = time.strftime('%Y-%m-%d %H:%M:%S')
-        query = 'insert into %s set topic="%s", ts="%s" on duplicate key update ts="%s"' % \
-                (index_table_name, table_name, now, now)
-        cursor.execute(query)
+        for columns, values in groups.items():
+            sql = "insert into %s (%s) values (%s)" % (table_name, ", ".join(columns), ", ".join(["%s"] * len(columns)))
+            cursor.executemany(sql, values)
     except Exception as e:
-        srv.logging.warn("Could not insert value into index table %s" % \
-                         index_table_name)
+        pool.invalidate(table_name)
+        srv.logging.warning("Could not insert value into table %s. Query: %s, values: %s, Error: %s" % \
+                            (table_name, sql, values, e))
+        return False
 
     return True
 
 
-def plugin(srv, item):
-    srv.logging.debug("*** MODULE=%s: service=%s target=%s", __file__, item.service, item.target)
+def touch_index(srv, cursor, index_table_name, table_names):
+    """
+    Update the timestamp of tables in the index table, using one statement for all of them.
+    """
+    try:
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        query = 'insert into %s (topic, ts) values %s on duplicate key update ts=values(ts)' % \
+                (index_table_name, ", ".join(["(%s, %s)"] * len(table_names)))
+        cursor.execute(query, tuple(value for table_name in table_names for value in (table_name, now)))
+    except Exception as e:
+        srv.logging.warning("Could not insert value into index table %s" % \
+                            index_table_name)
 
-    host = item.config.get('host', 'localhost')
-    port = item.config.get('port', 3306)
-    user = item.config.get('user')
-    passwd = item.config.get('pass')
-    dbname = item.config.get('dbname')
-    index_table_name = item.config.get('index')
-    # ignore_keys = item.config.get('ignore_')
+
+def decode_item(srv, item):
+    """ Return the sanitized table name and column data of an item """
 
     # Sanitize table_name
     table_name = item.data['topic'].replace('/', '_')
     table_name = re.compile(r'[^\d\w_]+').sub('', table_name)
 
-    try:
-        conn = MySQLdb.connect(host=host,
-                               user=user,
-                               passwd=passwd,
-                               db=dbname,
-                               port=port)
-        cursor = conn.cursor()
-    except Exception as e:
-        srv.logging.warn("Cannot connect to mysql: %s" % e)
-        return False
-
     # Create new dict for column data. First add fallback column
     # with full payload. Then attempt to use formatted JSON values
     col_data = {}
@@ -119,20 +132,62 @@ def plugin(srv, item):
                     col_data[key] = item.data[key].format(**item.data).encode('utf-8')
             except Exception as e:
                 col_data[key] = item.data[key]
+
+    return table_name, col_data
+
+
+def store_rows(srv, item, tables):
+    """
+    Insert rows into their tables within one transaction, and update the index
+    table once for all of them. `tables` maps table names to their rows.
+
+    Return the names of the tables which have been updated.
+    """
+    index_table_name = item.config.get('index')
+    stored = []
+
     try:
-        result = add_row(srv, cursor, index_table_name, table_name, col_data, item.addrs)
-        if not result:
-            srv.logging.debug("Failed building values to add to database")
-        else:
-            conn.commit()
+        with pool_for(srv, item) as pool:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    for table_name, rows in tables.items():
+                        if add_rows(srv, pool, cursor, table_name, rows):
+                            stored.append(table_name)
+                        else:
+                            srv.logging.debug("Failed building values to add to database")
+                    if stored:
+                        touch_index(srv, cursor, index_table_name, stored)
+                finally:
+                    cursor.close()
+                if stored:
+                    conn.commit()
     except Exception as e:
-        srv.logging.warn("Cannot add mysql row: %s" % e)
+        srv.logging.warning("Cannot add mysql row: %s" % e)
         traceback.print_exc()
-        cursor.close()
-        conn.close()
-        return False
+        return []
 
-    cursor.close()
-    conn.close()
+    return stored
 
-    return True
+
+def plugin(srv, item):
+    srv.logging.debug("*** MODULE=%s: service=%s target=%s", __file__, item.service, item.target)
+
+    table_name, col_data = decode_item(srv, item)
+    return bool(store_rows(srv, item, {table_name: [(col_data, item.addrs)]}))
+
+
+def plugin_batch(srv, items):
+    """ Insert the rows of a batch of items within one transaction, and update the index table once """
+
+    srv.logging.debug("*** MODULE=%s: batch of %s items", __file__, len(items))
+
+    tables = {}
+    table_names = []
+    for item in items:
+        table_name, col_data = decode_item(srv, item)
+        tables.setdefault(table_name, []).append((col_data, item.addrs))
+        table_names.append(table_name)
+
+    stored = set(store_rows(srv, items[0], tables))
+    return [table_name in stored for table_name in table_names]
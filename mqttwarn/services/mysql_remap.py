@@ -5,32 +5,18 @@ __author__    = 'Halacs <halacs87()gmail.com>'
 __copyright__ = 'Copyright 2018 Halacs'
 __license__   = 'Eclipse Public License - v 1.0 (http://www.eclipse.org/legal/epl-v10.html)'
 
-import MySQLdb  # ty: ignore[unresolved-import, unused-ignore-comment, unused-ignore-comment]
+from mqttwarn.services.mysql_util import add_table_rows, close_pool, open_pool, store_rows
 
+# Deliver items one by one, unless enabled by the `batch` option.
+batch_default = False
 
-# https://mail.python.org/pipermail/tutor/2010-December/080701.html
-def add_row(srv, cursor, tablename, rowdict):
-    # XXX tablename not sanitized
-    # XXX test for allowed keys is case-sensitive
 
-    unknown_keys = None
+def setup(srv, config):
+    return open_pool(config)
 
-    # filter out keys that are not column names
-    cursor.execute("describe %s" % tablename)
-    allowed_keys = set(row[0] for row in cursor.fetchall())
-    keys = allowed_keys.intersection(rowdict)
 
-    if len(rowdict) > len(keys):
-        unknown_keys = set(rowdict) - allowed_keys
-
-    columns = ", ".join(keys)
-    values_template = ", ".join(["%s"] * len(keys))
-
-    sql = "insert into %s (%s) values (%s)" % (tablename, columns, values_template)
-    values = tuple(rowdict[key] for key in keys)
-    cursor.execute(sql, values)
-
-    return unknown_keys
+def teardown(srv):
+    close_pool(srv.state)
 
 
 def daraFv(srv, item, data, col_data, mapping):
@@ -46,30 +32,16 @@ def daraFv(srv, item, data, col_data, mapping):
                         col_data[mapping[key]] = data[key]
 
 
-def plugin(srv, item):
-
-    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
-
-    host    = item.config.get('host', 'localhost')
-    port    = item.config.get('port', 3306)
-    user    = item.config.get('user')
-    passwd  = item.config.get('pass')
-    dbname  = item.config.get('dbname')
+def decode_item(srv, item):
+    """ Return the table name and remapped column data of an item, or `None` when misconfigured """
 
     try:
         table_name = item.addrs[0].format(**item.data).encode('utf-8')
         mapping = item.addrs[1]
         static = item.addrs[2]
     except:
-        srv.logging.warn("halsql target incorrectly configured.")
-        return False
-
-    try:
-        conn = MySQLdb.connect(host=host, user=user, passwd=passwd, db=dbname, port=port)
-        cursor = conn.cursor()
-    except Exception as e:
-        srv.logging.warn("Cannot connect to mysql: %s" % e)
-        return False
+        srv.logging.warning("halsql target incorrectly configured.")
+        return None
 
     col_data = {}
 
@@ -80,20 +52,25 @@ def plugin(srv, item):
     if static is not None:
         col_data = dict(list(col_data.items()) + list(static.items()))
 
-    try:
-        unknown_keys = add_row(srv, cursor, table_name, col_data)
-        if unknown_keys is not None:
-            srv.logging.debug("Skipping unused keys %s" % ",".join(unknown_keys))
-        conn.commit()
-    except Exception as e:
-        srv.logging.warn("Cannot add mysql row: %s" % e)
-        cursor.close()
-        conn.close()
+    return table_name, col_data
+
+
+def plugin(srv, item):
+
+    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
+
+    decoded = decode_item(srv, item)
+    if decoded is None:
         return False
+    table_name, col_data = decoded
+
+    return store_rows(srv, item, table_name, [col_data])
+
 
-    cursor.close()
-    conn.close()
+def plugin_batch(srv, items):
+    """ Insert the rows of a batch of items, using one transaction per table """
 
-    return True
+    srv.logging.debug("*** MODULE=%s: batch of %s items", __file__, len(items))
+    return add_table_rows(srv, items, decode_item)
 
 # vim: tabstop=4 expandtab
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import queue
+import threading
+from contextlib import contextmanager
+
+import MySQLdb  # ty: ignore[unresolved-import]
+
+# Pools are shared by all MySQL services connecting to the same database.
+pools = {}
+pools_lock = threading.Lock()
+
+
+class MySQLPool:
+    """
+    A bounded pool of connections to a MySQL database, and a cache of the columns of its tables.
+
+    Connections are established on demand, and are reused, up to `size` connections.
+    Callers wait for a connection when all of them are in use. Connections which
+    failed are discarded, and idle connections are checked before being reused,
+    because the server closes them after `wait_timeout` seconds.
+    """
+
+    def __init__(self, host='localhost', port=3306, user=None, passwd=None, db=None, size=4):
+        self.params = dict(host=host, port=int(port), user=user, passwd=passwd, db=db)
+        self.size = size
+        self.users = 0
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.columns = {}
+        self.lock = threading.Lock()
+
+    def connect(self):
+        return MySQLdb.connect(**{key: value for key, value in self.params.items() if value is not None})
+
+    def checkout(self):
+        """
+        Return an idle connection, replacing it when the server has gone away in the meantime,
+        or a new connection.
+        """
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+        try:
+            conn.ping()
+            return conn
+        except MySQLdb.Error:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return self.connect()
+
+    @contextmanager
+    def connection(self):
+        with self.slots:
+            conn = self.checkout()
+            try:
+                yield conn
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                conn.close()
+                raise
+            else:
+                self.idle.put(conn)
+
+    def table_columns(self, cursor, tablename):
+        """
+        Return the column names of a table, querying them on first use.
+        """
+        with self.lock:
+            columns = self.columns.get(tablename)
+        if columns is None:
+            cursor.execute("describe %s" % tablename)
+            columns = frozenset(row[0] for row in cursor.fetchall())
+            with self.lock:
+                self.columns[tablename] = columns
+        return columns
+
+    def invalidate(self, tablename):
+        """
+        Forget the columns of a table, for example after inserting into it failed.
+        """
+        with self.lock:
+            self.columns.pop(tablename, None)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def open_pool(config):
+    """
+    Return the pool of connections to the database configured by a service section,
+    shared with other services connecting to the same database.
+    """
+    params = dict(
+        host=config.get('host', 'localhost'),
+        port=int(config.get('port', 3306)),
+        user=config.get('user'),
+        passwd=config.get('pass'),
+        db=config.get('dbname'),
+    )
+    key = tuple(sorted(params.items()))
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is None:
+            pool = pools[key] = MySQLPool(size=int(config.get('pool_size', 4)), **params)
+        pool.users += 1
+        return pool
+
+
+def close_pool(pool):
+    """
+    Release a pool returned by `open_pool`, closing its connections when it is not used anymore.
+    """
+    if pool is None:
+        return
+    with pools_lock:
+        pool.users -= 1
+        if pool.users > 0:
+            return
+        for key, candidate in list(pools.items()):
+            if candidate is pool:
+                del pools[key]
+    pool.close()
+
+
+@contextmanager
+def pool_for(srv, item):
+    """
+    Provide the pool of a service, or a pool for a single use, when the service has not been set up.
+    """
+    pool = getattr(srv, 'state', None)
+    if pool is not None:
+        yield pool
+        return
+    pool = MySQLPool(
+        host=item.config.get('host', 'localhost'),
+        port=item.config.get('port', 3306),
+        user=item.config.get('user'),
+        passwd=item.config.get('pass'),
+        db=item.config.get('dbname'),
+        size=1,
+    )
+    try:
+        yield pool
+    finally:
+        pool.close()
+
+
+def insert_rows(srv, cursor, tablename, rowdicts, allowed_keys):
+    """
+    Insert rows into a table, using one multi-row `executemany` per set of columns.
+
+    Return the keys which are not columns of the table.
+    """
+    groups = {}
+    unknown_keys = set()
+    for rowdict in rowdicts:
+        keys = tuple(sorted(allowed_keys.intersection(rowdict)))
+        unknown_keys.update(set(rowdict) - allowed_keys)
+        groups.setdefault(keys, []).append(tuple(rowdict[key] for key in keys))
+
+    for keys, rows in groups.items():
+        columns = ", ".join(keys)
+        values_template = ", ".join(["%s"] * len(keys))
+        sql = "insert into %s (%s) values (%s)" % (tablename, columns, values_template)
+        srv.logging.debug("adding %s rows with sql '%s'", len(rows), sql)
+        cursor.executemany(sql, rows)
+
+    return unknown_keys
+
+
+def store_rows(srv, item, tablename, rowdicts):
+    """
+    Insert rows into a table within one transaction, using a pooled connection,
+    and the cached columns of the table.
+    """
+    try:
+        with pool_for(srv, item) as pool:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    allowed_keys = pool.table_columns(cursor, tablename)
+                    unknown_keys = insert_rows(srv, cursor, tablename, rowdicts, allowed_keys)
+                except Exception:
+                    pool.invalidate(tablename)
+                    raise
+                finally:
+                    cursor.close()
+                conn.commit()
+    except Exception as e:
+        srv.logging.warning("Cannot add %s mysql rows to %s: %s" % (len(rowdicts), tablename, e))
+        return False
+
+    if unknown_keys:
+        srv.logging.debug("Skipping unused keys %s" % ",".join(unknown_keys))
+    return True
+
+
+def add_table_rows(srv, items, decode_item):
+    """
+    Insert the rows of a batch of items, grouped by table, using one transaction per table.
+
+    `decode_item(srv, item)` returns the table name and column data of an item,
+    or `None` when it can not be stored. Return the outcomes per item.
+    """
+    outcomes = [False] * len(items)
+    tables = {}
+    for index, item in enumerate(items):
+        decoded = decode_item(srv, item)
+        if decoded is not None:
+            tablename, rowdict = decoded
+            tables.setdefault(tablename, []).append((index, rowdict))
+
+    for tablename, rows in tables.items():
+        if store_rows(srv, items[rows[0][0]], tablename, [rowdict for _, rowdict in rows]):
+            for index, _ in rows:
+                outcomes[index] = True
+
+    return outcomes
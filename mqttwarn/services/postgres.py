@@ -14,28 +14,118 @@ __license__   = 'Eclipse Public License - v 1.0 (http://www.eclipse.org/legal/ep
 # user    = 'username'
 # pass    = 'password'
 # dbname  = 'databasename'
+# pool_size = 4         # optional, maximum number of pooled connections
+# batch   = ['target1'] # optional, targets written using multi-row inserts
 # targets = {
 #    'target1': ['table1', 'fallbackcol1', 'schema']
 #  }
 
 
+import threading
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
 
+# Deliver items one by one, unless enabled by the `batch` option.
+batch_default = False
 
-def add_row(cursor, tablename, rowdict, schema):
-    # XXX tablename not sanitized
-    # XXX test for allowed keys is case-sensitive
 
-    unknown_keys = None
+class PostgresState:
+    """ Pooled connections, and the cached column names per schema and table """
 
-    # filter out keys that are not column names
+    def __init__(self, config):
+        self.pool_size = int(config.get('pool_size', 4))
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            0,
+            self.pool_size,
+            host=config.get('host', 'localhost'),
+            port=config.get('port', 5432),
+            user=config.get('user'),
+            password=config.get('pass'),
+            database=config.get('dbname'))
+        # The pool fails when it is exhausted, so let callers wait for a connection instead.
+        self.slots = threading.BoundedSemaphore(self.pool_size)
+        self.columns = {}
+        self.lock = threading.Lock()
+
+    def checkout(self):
+        """ Take a connection from the pool, replacing it when the server has closed it while idle """
+        conn = self.pool.getconn()
+        try:
+            if not conn.closed:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                return conn
+        except psycopg2.Error:
+            pass
+        self.pool.putconn(conn, close=True)
+        return self.pool.getconn()
+
+    @contextmanager
+    def connection(self):
+        with self.slots:
+            conn = self.checkout()
+            close = False
+            try:
+                yield conn
+            except Exception:
+                # Discard connections which are not usable anymore.
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+                raise
+            finally:
+                self.pool.putconn(conn, close=close or bool(conn.closed))
+
+    def allowed_columns(self, cursor, tablename, schema):
+        key = (schema, tablename)
+        with self.lock:
+            columns = self.columns.get(key)
+        if columns is None:
+            columns = query_columns(cursor, tablename, schema)
+            with self.lock:
+                self.columns[key] = columns
+        return columns
+
+    def invalidate(self, tablename, schema):
+        with self.lock:
+            self.columns.pop((schema, tablename), None)
+
+    def close(self):
+        self.pool.closeall()
+
+
+def setup(srv, config):
+    return PostgresState(config)
+
+
+def teardown(srv):
+    if srv.state is not None:
+        srv.state.close()
+
+
+def query_columns(cursor, tablename, schema):
     cursor.execute(
         "SELECT column_name \
         FROM INFORMATION_SCHEMA.COLUMNS \
-        where table_schema = '%s' AND table_name = '%s'" % (
+        where table_schema = %s AND table_name = %s", (
         schema, tablename))
-    allowed_keys = set(row[0] for row in cursor.fetchall())
-    keys = allowed_keys.intersection(rowdict)
+    return frozenset(row[0] for row in cursor.fetchall())
+
+
+def add_row(cursor, tablename, rowdict, schema, allowed_keys=None):
+    # XXX tablename not sanitized
+    # XXX test for allowed keys is case-sensitive
+
+    unknown_keys = None
+
+    # filter out keys that are not column names
+    if allowed_keys is None:
+        allowed_keys = query_columns(cursor, tablename, schema)
+    keys = sorted(allowed_keys.intersection(rowdict))
 
     if len(rowdict) > len(keys):
         unknown_keys = set(rowdict) - allowed_keys
@@ -51,15 +141,21 @@ def add_row(cursor, tablename, rowdict, schema):
     return unknown_keys
 
 
-def plugin(srv, item):
+def add_rows(cursor, tablename, rowdicts, schema, allowed_keys):
+    """ Insert many rows using multi-row inserts, grouped by their set of columns """
 
-    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
+    groups = {}
+    for rowdict in rowdicts:
+        keys = tuple(sorted(allowed_keys.intersection(rowdict)))
+        groups.setdefault(keys, []).append(tuple(rowdict[key] for key in keys))
+
+    for keys, rows in groups.items():
+        sql = "insert into %s.%s (%s) values %%s" % (schema, tablename, ", ".join(keys))
+        psycopg2.extras.execute_values(cursor, sql, rows)
 
-    host    = item.config.get('host', 'localhost')
-    port    = item.config.get('port', 5432)
-    user    = item.config.get('user')
-    passwd  = item.config.get('pass')
-    dbname  = item.config.get('dbname')
+
+def decode_item(srv, item):
+    """ Return the table name, schema, and column data of an item, or `None` when misconfigured """
 
     try:
         table_name = item.addrs[0].format(**item.data)
@@ -69,19 +165,8 @@ def plugin(srv, item):
         except:
             schema = 'public'
     except:
-        srv.logging.warn("postgres target incorrectly configured")
-        return False
-
-    try:
-        conn = psycopg2.connect(host=host,
-                    port=port,
-                    user=user,
-                    password=passwd,
-                    database=dbname)
-        cursor = conn.cursor()
-    except Exception as e:
-        srv.logging.warn("Cannot connect to postgres: %s" % e)
-        return False
+        srv.logging.warning("postgres target incorrectly configured")
+        return None
 
     text = item.message
 
@@ -98,13 +183,61 @@ def plugin(srv, item):
             except Exception as e:
                 col_data[key] = item.data[key]
 
+    return table_name, schema, col_data
+
+
+def plugin(srv, item):
+
+    srv.logging.debug("*** MODULE=%s: service=%s, target=%s", __file__, item.service, item.target)
+
+    decoded = decode_item(srv, item)
+    if decoded is None:
+        return False
+    table_name, schema, col_data = decoded
+
+    state = getattr(srv, 'state', None)
+    if state is not None:
+        try:
+            with state.connection() as conn:
+                with conn.cursor() as cursor:
+                    try:
+                        allowed_keys = state.allowed_columns(cursor, table_name, schema)
+                        unknown_keys = add_row(cursor, table_name, col_data, schema, allowed_keys)
+                    except Exception:
+                        state.invalidate(table_name, schema)
+                        raise
+                conn.commit()
+        except Exception as e:
+            srv.logging.warning("Cannot add postgres row: %s" % e)
+            return False
+        if unknown_keys is not None:
+            srv.logging.debug("Skipping unused keys %s" % ",".join(unknown_keys))
+        return True
+
+    host    = item.config.get('host', 'localhost')
+    port    = item.config.get('port', 5432)
+    user    = item.config.get('user')
+    passwd  = item.config.get('pass')
+    dbname  = item.config.get('dbname')
+
+    try:
+        conn = psycopg2.connect(host=host,
+                    port=port,
+                    user=user,
+                    password=passwd,
+                    database=dbname)
+        cursor = conn.cursor()
+    except Exception as e:
+        srv.logging.warning("Cannot connect to postgres: %s" % e)
+        return False
+
     try:
         unknown_keys = add_row(cursor, table_name, col_data, schema)
         if unknown_keys is not None:
             srv.logging.debug("Skipping unused keys %s" % ",".join(unknown_keys))
         conn.commit()
     except Exception as e:
-        srv.logging.warn("Cannot add postgres row: %s" % e)
+        srv.logging.warning("Cannot add postgres row: %s" % e)
         cursor.close()
         conn.close()
         return False
@@ -113,3 +246,40 @@ def plugin(srv, item):
     conn.close()
 
     return True
+
+
+def plugin_batch(srv, items):
+    """ Insert the rows of a batch of items, using one transaction per table """
+
+    srv.logging.debug("*** MODULE=%s: batch of %s items", __file__, len(items))
+
+    state = getattr(srv, 'state', None)
+    if state is None:
+        return [plugin(srv, item) for item in items]
+
+    outcomes = [False] * len(items)
+    tables = {}
+    for index, item in enumerate(items):
+        decoded = decode_item(srv, item)
+        if decoded is not None:
+            table_name, schema, col_data = decoded
+            tables.setdefault((schema, table_name), []).append((index, col_data))
+
+    for (schema, table_name), rows in tables.items():
+        try:
+            with state.connection() as conn:
+                with conn.cursor() as cursor:
+                    try:
+                        allowed_keys = state.allowed_columns(cursor, table_name, schema)
+                        add_rows(cursor, table_name, [col_data for _, col_data in rows], schema, allowed_keys)
+                    except Exception:
+                        state.invalidate(table_name, schema)
+                        raise
+                conn.commit()
+        except Exception as e:
+            srv.logging.warning("Cannot add %s postgres rows to %s.%s: %s" % (len(rows), schema, table_name, e))
+            continue
+        for index, _ in rows:
+            outcomes[index] = True
+
+    return outcomes
@@ -8,6 +8,19 @@ __license__   = 'Eclipse Public License - v 1.0 (http://www.eclipse.org/legal/ep
 import redis
 
 
+def setup(srv, config):
+    """ Create a Redis client once, whose connection pool is reused by all notifications """
+
+    host = config.get('host', 'localhost')
+    port = int(config.get('port', 6379))
+    return redis.Redis(host, port)
+
+
+def teardown(srv):
+    if srv.state is not None:
+        srv.state.connection_pool.disconnect()
+
+
 def plugin(srv, item):
     """ redispub. Expects addrs to contain (channel) """
 
@@ -16,11 +29,13 @@ def plugin(srv, item):
     host = item.config.get('host', 'localhost')
     port = int(item.config.get('port', 6379))
 
-    try:
-        rp = redis.Redis(host, port)
-    except Exception as e:
-        srv.logging.warn("Cannot connect to redis on %s:%s : %s" % (host, port, e))
-        return False
+    rp = getattr(srv, 'state', None)
+    if rp is None:
+        try:
+            rp = redis.Redis(host, port)
+        except Exception as e:
+            srv.logging.warn("Cannot connect to redis on %s:%s : %s" % (host, port, e))
+            return False
 
     channel = item.addrs[0]
     text = item.message
@@ -7,11 +7,68 @@ __license__   = 'Eclipse Public License - v 1.0 (http://www.eclipse.org/legal/ep
 
 # Based on the great SQLITE code by Jan-Piet Mens.
 
-from builtins import str
-import sqlite3
 import unicodedata
 from six import string_types
 
+from mqttwarn.services.sqlite_util import SQLiteWriters, writer_for
+
+
+def setup(srv, config):
+    return SQLiteWriters(config)
+
+
+def teardown(srv):
+    if srv.state is not None:
+        srv.state.close()
+
+
+class TableSchema:
+    """
+    The columns of a table, the column names of JSON keys, and the statements
+    inserting rows into the table, by their column names.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.names = {}
+        self.statements = {}
+
+    def column_name(self, key):
+        """ Column name of a JSON key, normalized to ASCII once per key """
+        name = self.names.get(key)
+        if name is None:
+            name = self.names[key] = unicodedata.normalize('NFKD', key).encode('ascii', 'ignore').decode('ascii')
+        return name
+
+    def insert_statement(self, table, names):
+        statement = self.statements.get(names)
+        if statement is None:
+            statement = self.statements[names] = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                quote(table), ', '.join(quote(name) for name in names), ', '.join(['?'] * len(names)))
+        return statement
+
+
+def quote(identifier):
+    return '"%s"' % identifier.replace('"', '""')
+
+
+def column_type(value):
+    """ Rudimentary datatype of a column, or `None` for values which are not stored """
+    if isinstance(value, (int, float)):
+        return 'float'
+    elif isinstance(value, string_types):
+        return 'varchar(20)'
+    return None
+
+
+def table_schema(writer, conn, table):
+    """ Return the cached schema of a table, reading it from the database on first use """
+    schema = writer.tables.get(table)
+    if not isinstance(schema, TableSchema):
+        columns = set(row[1].lower() for row in conn.execute('PRAGMA table_info(%s)' % quote(table)))
+        schema = writer.tables[table] = TableSchema(columns)
+    return schema
+
 
 def plugin(srv, item):
     """ sqlite. Expects addrs to contain (path, tablename) """
@@ -20,63 +77,62 @@ def plugin(srv, item):
 
     path  = item.addrs[0]
     table = item.addrs[1]
-    try:
-        conn = sqlite3.connect(path)
-    except Exception as e:
-        srv.logging.warn("Cannot connect to sqlite at %s : %s" % (path, str(e)))
-        return False
 
-    table_cols =  {}
-    #determine datatypes
-    for key in item.data: #i.e. {"sensor_id":"testsensor","whatdata":"hello","data":1}"
-        if key[0] == '_' or key == 'payload' or key == 'topic': #we just want to save the payload there is probably a better way
+    #we just want to save the payload fields, i.e. {"sensor_id":"testsensor","whatdata":"hello","data":1}
+    fields = {}
+    for key, value in item.data.items():
+        if key[0] == '_' or key == 'payload' or key == 'topic':
             continue
-        else:
-            if isinstance(item.data[key],  (int, float)):
-                table_cols[key] = 'float'
-                item.data[key] = str(item.data[key]) #make str for sql
-            elif isinstance(item.data[key], string_types):
-                table_cols[key] = 'varchar(20)'
-                item.data[key] = "\'%s\'" % item.data[key] #add '' for sql
-
-    # derive sql rudimentary definition string in case the table has to be created
-    # i.e. 'key1 varchae(20), key2 varchar(20), key3 float'
-    col_definition = ''
-    for col in table_cols:
-        col_definition = col_definition + col + ' ' + table_cols[col] +','
-    col_definition = col_definition[:-1]
-    col_definition= unicodedata.normalize('NFKD', col_definition).encode('ascii','ignore')
-
-    #derive insert into string
-    # i.e. 'key1, key2, key3'
-    col_insert_into = ''
-    for val in table_cols:
-        col_insert_into  = col_insert_into + val + ','
-    col_insert_into  = col_insert_into[:-1]
-    col_insert_into= unicodedata.normalize('NFKD', col_insert_into).encode('ascii','ignore')
-
-    #derive value string
-    # i.e. '12, "hello", 23'
-    col_values = ''
-    for val in table_cols:
-        col_values = col_values + item.data[val] + ','
-    col_values = col_values[:-1]
-    col_values= unicodedata.normalize('NFKD', col_values).encode('ascii','ignore')
-
-    c = conn.cursor()
-    try:
-        srv.logging.debug("Inserting into SQLITE")
-        c.execute('CREATE TABLE IF NOT EXISTS %s (%s);' % (table, col_definition))
-    except Exception as e:
-        srv.logging.warn("Cannot create sqlite table in %s : %s" % (path, str(e)))
+        if column_type(value) is not None:
+            fields[key] = value
+
+    if not fields:
+        srv.logging.warning("Cannot INSERT INTO sqlite:%s : No JSON fields to store" % table)
         return False
 
+    def insert(conn):
+        schema = table_schema(writer, conn, table)
+
+        # Column names are case-insensitive, keep the first key of each column.
+        row = {}
+        for key, value in fields.items():
+            name = schema.column_name(key)
+            if name:
+                row.setdefault(name.lower(), (name, value))
+
+        # Add columns for new keys once, or create the table on first use.
+        added = {}
+        for column, (name, value) in row.items():
+            if column not in schema.columns:
+                added[column] = '%s %s' % (quote(name), column_type(value))
+        try:
+            if not schema.columns:
+                srv.logging.debug("Creating SQLITE table %s" % table)
+                conn.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (quote(table), ', '.join(added.values())))
+            else:
+                for definition in added.values():
+                    srv.logging.debug("Adding column %s to SQLITE table %s" % (definition, table))
+                    conn.execute('ALTER TABLE %s ADD COLUMN %s' % (quote(table), definition))
+        except Exception as e:
+            writer.forget_table(table)
+            srv.logging.warning("Cannot create sqlite table in %s : %s" % (path, e))
+            return False
+        schema.columns.update(added)
+
+        names = tuple(name for name, _ in row.values())
+        try:
+            srv.logging.debug("Inserting into SQLITE")
+            conn.execute(schema.insert_statement(table, names), tuple(value for _, value in row.values()))
+            srv.logging.debug("Inserted into SQLITE")
+        except Exception as e:
+            writer.forget_table(table)
+            srv.logging.warning("Cannot INSERT INTO sqlite:%s : %s" % (table, e))
+
+        return True
+
     try:
-        c.execute("INSERT INTO %s (%s) VALUES (%s);" % (table, col_insert_into, col_values))
-        conn.commit()
-        c.close()
-        srv.logging.debug("Inserted into SQLITE")
+        with writer_for(srv, path) as writer:
+            return writer.submit(insert, durable=srv.durable)
     except Exception as e:
-        srv.logging.warn("Cannot INSERT INTO sqlite:%s : %s" % (table, str(e)))
-
-    return True
+        srv.logging.warning("Cannot connect to sqlite at %s : %s" % (path, e))
+        return False
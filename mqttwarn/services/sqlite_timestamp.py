@@ -6,7 +6,16 @@ __author__    = 'Kuthullu Himself <kuthullu()gmail.com>'
 __copyright__ = 'Copyright 2016 Kuthullu Himself'
 __license__   = 'Eclipse Public License - v 1.0 (http://www.eclipse.org/legal/epl-v10.html)'
 
-import sqlite3
+from mqttwarn.services.sqlite_util import SQLiteWriters, writer_for
+
+
+def setup(srv, config):
+    return SQLiteWriters(config)
+
+
+def teardown(srv):
+    if srv.state is not None:
+        srv.state.close()
 
 
 def plugin(srv, item):
@@ -16,26 +25,26 @@ def plugin(srv, item):
 
     path  = item.addrs[0]
     table = item.addrs[1]
-    try:
-        conn = sqlite3.connect(path)
-    except Exception as e:
-        srv.logging.warn("Cannot connect to sqlite at %s : %s" % (path, e))
-        return False
+    text = item.message
 
-    c = conn.cursor()
-    try:
-        c.execute('CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT, timestamp DATETIME NOT NULL)' % table)
-    except Exception as e:
-        srv.logging.warn("Cannot create sqlite table in %s : %s" % (path, e))
-        return False
+    def insert(conn):
+        try:
+            writer.ensure_table(conn, table, 'CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT, timestamp DATETIME NOT NULL)' % table)
+        except Exception as e:
+            srv.logging.warning("Cannot create sqlite table in %s : %s" % (path, e))
+            return False
 
-    text = item.message
+        try:
+            conn.execute('INSERT INTO %s VALUES (NULL, ?, datetime(\'now\'))' % table, (text, ))
+        except Exception as e:
+            writer.forget_table(table)
+            srv.logging.warning("Cannot INSERT INTO sqlite:%s : %s" % (table, e))
+
+        return True
 
     try:
-        c.execute('INSERT INTO %s VALUES (NULL, ?, datetime(\'now\'))' % table, (text, ))
-        conn.commit()
-        c.close()
+        with writer_for(srv, path) as writer:
+            return writer.submit(insert, durable=srv.durable)
     except Exception as e:
-        srv.logging.warn("Cannot INSERT INTO sqlite:%s : %s" % (table, e))
-
-    return True
+        srv.logging.warning("Cannot connect to sqlite at %s : %s" % (path, e))
+        return False
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Writers are shared by all SQLite services writing to the same database file.
+writers = {}
+writers_lock = threading.Lock()
+
+
+class SQLiteWriter(threading.Thread):
+    """
+    The single writer of a SQLite database file.
+
+    The database is opened once, in WAL journal mode, by the writer thread, which
+    runs all write operations submitted by other threads, one after another. So,
+    several workers can share a database file without running into `database is
+    locked` errors.
+
+    Operations are committed in groups, after `commit_rows` rows have been written,
+    or `commit_interval` seconds after the first uncommitted row, whichever comes
+    first. Statements are prepared once, and reused from the statement cache of
+    the connection. The outcome of durable operations is only reported after
+    their changes have been committed.
+    """
+
+    def __init__(self, path, commit_rows=100, commit_interval=1.0):
+        super().__init__(name=f"mqttwarn-sqlite-{os.path.basename(path)}", daemon=True)
+        self.path = path
+        self.commit_rows = max(int(commit_rows), 1)
+        self.commit_interval = float(commit_interval)
+        self.users = 0
+        self.error = None
+
+        # Tables known to exist, only accessed by the writer thread.
+        self.tables = {}
+
+        self.requests = queue.Queue()
+        self.opened = threading.Event()
+
+    def run(self):
+        try:
+            conn = sqlite3.connect(self.path, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        except Exception as ex:
+            self.error = ex
+            self.opened.set()
+            return
+        self.opened.set()
+
+        committed = conn.total_changes
+        deadline = None
+        # Outcomes of durable operations, waiting for their changes to be committed.
+        pending = []
+        try:
+            while True:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    request = False
+                if request is None:
+                    break
+                if request:
+                    operation, future, durable = request
+                    try:
+                        result = operation(conn)
+                    except Exception as ex:
+                        future.set_exception(ex)
+                    else:
+                        if durable:
+                            pending.append((future, result))
+                        else:
+                            future.set_result(result)
+                if not conn.in_transaction:
+                    self.complete(pending)
+                    committed, deadline = conn.total_changes, None
+                    continue
+                if deadline is None:
+                    deadline = time.monotonic() + self.commit_interval
+                if conn.total_changes - committed >= self.commit_rows or time.monotonic() >= deadline:
+                    self.complete(pending, self.commit(conn))
+                    committed, deadline = conn.total_changes, None
+        finally:
+            self.complete(pending, self.commit(conn))
+            conn.close()
+
+    def commit(self, conn):
+        """
+        Commit pending changes, and return the exception when that failed.
+        """
+        try:
+            conn.commit()
+        except Exception as ex:
+            logger.exception(f"Committing to SQLite database failed. path={self.path}")
+            return ex
+        return None
+
+    def complete(self, pending, error=None):
+        """
+        Report the outcomes of durable operations, or the error of committing their changes.
+        """
+        for future, result in pending:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        pending.clear()
+
+    def submit(self, operation, durable=False):
+        """
+        Run `operation(connection)` on the writer thread, and return its outcome.
+
+        Its changes are committed later, together with others. When `durable`,
+        the outcome is returned only after they have been committed, otherwise
+        once the operation has run.
+        """
+        if not self.opened.wait(5.0):
+            raise TimeoutError(f"Opening SQLite database timed out. path={self.path}")
+        if self.error is not None:
+            raise self.error
+        future = Future()
+        self.requests.put((operation, future, durable))
+        return future.result()
+
+    def ensure_table(self, conn, table, ddl):
+        """
+        Run the DDL statement creating a table only on first use, from within an operation.
+        """
+        if table not in self.tables:
+            conn.execute(ddl)
+            self.tables[table] = ddl
+
+    def forget_table(self, table):
+        """
+        Forget a table, for example after inserting into it failed, from within an operation.
+        """
+        self.tables.pop(table, None)
+
+    def close(self, timeout=5.0):
+        """
+        Commit pending changes, and close the database.
+        """
+        self.requests.put(None)
+        self.join(timeout)
+
+
+def open_writer(path, config=None):
+    """
+    Return the writer of a database file, shared with other services writing to the same file.
+    """
+    config = config or {}
+    key = os.path.abspath(path) if path != ":memory:" else path
+    with writers_lock:
+        writer = writers.get(key)
+        if writer is None or not writer.is_alive():
+            writer = writers[key] = SQLiteWriter(
+                path,
+                commit_rows=config.get("commit_rows", 100),
+                commit_interval=config.get("commit_interval", 1.0),
+            )
+            writer.start()
+        writer.users += 1
+        return writer
+
+
+def close_writer(writer):
+    """
+    Release a writer returned by `open_writer`, closing the database when it is not used anymore.
+    """
+    with writers_lock:
+        writer.users -= 1
+        if writer.users > 0:
+            return
+        for key, candidate in list(writers.items()):
+            if candidate is writer:
+                del writers[key]
+    writer.close()
+
+
+class SQLiteWriters:
+    """
+    The writers used by a service, one per database file, opened on first use.
+    """
+
+    def __init__(self, config):
+        self.config = config or {}
+        self.writers = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        with self.lock:
+            writer = self.writers.get(path)
+            if writer is None:
+                writer = self.writers[path] = open_writer(path, self.config)
+            return writer
+
+    def close(self):
+        with self.lock:
+            writers, self.writers = list(self.writers.values()), {}
+        for writer in writers:
+            close_writer(writer)
+
+
+@contextmanager
+def writer_for(srv, path):
+    """
+    Provide the writer of a database file, or a writer for a single use, when the service has not been set up.
+    """
+    state = getattr(srv, "state", None)
+    if state is not None:
+        yield state.get(path)
+        return
+    # Commit each row right away, the writer is closed after a single use anyway.
+    writer = open_writer(path, {"commit_rows": 1})
+    try:
+        yield writer
+    finally:
+        close_writer(writer)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import logging
+import pickle
+import sqlite3
+import threading
+import typing as t
+
+from mqttwarn.model import Job
+
+logger = logging.getLogger(__name__)
+
+
+class JobSpool:
+    """
+    A durable spool of jobs, backed by an SQLite database.
+
+    Jobs are appended to the spool before they are queued, and acknowledged
+    after they have been processed, which removes them from the spool. Jobs
+    which have not been acknowledged, for example because the program has
+    been terminated, are replayed on startup.
+
+    The `sync` policy trades durability for throughput, it is one of
+
+    - `full`: Synchronize each write to disk, surviving power loss.
+    - `normal`: Synchronize on checkpoints, surviving crashes of the program.
+    - `off`: Leave synchronization to the operating system.
+
+    The space of acknowledged jobs is reclaimed by compacting the database
+    each `compact_every` acknowledgements.
+    """
+
+    SYNC_POLICIES = {"full": "FULL", "normal": "NORMAL", "off": "OFF"}
+
+    def __init__(self, path: str, sync: str = "normal", compact_every: int = 1000):
+        if sync not in self.SYNC_POLICIES:
+            raise ValueError(f"Invalid spool sync policy '{sync}', use one of {', '.join(self.SYNC_POLICIES)}")
+        self.path = path
+        self.sync = sync
+        self.compact_every = compact_every
+
+        self.appended = 0
+        self.acknowledged = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(f"PRAGMA synchronous={self.SYNC_POLICIES[sync]}")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, job BLOB)")
+
+        # Jobs left over from a previous run, to be replayed.
+        self._pending_replay = self._connection.execute("SELECT MAX(id) FROM jobs").fetchone()[0] or 0
+
+    def append(self, job: Job) -> t.Optional[int]:
+        """
+        Write a job to the spool, and return its identifier.
+
+        Jobs which can not be serialized are not spooled, and `None` is returned.
+        """
+        try:
+            record = pickle.dumps(
+                (job.prio, job.service, job.section, job.topic, job.payload, job.data, job.target),
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        except Exception as ex:
+            logger.warning(f"Unable to spool job, it will not survive a restart. Reason: {ex}. service={job.service}")
+            return None
+        with self._lock:
+            cursor = self._connection.execute("INSERT INTO jobs (job) VALUES (?)", (record,))
+            self.appended += 1
+            return cursor.lastrowid
+
+    def acknowledge(self, spool_id: t.Optional[int]) -> None:
+        """
+        Remove a processed job from the spool.
+        """
+        if spool_id is None:
+            return
+        with self._lock:
+            self._connection.execute("DELETE FROM jobs WHERE id = ?", (spool_id,))
+            self.acknowledged += 1
+            if self.compact_every > 0 and self.acknowledged % self.compact_every == 0:
+                self._compact()
+
+    def replay(self) -> t.Iterator[Job]:
+        """
+        Yield the jobs which have been left over from a previous run, once.
+        """
+        with self._lock:
+            last_id, self._pending_replay = self._pending_replay, 0
+            rows = self._connection.execute("SELECT id, job FROM jobs WHERE id <= ? ORDER BY id", (last_id,)).fetchall()
+        for spool_id, record in rows:
+            try:
+                prio, service, section, topic, payload, data, target = pickle.loads(record)
+            except Exception as ex:
+                logger.error(f"Unable to replay spooled job, discarding it. Reason: {ex}. id={spool_id}")
+                self.acknowledge(spool_id)
+                continue
+            job = Job(prio, service, section, topic, payload, data, target)
+            job.spool_id = spool_id
+            yield job
+
+    def compact(self) -> None:
+        """
+        Reclaim the space of acknowledged jobs.
+        """
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._connection.execute("PRAGMA incremental_vacuum")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        return {"pending": len(self), "appended": self.appended, "acknowledged": self.acknowledged}
+
+    def release(self) -> None:
+        """
+        Close the database connection inherited by a forked process, without writing to the spool.
+        """
+        self._connection.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._compact()
+            self._connection.close()
@@ -8,6 +8,120 @@ import typing as t
 logger = logging.getLogger(__name__)
 
 
+class _TopicTrieNode:
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children: t.Dict[str, "_TopicTrieNode"] = {}
+        self.values: t.List[t.Any] = []
+
+
+class TopicTrie:
+    """
+    An index of MQTT topic filters, for resolving all values whose filter
+    matches a given topic, in time proportional to the topic depth instead
+    of the number of filters.
+
+    The matching rules are the same like `paho.mqtt.client.topic_matches_sub`,
+    including the handling of the `+` and `#` wildcards, and that wildcards
+    at the first level do not match topics starting with `$`.
+    """
+
+    def __init__(self):
+        self._root = _TopicTrieNode()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, topic_filter: str, value: t.Any):
+        """
+        Register `value` for the topic filter `topic_filter`.
+        """
+        node = self._root
+        for level in topic_filter.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _TopicTrieNode()
+            node = child
+        node.values.append(value)
+        self._size += 1
+
+    def match(self, topic: str) -> t.List[t.Any]:
+        """
+        Return all values whose topic filter matches `topic`, in no particular order.
+        """
+        levels = topic.split("/")
+        depth = len(levels)
+        normal = not topic.startswith("$")
+        matches: t.List[t.Any] = []
+        stack = [(self._root, 0)]
+        while stack:
+            node, index = stack.pop()
+            children = node.children
+            wildcards_allowed = normal or index > 0
+            if wildcards_allowed and "#" in children:
+                matches.extend(children["#"].values)
+            if index == depth:
+                matches.extend(node.values)
+                continue
+            child = children.get(levels[index])
+            if child is not None:
+                stack.append((child, index + 1))
+            if wildcards_allowed:
+                child = children.get("+")
+                if child is not None:
+                    stack.append((child, index + 1))
+        return matches
+
+
+def topic_specificity_key(topic_filter: str) -> str:
+    """
+    Compute a sort key for topic filters, which, when sorting in reverse order,
+    yields the longest and most specific topic filters first.
+    """
+    # precede a key with the number of topic levels and then use reverse alphabetic sort order
+    # '+' is after '#' in ascii table
+    # caveat: for instance space is allowed in topic name but will be less specific than '+', '#'
+    # so replace '#' with first ascii character and '+' with second ascii character
+    # http://public.dhe.ibm.com/software/dw/webservices/ws-mqtt/mqtt-v3r1.html#appendix-a
+
+    # replace wildcard characters to ensure the right order
+    modified_topic = topic_filter.replace("#", chr(0x01)).replace("+", chr(0x02))
+    levels = len(topic_filter.split("/"))
+    # concatenate levels with leading zeros and modified topic and return as a key
+    return "{:03d}{}".format(levels, modified_topic)
+
+
+class TopicDispatcher:
+    """
+    Resolve the most specific entry of a dictionary mapping topic filters to
+    arbitrary values, like the dictionary-style `targets` option.
+
+    Entries are ranked by `topic_specificity_key` once, and indexed using a
+    `TopicTrie`, so resolving a topic neither needs sorting nor a linear scan.
+    """
+
+    def __init__(self, dispatcher: t.Mapping[str, t.Any]):
+        self._trie = TopicTrie()
+        ranked = sorted(dispatcher.items(), key=lambda item: topic_specificity_key(item[0]), reverse=True)
+        for rank, (topic_filter, value) in enumerate(ranked):
+            self._trie.add(topic_filter, (rank, topic_filter, value))
+
+    def __len__(self) -> int:
+        return len(self._trie)
+
+    def match(self, topic: str) -> t.Optional[t.Tuple[str, t.Any]]:
+        """
+        Return the most specific `(topic_filter, value)` pair matching `topic`, or `None`.
+        """
+        matches = self._trie.match(topic)
+        if not matches:
+            return None
+        _, topic_filter, value = min(matches, key=lambda match: match[0])
+        return topic_filter, value
+
+
 class TopicTimeout(threading.Thread):
     """
     A thread handling timeouts on mqtt topics
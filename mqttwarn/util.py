@@ -49,6 +49,88 @@ class Formatter(string.Formatter):
         return value
 
 
+FIELD_FIRST = re.compile(r"[^.[]*")
+FIELD_ACCESSOR = re.compile(r"\.([^.[]+)|\[([^\]]+)\]")
+
+
+def split_field_name(field_name: str) -> t.Tuple[t.Union[str, int], t.List[t.Tuple[bool, t.Union[str, int]]]]:
+    """
+    Split the field name of a replacement field into its first part, and its attribute
+    and index accessors, like `str.format` does. `"a.b[0]"` becomes `("a", [(True, "b"), (False, 0)])`.
+
+    Raise `ValueError` for field names which can not be parsed.
+    """
+    match = FIELD_FIRST.match(field_name)
+    first = match.group(0) if match else ""
+    rest = field_name[len(first) :]
+    accessors: t.List[t.Tuple[bool, t.Union[str, int]]] = []
+    position = 0
+    while position < len(rest):
+        match = FIELD_ACCESSOR.match(rest, position)
+        if match is None:
+            raise ValueError(f"Invalid field name: {field_name}")
+        attribute, index = match.groups()
+        if attribute is not None:
+            accessors.append((True, attribute))
+        else:
+            accessors.append((False, int(index) if index.isdigit() else index))
+        position = match.end()
+    return (int(first) if first.isdigit() else first), accessors
+
+
+class PreparedFormat:
+    """
+    A format string, which is parsed once, in order to interpolate data into it
+    repeatedly, with the same semantics as `Formatter().vformat(template, (), data)`.
+
+    Positional fields, and format specifications with nested replacement fields,
+    are handed over to `Formatter.vformat` as a whole.
+    """
+
+    __slots__ = ("template", "_segments", "_fallback")
+
+    formatter = Formatter()
+
+    def __init__(self, template: str):
+        self.template = template
+        self._segments: t.List[t.Tuple[str, t.Optional[str], t.Tuple, str, t.Optional[str]]] = []
+        self._fallback = False
+        try:
+            for literal, field_name, format_spec, conversion in self.formatter.parse(template):
+                if field_name is None:
+                    self._segments.append((literal, None, (), "", None))
+                    continue
+                format_spec = format_spec or ""
+                first, accessors = split_field_name(field_name)
+                if not isinstance(first, str) or first == "" or "{" in format_spec:
+                    self._fallback = True
+                    break
+                self._segments.append((literal, first, tuple(accessors), format_spec, conversion))
+        except ValueError:
+            # Let formatting report invalid format strings.
+            self._fallback = True
+
+    def __repr__(self):
+        return f"<PreparedFormat {self.template!r}>"
+
+    def format(self, data: t.Mapping[str, t.Any]) -> str:  # noqa:A003
+        if self._fallback:
+            return self.formatter.vformat(self.template, (), data)
+        formatter = self.formatter
+        parts = []
+        for literal, key, accessors, format_spec, conversion in self._segments:
+            if literal:
+                parts.append(literal)
+            if key is None:
+                continue
+            value = data[key]
+            for is_attribute, name in accessors:
+                value = getattr(value, name) if is_attribute else value[name]
+            value = formatter.convert_field(value, conversion)
+            parts.append(formatter.format_field(value, format_spec))
+        return "".join(parts)
+
+
 def asbool(obj: t.Any) -> bool:
     """
     Shamelessly stolen from beaker.converters
@@ -0,0 +1,9 @@
+import asyncio
+
+
+async def plugin(srv, item):
+    if item.message == "slow":
+        await asyncio.sleep(10)
+    await asyncio.sleep(0.1)
+    srv.logging.info("Coroutine plugin invoked: %s", item.message)
+    return item.message != "fail"
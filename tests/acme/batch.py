@@ -0,0 +1,8 @@
+def plugin(srv, item):
+    srv.logging.info("Plugin invoked")
+    return True
+
+
+def plugin_batch(srv, items):
+    srv.logging.info("Batch plugin invoked with %s items", len(items))
+    return ["fail" not in item.message for item in items]
@@ -0,0 +1,17 @@
+def setup(srv, config):
+    srv.logging.info("Setting up with prefix %s", config["prefix"])
+    return {"prefix": config["prefix"], "calls": 0}
+
+
+def plugin(srv, item):
+    srv.state["calls"] += 1
+    srv.logging.info("%s %s", srv.state["prefix"], item.message)
+    return True
+
+
+def health(srv):
+    return {"calls": srv.state["calls"]}
+
+
+def teardown(srv):
+    srv.logging.info("Tearing down after %s calls", srv.state["calls"])
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import gzip
+import typing as t
+
+import responses
+
+import mqttwarn.services.influxdb
+from mqttwarn.model import Struct
+
+CONFIG = {
+    "host": "localhost",
+    "port": 8086,
+    "username": None,
+    "password": None,
+    "database": "mqttwarn",
+    "retry_backoff": 0,
+}
+
+URL = "http://localhost:8086/write?db=mqttwarn&rp=&precision=ns"
+
+
+def make_item(payload, message=None, addrs=None, config=None, **data):
+    data.setdefault("_dtiso", "2026-10-18T10:38:43.910691Z")
+    return Struct(
+        config=dict(CONFIG, **(config or {})),
+        service="influxdb",
+        target="test",
+        addrs=addrs or ["temperature"],
+        topic="sensor/kitchen",
+        payload=payload,
+        message=payload if message is None else message,
+        data=data,
+    )
+
+
+@responses.activate
+def test_influxdb_success(srv):
+    """
+    Dispatch a single value and prove it is written as a point, using the session of the service.
+    """
+    responses.add(responses.POST, URL, status=204)
+    module = mqttwarn.services.influxdb
+    srv.state = module.setup(srv, {})
+    try:
+        assert module.plugin(srv, make_item("47.5")) is True
+    finally:
+        module.teardown(srv)
+
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.body == b"temperature,topic=sensor_kitchen value=47.5"
+
+
+@responses.activate
+def test_influxdb_batch(srv):
+    """
+    Dispatch a batch of items and prove they are written using one gzip-compressed request per database,
+    with the timestamps of the messages.
+    """
+    responses.add(responses.POST, URL.replace("precision=ns", "precision=s"), status=204)
+    responses.add(responses.POST, URL.replace("db=mqttwarn", "db=servers"), status=204)
+    module = mqttwarn.services.influxdb
+    items = [
+        make_item("47.5", config={"precision": "s", "gzip": True}),
+        make_item("1", addrs=["cpu", "servers"], config={"gzip": True}),
+        make_item("47.6", message="room=kitchen temperature=47.6 1700000000", config={"precision": "s", "gzip": True}),
+        make_item("2", addrs=["cpu", "servers"], config={"gzip": True}),
+    ]
+    assert module.plugin_batch(srv, items) == [True, True, True, True]
+
+    assert len(responses.calls) == 2
+    for call in responses.calls:
+        assert call.request.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(t.cast(bytes, responses.calls[0].request.body)).decode().splitlines() == [
+        "temperature,topic=sensor_kitchen value=47.5 1792319923",
+        "temperature,topic=sensor_kitchen,room=kitchen temperature=47.6 1700000000",
+    ]
+    assert gzip.decompress(t.cast(bytes, responses.calls[1].request.body)).decode().splitlines() == [
+        "cpu,topic=sensor_kitchen value=1 1792319923910691000",
+        "cpu,topic=sensor_kitchen value=2 1792319923910691000",
+    ]
+
+
+@responses.activate
+def test_influxdb_fields_from_data(srv):
+    """
+    Prove that points are built from transformation data fields, when the `fields` option is configured.
+    """
+    responses.add(responses.POST, URL, status=204)
+    module = mqttwarn.services.influxdb
+    item = make_item(
+        '{"room": "living room", "temperature": 21, "state": "on \\"ok\\""}',
+        config={"tags": ["room"], "fields": {"temp": "temperature", "state": "state", "missing": "missing"}},
+        room="living room",
+        temperature=21,
+        state='on "ok"',
+    )
+    assert module.plugin(srv, item) is True
+
+    assert responses.calls[0].request.body == (
+        b'temperature,topic=sensor_kitchen,room=living\\ room state="on \\"ok\\"",temp=21.0'
+    )
+
+
+@responses.activate
+def test_influxdb_retry(srv, caplog):
+    """
+    When the server is unavailable, prove that the request is retried.
+    """
+    responses.add(responses.POST, URL, status=503, body="unavailable")
+    responses.add(responses.POST, URL, status=204)
+    module = mqttwarn.services.influxdb
+    assert module.plugin(srv, make_item("47.5")) is True
+
+    assert len(responses.calls) == 2
+    assert "POST request failed: (503) unavailable" in caplog.messages
+
+
+@responses.activate
+def test_influxdb_failure(srv, caplog):
+    """
+    When the server rejects points, prove that the request is not retried, and the plugin fails.
+    """
+    responses.add(responses.POST, URL, status=400, body="bad request")
+    module = mqttwarn.services.influxdb
+    assert module.plugin_batch(srv, [make_item("47.5"), make_item("47.6")]) == [False, False]
+
+    assert len(responses.calls) == 1
+    assert "POST request failed: (400) bad request" in caplog.messages
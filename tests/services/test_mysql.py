@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import importlib
+import sys
+import types
+import typing as t
+
+import pytest
+
+from mqttwarn.model import Struct
+
+
+class Error(Exception):
+    pass
+
+
+class OperationalError(Error):
+    pass
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params: t.Sequence = ()):
+        server.statements.append((sql, tuple(params)))
+        if sql.startswith("describe "):
+            table = sql[len("describe ") :]
+            if table not in server.tables:
+                raise Error(f"Table '{table}' doesn't exist")
+            self.rows = [(column,) for column in server.tables[table]]
+        elif sql.startswith("create table "):
+            server.tables[sql.split("`")[1]] = ["id"]
+
+    def executemany(self, sql, rows):
+        if sql.split()[2] in server.failing:
+            raise Error("Unknown column")
+        server.statements.append((sql, list(rows)))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, **params):
+        self.params = params
+        self.closed = False
+        self.commits = 0
+        server.connections.append(self)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def ping(self):
+        if server.gone:
+            raise OperationalError(2006, "MySQL server has gone away")
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+server = types.SimpleNamespace()
+
+
+@pytest.fixture
+def mysql(monkeypatch):
+    """
+    Provide the MySQL services, using a stub of the `MySQLdb` package.
+    """
+    server.tables = {"readings": ["payload", "temperature", "room"]}
+    server.statements = []
+    server.connections = []
+    server.gone = False
+    server.failing = set()
+    mysqldb = types.SimpleNamespace(
+        Error=Error,
+        OperationalError=OperationalError,
+        connect=FakeConnection,
+        _mysql=types.SimpleNamespace(escape_string=lambda value: value.encode("utf-8")),
+    )
+    monkeypatch.setitem(sys.modules, "MySQLdb", mysqldb)
+    names = ["mqttwarn.services.mysql_util", "mqttwarn.services.mysql", "mqttwarn.services.mysql_dynamic"]
+    for name in names:
+        sys.modules.pop(name, None)
+    yield types.SimpleNamespace(
+        util=importlib.import_module("mqttwarn.services.mysql_util"),
+        mysql=importlib.import_module("mqttwarn.services.mysql"),
+        dynamic=importlib.import_module("mqttwarn.services.mysql_dynamic"),
+    )
+    # Do not leave modules using the stub behind.
+    for name in names:
+        sys.modules.pop(name, None)
+
+
+def make_item(data, addrs=None, config=None):
+    return Struct(
+        config=config or {},
+        service="mysql",
+        target="test",
+        addrs=addrs or ["readings", "payload"],
+        message="message",
+        data=data,
+    )
+
+
+def statements(prefix):
+    return [(sql, params) for sql, params in server.statements if sql.startswith(prefix)]
+
+
+def test_mysql_pool_shared(mysql, srv):
+    """
+    Prove that services connecting to the same database share a pool, which is closed after the last one is released.
+    """
+    first = mysql.mysql.setup(srv, {"dbname": "mqttwarn"})
+    second = mysql.dynamic.setup(srv, {"dbname": "mqttwarn"})
+    other = mysql.mysql.setup(srv, {"dbname": "other"})
+    assert first is second
+    assert first is not other
+    assert first.users == 2
+    assert len(mysql.util.pools) == 2
+
+    with first.connection():
+        pass
+    mysql.util.close_pool(first)
+    assert first.users == 1
+    assert server.connections[0].closed is False
+
+    mysql.util.close_pool(second)
+    mysql.util.close_pool(other)
+    assert mysql.util.pools == {}
+    assert server.connections[0].closed is True
+
+
+def test_mysql_pool_reuse(mysql, srv):
+    """
+    Prove that a pooled connection is reused, and that the columns of a table are only described once.
+    """
+    srv.state = mysql.mysql.setup(srv, {})
+    try:
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 21})) is True
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 22, "unknown": "foo"})) is True
+    finally:
+        mysql.mysql.teardown(srv)
+
+    assert len(server.connections) == 1
+    assert server.connections[0].commits == 2
+    assert len(statements("describe")) == 1
+    assert statements("insert") == [
+        ("insert into readings (payload, temperature) values (%s, %s)", [("message", 21)]),
+        ("insert into readings (payload, temperature) values (%s, %s)", [("message", 22)]),
+    ]
+
+
+def test_mysql_stale_connection(mysql, srv):
+    """
+    Prove that an idle connection closed by the server is replaced, before it is reused.
+    """
+    srv.state = mysql.mysql.setup(srv, {})
+    try:
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 21})) is True
+        server.gone = True
+        with srv.state.connection():
+            server.gone = False
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 22})) is True
+    finally:
+        mysql.mysql.teardown(srv)
+
+    assert len(server.connections) == 2
+    assert server.connections[0].closed is True
+    assert len(statements("insert")) == 2
+
+
+def test_mysql_invalidate(mysql, srv, caplog):
+    """
+    Prove that the cached columns of a table are described again, after inserting into it failed.
+    """
+    srv.state = mysql.mysql.setup(srv, {})
+    try:
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 21})) is True
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 22})) is True
+        assert len(statements("describe")) == 1
+
+        server.failing.add("readings")
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 23})) is False
+        server.failing.clear()
+        assert mysql.mysql.plugin(srv, make_item({"temperature": 24})) is True
+    finally:
+        mysql.mysql.teardown(srv)
+
+    assert len(statements("describe")) == 2
+    assert "Cannot add 1 mysql rows to readings: Unknown column" in caplog.messages
+
+
+def test_mysql_batch(mysql, srv, caplog):
+    """
+    Prove that a batch of items is inserted using one `executemany` per table and set of columns,
+    and that the items of failing tables are reported as failed.
+    """
+    server.tables["rooms"] = ["payload", "room"]
+    srv.state = mysql.mysql.setup(srv, {})
+    items = [
+        make_item({"temperature": 21}),
+        make_item({"temperature": 22, "room": "kitchen"}),
+        make_item({"room": "attic"}, addrs=["rooms", "payload"]),
+        make_item({"temperature": 23}),
+        make_item({"temperature": 24}, addrs=["missing", "payload"]),
+        make_item({"temperature": 25}, addrs=["readings"]),
+    ]
+    try:
+        assert mysql.mysql.plugin_batch(srv, items) == [True, True, True, True, False, False]
+    finally:
+        mysql.mysql.teardown(srv)
+
+    assert statements("insert") == [
+        ("insert into readings (payload, temperature) values (%s, %s)", [("message", 21), ("message", 23)]),
+        ("insert into readings (payload, room, temperature) values (%s, %s, %s)", [("message", "kitchen", 22)]),
+        ("insert into rooms (payload, room) values (%s, %s)", [("message", "attic")]),
+    ]
+    assert "Cannot add 1 mysql rows to missing: Table 'missing' doesn't exist" in caplog.messages
+
+
+def test_mysql_dynamic_batch(mysql, srv):
+    """
+    Prove that `mysql_dynamic` creates missing tables, inserts rows per table, reports the outcomes
+    per table, and updates the index table using one statement for all stored tables.
+    """
+    srv.state = mysql.dynamic.setup(srv, {})
+    config = {"index": "topics"}
+    items = [
+        make_item({"topic": "sensor/kitchen", "temperature": 21}, addrs=["topic"], config=config),
+        make_item({"topic": "sensor/attic", "temperature": 18}, addrs=["topic"], config=config),
+        make_item({"topic": "sensor/kitchen", "temperature": 22}, addrs=["topic"], config=config),
+    ]
+    try:
+        assert mysql.dynamic.plugin_batch(srv, items) == [True, True, True]
+    finally:
+        mysql.dynamic.teardown(srv)
+
+    assert [sql for sql, _ in statements("create table")] == [
+        "create table `sensor_kitchen` (`id` INT AUTO_INCREMENT,`temperature` LONG, PRIMARY KEY ID(`id`)) CHARSET=utf8",
+        "create table `sensor_attic` (`id` INT AUTO_INCREMENT,`temperature` LONG, PRIMARY KEY ID(`id`)) CHARSET=utf8",
+    ]
+    assert statements("insert into sensor") == [
+        ("insert into sensor_kitchen (temperature) values (%s)", [(b"21",), (b"22",)]),
+        ("insert into sensor_attic (temperature) values (%s)", [(b"18",)]),
+    ]
+    [(sql, params)] = statements("insert into topics")
+    assert sql == "insert into topics (topic, ts) values (%s, %s), (%s, %s) on duplicate key update ts=values(ts)"
+    assert params[0::2] == ("sensor_kitchen", "sensor_attic")
+    assert server.connections[0].commits == 1
+
+
+def test_mysql_dynamic_batch_failure(mysql, srv):
+    """
+    Prove that `mysql_dynamic` reports the items of tables which could not be stored as failed,
+    and only updates the index for the stored tables.
+    """
+    server.tables["sensor_kitchen"] = ["id", "temperature"]
+    server.failing.add("sensor_attic")
+    srv.state = mysql.dynamic.setup(srv, {})
+    config = {"index": "topics"}
+    items = [
+        make_item({"topic": "sensor/kitchen", "temperature": 21}, addrs=["topic"], config=config),
+        make_item({"topic": "sensor/attic", "temperature": 18}, addrs=["topic"], config=config),
+        make_item({"topic": "sensor/kitchen", "temperature": 22}, addrs=["topic"], config=config),
+    ]
+    try:
+        assert mysql.dynamic.plugin_batch(srv, items) == [True, False, True]
+    finally:
+        mysql.dynamic.teardown(srv)
+
+    [(sql, params)] = statements("insert into topics")
+    assert sql == "insert into topics (topic, ts) values (%s, %s) on duplicate key update ts=values(ts)"
+    assert params[0] == "sensor_kitchen"
+    assert server.connections[0].commits == 1
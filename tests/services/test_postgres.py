@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import importlib
+import sys
+import types
+import typing as t
+
+import pytest
+
+from mqttwarn.model import Struct
+
+
+class Error(Exception):
+    pass
+
+
+class OperationalError(Error):
+    pass
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params: t.Sequence = ()):
+        if self.conn.closed or self.conn.server.broken:
+            raise OperationalError("server closed the connection unexpectedly")
+        if sql.startswith("insert") and self.conn.server.failing:
+            raise Error("column does not exist")
+        self.conn.server.statements.append((sql, params))
+        if "INFORMATION_SCHEMA.COLUMNS" in sql:
+            schema, table = params
+            if (schema, table) not in self.conn.server.tables:
+                raise Error(f'relation "{schema}.{table}" does not exist')
+            self.rows = [(column,) for column in self.conn.server.tables[(schema, table)]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = 0
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool:
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.server = server
+        self.idle = []
+        self.connections = []
+
+    def getconn(self):
+        if self.idle:
+            return self.idle.pop()
+        conn = FakeConnection(self.server)
+        self.connections.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        if close:
+            conn.close()
+        else:
+            self.idle.append(conn)
+
+    def closeall(self):
+        for conn in self.connections:
+            conn.close()
+
+
+def execute_values(cursor, sql, rows):
+    cursor.conn.server.statements.append((sql, rows))
+
+
+server = types.SimpleNamespace()
+
+
+@pytest.fixture
+def postgres(monkeypatch):
+    """
+    Provide the `postgres` service, using a stub of the `psycopg2` package.
+    """
+    server.tables = {("public", "readings"): ["payload", "temperature", "room"]}
+    server.statements = []
+    server.broken = False
+    server.failing = False
+    extras = types.SimpleNamespace(execute_values=execute_values)
+    pool = types.SimpleNamespace(ThreadedConnectionPool=FakePool)
+    psycopg2 = types.SimpleNamespace(
+        Error=Error,
+        OperationalError=OperationalError,
+        connect=lambda **kwargs: FakeConnection(server),
+        extras=extras,
+        pool=pool,
+    )
+    monkeypatch.setitem(sys.modules, "psycopg2", psycopg2)
+    monkeypatch.setitem(sys.modules, "psycopg2.extras", extras)
+    monkeypatch.setitem(sys.modules, "psycopg2.pool", pool)
+    sys.modules.pop("mqttwarn.services.postgres", None)
+    yield importlib.import_module("mqttwarn.services.postgres")
+    # Do not leave the module using the stub behind.
+    sys.modules.pop("mqttwarn.services.postgres", None)
+
+
+def make_item(data, addrs=None):
+    return Struct(
+        config={},
+        service="postgres",
+        target="test",
+        addrs=addrs or ["readings", "payload"],
+        message="message",
+        data=data,
+    )
+
+
+def inserts():
+    return [(sql, params) for sql, params in server.statements if sql.startswith("insert")]
+
+
+def column_queries():
+    return [sql for sql, params in server.statements if "INFORMATION_SCHEMA.COLUMNS" in sql]
+
+
+def test_postgres_pool(postgres, srv):
+    """
+    Prove that a pooled connection is reused, and that the column names of a table are only queried once.
+    """
+    srv.state = postgres.setup(srv, {})
+    try:
+        assert postgres.plugin(srv, make_item({"temperature": 21})) is True
+        assert postgres.plugin(srv, make_item({"temperature": 22, "unknown": "foo"})) is True
+        assert len(srv.state.pool.connections) == 1
+        assert srv.state.pool.connections[0].commits == 2
+    finally:
+        postgres.teardown(srv)
+
+    assert len(column_queries()) == 1
+    assert inserts() == [
+        ("insert into public.readings (payload, temperature) values (%s, %s)", ("message", 21)),
+        ("insert into public.readings (payload, temperature) values (%s, %s)", ("message", 22)),
+    ]
+    assert srv.state.pool.connections[0].closed
+
+
+def test_postgres_stale_connection(postgres, srv):
+    """
+    Prove that a pooled connection closed by the server while idle is replaced on checkout.
+    """
+    srv.state = postgres.setup(srv, {})
+    try:
+        assert postgres.plugin(srv, make_item({"temperature": 21})) is True
+        stale = srv.state.pool.connections[0]
+        server.broken = True
+        with srv.state.connection():
+            pass
+        server.broken = False
+        assert stale.closed
+        assert postgres.plugin(srv, make_item({"temperature": 22})) is True
+        assert len(inserts()) == 2
+    finally:
+        postgres.teardown(srv)
+
+
+def test_postgres_invalidate(postgres, srv, caplog):
+    """
+    Prove that the cached column names of a table are queried again, after inserting into it failed.
+    """
+    srv.state = postgres.setup(srv, {})
+    try:
+        assert postgres.plugin(srv, make_item({"temperature": 21})) is True
+        assert postgres.plugin(srv, make_item({"temperature": 22})) is True
+        assert len(column_queries()) == 1
+
+        server.failing = True
+        assert postgres.plugin(srv, make_item({"temperature": 23})) is False
+        server.failing = False
+        assert postgres.plugin(srv, make_item({"temperature": 24})) is True
+    finally:
+        postgres.teardown(srv)
+
+    assert len(column_queries()) == 2
+    assert "Cannot add postgres row: column does not exist" in caplog.messages
+
+
+def test_postgres_batch(postgres, srv, caplog):
+    """
+    Prove that a batch of items is inserted using multi-row inserts per table and set of columns,
+    and that the items of failing tables are reported as failed.
+    """
+    server.tables[("sensors", "rooms")] = ["payload", "room"]
+    srv.state = postgres.setup(srv, {})
+    items = [
+        make_item({"temperature": 21}),
+        make_item({"temperature": 22, "room": "kitchen"}),
+        make_item({"room": "attic"}, addrs=["rooms", "payload", "sensors"]),
+        make_item({"temperature": 23}),
+        make_item({"temperature": 24}, addrs=["missing", "payload"]),
+    ]
+    try:
+        assert postgres.plugin_batch(srv, items) == [True, True, True, True, False]
+    finally:
+        postgres.teardown(srv)
+
+    assert inserts() == [
+        (
+            "insert into public.readings (payload, temperature) values %s",
+            [("message", 21), ("message", 23)],
+        ),
+        (
+            "insert into public.readings (payload, room, temperature) values %s",
+            [("message", "kitchen", 22)],
+        ),
+        ("insert into sensors.rooms (payload, room) values %s", [("message", "attic")]),
+    ]
+    assert len(column_queries()) == 3
+    assert 'Cannot add 1 postgres rows to public.missing: relation "public.missing" does not exist' in caplog.messages
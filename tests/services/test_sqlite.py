@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import mqttwarn.services.sqlite
+import mqttwarn.services.sqlite_json2cols
+import mqttwarn.services.sqlite_timestamp
+from mqttwarn.model import ProcessorItem as Item
+from mqttwarn.model import Service
+from mqttwarn.services import sqlite_util
+
+
+def count_rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+def test_sqlite_success(srv, tmp_path):
+    """
+    Dispatch messages and prove they are stored in the designated table, using a database in WAL journal mode.
+    """
+    path = str(tmp_path / "test.db")
+    module = mqttwarn.services.sqlite
+    srv.state = module.setup(srv, {})
+    try:
+        for number in range(3):
+            item = Item(target="test", addrs=[path, "mqttwarn"], message=f"message {number}", data={})
+            assert module.plugin(srv, item) is True
+    finally:
+        module.teardown(srv)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("SELECT payload FROM mqttwarn").fetchall() == [("message 0",), ("message 1",), ("message 2",)]
+    conn.close()
+    assert sqlite_util.writers == {}
+
+
+def test_sqlite_group_commit_rows(srv, tmp_path):
+    """
+    Prove that rows are committed in groups of `commit_rows` rows.
+    """
+    path = str(tmp_path / "test.db")
+    module = mqttwarn.services.sqlite
+    srv.state = module.setup(srv, {"commit_rows": 2, "commit_interval": 60})
+    try:
+        item = Item(target="test", addrs=[path, "mqttwarn"], message="message", data={})
+        assert module.plugin(srv, item) is True
+        assert count_rows(path, "mqttwarn") == 0
+        assert module.plugin(srv, item) is True
+        assert count_rows(path, "mqttwarn") == 2
+    finally:
+        module.teardown(srv)
+
+
+def test_sqlite_group_commit_interval(srv, tmp_path):
+    """
+    Prove that rows are committed after `commit_interval` seconds.
+    """
+    path = str(tmp_path / "test.db")
+    module = mqttwarn.services.sqlite
+    srv.state = module.setup(srv, {"commit_rows": 100, "commit_interval": 0.05})
+    try:
+        item = Item(target="test", addrs=[path, "mqttwarn"], message="message", data={})
+        assert module.plugin(srv, item) is True
+        deadline = time.monotonic() + 5
+        while count_rows(path, "mqttwarn") == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert count_rows(path, "mqttwarn") == 1
+    finally:
+        module.teardown(srv)
+
+
+def test_sqlite_group_commit_spooling(srv, tmp_path):
+    """
+    When jobs are spooled, prove that the plugin only succeeds after its row has been committed.
+    """
+    path = str(tmp_path / "test.db")
+    module = mqttwarn.services.sqlite
+    srv.durable = True
+    srv.state = module.setup(srv, {"commit_rows": 2, "commit_interval": 60})
+    outcomes = []
+    try:
+        item = Item(target="test", addrs=[path, "mqttwarn"], message="message", data={})
+        thread = threading.Thread(target=lambda: outcomes.append(module.plugin(srv, item)))
+        thread.start()
+        thread.join(0.2)
+        assert outcomes == []
+        assert module.plugin(srv, item) is True
+        thread.join()
+        assert outcomes == [True]
+        assert count_rows(path, "mqttwarn") == 2
+    finally:
+        module.teardown(srv)
+
+
+def test_sqlite_group_commit_failure(tmp_path, mocker):
+    """
+    Prove that durable operations fail when committing their changes fails.
+    """
+    writer = sqlite_util.SQLiteWriter(str(tmp_path / "test.db"), commit_rows=1)
+    mocker.patch.object(writer, "commit", return_value=sqlite3.OperationalError("disk I/O error"))
+    writer.start()
+    try:
+        writer.submit(lambda conn: conn.execute("CREATE TABLE foo (bar TEXT)"))
+        assert writer.submit(lambda conn: conn.execute("INSERT INTO foo VALUES ('baz')") and True) is True
+        with pytest.raises(sqlite3.OperationalError) as excinfo:
+            writer.submit(lambda conn: conn.execute("INSERT INTO foo VALUES ('baz')") and True, durable=True)
+        assert str(excinfo.value) == "disk I/O error"
+    finally:
+        writer.close()
+
+
+def test_sqlite_timestamp_without_setup(srv, tmp_path):
+    """
+    Prove that the plugin also works when the service has not been set up, committing right away.
+    """
+    path = str(tmp_path / "test.db")
+    item = Item(target="test", addrs=[path, "mqttwarn"], message="message", data={})
+    assert mqttwarn.services.sqlite_timestamp.plugin(srv, item) is True
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT id, payload FROM mqttwarn").fetchall() == [(1, "message")]
+    conn.close()
+
+
+def test_sqlite_connect_failure(srv, tmp_path, caplog):
+    """
+    When the database can not be opened, prove that the plugin fails.
+    """
+    path = str(tmp_path / "missing" / "test.db")
+    item = Item(target="test", addrs=[path, "mqttwarn"], message="message", data={})
+    assert mqttwarn.services.sqlite.plugin(srv, item) is False
+    assert f"Cannot connect to sqlite at {path} : unable to open database file" in caplog.messages
+
+
+def test_sqlite_shared_writer(srv, tmp_path):
+    """
+    Prove that several services and threads writing to the same database file share a single writer.
+    """
+    path = str(tmp_path / "test.db")
+    states = [
+        (mqttwarn.services.sqlite, mqttwarn.services.sqlite.setup(srv, {})),
+        (mqttwarn.services.sqlite_timestamp, mqttwarn.services.sqlite_timestamp.setup(srv, {})),
+    ]
+    outcomes = []
+
+    def work(module, state, table):
+        service = Service(mqttc=None, logger=srv.logging, mwcore={}, program="mqttwarn-testdrive", state=state)
+        for number in range(50):
+            item = Item(target="test", addrs=[path, table], message=f"message {number}", data={})
+            outcomes.append(module.plugin(service, item))
+
+    threads = [
+        threading.Thread(target=work, args=(module, state, f"table{index % 2}"))
+        for index, (module, state) in enumerate(states * 2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sqlite_util.writers) == 1
+    for module, state in states:
+        state.close()
+    assert sqlite_util.writers == {}
+
+    assert outcomes == [True] * 200
+    assert count_rows(path, "table0") == 100
+    assert count_rows(path, "table1") == 100
+
+
+def test_sqlite_json2cols_schema_evolution(srv, tmp_path):
+    """
+    Prove that JSON fields are stored into columns, which are added when new fields show up,
+    and that values are bound as parameters.
+    """
+    path = str(tmp_path / "test.db")
+    module = mqttwarn.services.sqlite_json2cols
+    srv.state = module.setup(srv, {})
+    payloads = [
+        {"name": "Thor", "Father": "Odin", "Age": 30, "topic": "test/hello", "_dtiso": "2026-10-18"},
+        {"name": "Loki", "Father": "Laufey", "Age": 29},
+        {"name": "x'); DROP TABLE gods; --", "Age": 1.5, "weapon": "Mjölnir", "Stärke": 99, "extra": None},
+    ]
+    try:
+        for data in payloads:
+            item = Item(target="test", addrs=[path, "gods"], message="", data=dict(data))
+            assert module.plugin(srv, item) is True
+        schema = srv.state.get(path).tables["gods"]
+        assert sorted(schema.statements) == [
+            ("name", "Age", "weapon", "Starke"),
+            ("name", "Father", "Age"),
+        ]
+    finally:
+        module.teardown(srv)
+
+    conn = sqlite3.connect(path)
+    assert [row[1] for row in conn.execute("PRAGMA table_info(gods)")] == ["name", "Father", "Age", "weapon", "Starke"]
+    assert conn.execute("SELECT * FROM gods").fetchall() == [
+        ("Thor", "Odin", 30.0, None, None),
+        ("Loki", "Laufey", 29.0, None, None),
+        ("x'); DROP TABLE gods; --", None, 1.5, "Mjölnir", 99.0),
+    ]
+    conn.close()
+
+
+def test_sqlite_json2cols_no_fields(srv, tmp_path, caplog):
+    """
+    When a message has no JSON fields to store, prove that the plugin fails.
+    """
+    path = str(tmp_path / "test.db")
+    item = Item(target="test", addrs=[path, "gods"], message="", data={"topic": "test/hello", "payload": "hello"})
+    assert mqttwarn.services.sqlite_json2cols.plugin(srv, item) is False
+    assert "Cannot INSERT INTO sqlite:gods : No JSON fields to store" in caplog.messages
@@ -139,3 +139,34 @@ def test_filter_docstring_describes_suppression_contract():
     docstring = FunctionInvoker.filter.__doc__ or ""
     assert "``True`` suppresses" in docstring
     assert "``False`` continues" in docstring
+
+
+def test_runtime_context_get_matching_sections(tmp_path):
+    """
+    Verify the `RuntimeContext.get_matching_sections` method, also after modifying the configuration.
+    """
+    ini_file = tmp_path.joinpath("test-runtime-context.ini")
+    ini_file.write_text(
+        """
+    [test/+]
+    targets = foo:void
+
+    [test/topic]
+    targets = foo:void
+
+    [other]
+    topic   = test/#
+    targets = foo:void
+    """
+    )
+    config = Config(configuration_file=ini_file)
+    context = RuntimeContext(config=config, invoker=None)
+    assert context.get_matching_sections("test/topic") == ["test/+", "test/topic", "other"]
+    assert context.get_matching_sections("test/foo/bar") == ["other"]
+    assert context.get_matching_sections("foo") == []
+
+    config.remove_section("test/+")
+    config.add_section("foo")
+    config.set("foo", "targets", "foo:void")
+    assert context.get_matching_sections("test/topic") == ["test/topic", "other"]
+    assert context.get_matching_sections("foo") == ["foo"]
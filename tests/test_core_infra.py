@@ -804,3 +804,40 @@ def test_run_plugin_module_success(caplog):
     )
     assert "Successfully sent message using noop" in caplog.messages
     assert "Plugin response: True" in caplog.messages
+
+
+def test_subscribe_forever_asyncio(caplog, mocker):
+    """
+    Verify the `core.subscribe_forever` function drives the MQTT client from an event loop, when configured.
+    """
+    config = Config()
+    config.runtime = "asyncio"
+    bootstrap(config=config)
+    mocker.patch("mqttwarn.core.exit_flag", False)
+
+    connect = mocker.patch("mqttwarn.core.connect")
+    connect.return_value = Mock(
+        **{  # ty: ignore[invalid-argument-type, unused-ignore-comment]
+            "socket.return_value": None,
+            "loop_misc.return_value": 0,
+        }
+    )
+    t = threading.Thread(target=subscribe_forever)
+    t.start()
+    delay(0.05)
+    mocker.patch("mqttwarn.core.exit_flag", True)
+    t.join()
+
+    assert connect.return_value.loop_misc.called
+    assert not connect.return_value.loop_forever.called
+
+    # Reset to the default runtime.
+    bootstrap(config=Config())
+
+
+def test_bootstrap_invalid_runtime():
+    config = Config()
+    config.runtime = "foo"
+    with pytest.raises(ValueError) as excinfo:
+        bootstrap(config=config)
+    assert str(excinfo.value) == "Invalid runtime 'foo', use one of threads, asyncio"
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 # (c) 2018-2023 The mqttwarn developers
-from mqttwarn.core import process_job
+import time
+
+import mqttwarn.core
+from mqttwarn.core import drain_queues, get_service_health, get_service_stats, process_job, teardown_services
 from mqttwarn.model import ProcessorItem
-from tests.util import core_bootstrap
+from tests.util import core_bootstrap, delay, send_message
 
 
 def test_process_job_without_target_addrs(tmp_ini, caplog):
@@ -130,3 +133,227 @@ launch = noop
     process_job(item.to_job())
 
     assert "Notification suppressed. Reason: Payload is empty. service=noop, topic=None" in caplog.messages
+
+
+def test_process_job_on_service_queue(tmp_ini, caplog):
+    """
+    Verify jobs are processed by the workers of their service, and the number of workers is configurable.
+    """
+
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = log
+
+[config:log]
+workers = 2
+targets = {'info': ['info']}
+
+[test/service-queue]
+targets = log:info
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT message to the core machinery for processing.
+    send_message(topic="test/service-queue", payload="foobar")
+
+    assert "Starting 2 worker threads for service `log'" in caplog.messages
+    assert ("mqttwarn.services.log", 20, "foobar") in caplog.record_tuples
+
+    stats = get_service_stats()["log"]
+    assert stats["workers"] == 2
+    assert stats["processed"] == 1
+    assert stats["queued"] == 0
+    assert stats["plugin"]["calls"] == 1
+    assert stats["plugin"]["timeouts"] == 0
+
+
+def test_process_job_batch(tmp_ini, caplog):
+    """
+    Verify jobs for plugins implementing `plugin_batch` are delivered in batches.
+    """
+
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = tests.acme.batch
+
+[config:tests.acme.batch]
+batch_size = 3
+batch_linger = 0.5
+targets = {'default': ['default']}
+
+[test/batch]
+targets = tests.acme.batch:default
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT messages to the core machinery for processing.
+    send_message(topic="test/batch", payload="foo")
+    send_message(topic="test/batch", payload="fail")
+    send_message(topic="test/batch", payload="bar")
+    send_message(topic="test/batch", payload="baz")
+
+    # Give the machinery some time to deliver the remaining batch.
+    delay(0.6)
+
+    assert "Batch plugin invoked with 3 items" in caplog.messages
+    assert "Batch plugin invoked with 1 items" in caplog.messages
+    assert "Plugin invoked" not in caplog.messages
+    assert "Notification failed or timed out. service=tests.acme.batch, topic=test/batch" in caplog.messages
+
+    stats = get_service_stats()["tests.acme.batch"]["batch"]["default"]
+    assert stats == {"pending": 0, "batches": 2, "delivered": 3, "failed": 1}
+
+
+def test_process_job_coroutine_plugin(tmp_ini, caplog):
+    """
+    Verify coroutine plugins are awaited concurrently on the event loop, bounded by `plugin_timeout`.
+    """
+
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = tests.acme.asynchronous
+
+[config:tests.acme.asynchronous]
+plugin_timeout = 0.5
+targets = {'default': ['default']}
+
+[test/async]
+targets = tests.acme.asynchronous:default
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT messages to the core machinery for processing.
+    started = time.monotonic()
+    for payload in ["foo", "fail", "slow", "bar", "baz"]:
+        send_message(topic="test/async", payload=payload)
+    assert drain_queues(timeout=5.0) is True
+    assert time.monotonic() - started < 2.0
+
+    assert "Coroutine plugin invoked: foo" in caplog.messages
+    assert "Coroutine plugin invoked: baz" in caplog.messages
+    assert "Coroutine plugin invoked: slow" not in caplog.messages
+    assert "Invoking service plugin timed out after 0.5 seconds. service=tests.acme.asynchronous" in caplog.messages
+    assert "Notification failed or timed out. service=tests.acme.asynchronous, topic=test/async" in caplog.messages
+
+    stats = get_service_stats()["tests.acme.asynchronous"]["plugin"]
+    assert stats["calls"] == 5
+    assert stats["timeouts"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_process_job_plugin_lifecycle(tmp_ini, caplog):
+    """
+    Verify the `setup`, `health`, and `teardown` hooks of a plugin, and its state passed on each call.
+    """
+
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = tests.acme.lifecycle, log
+
+[config:tests.acme.lifecycle]
+prefix = 'Received:'
+targets = {'default': ['default']}
+
+[config:log]
+targets = {'info': ['info']}
+
+[test/lifecycle]
+targets = tests.acme.lifecycle:default
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+    assert "Setting up with prefix Received:" in caplog.messages
+
+    # Signal mocked MQTT messages to the core machinery for processing.
+    send_message(topic="test/lifecycle", payload="foo")
+    send_message(topic="test/lifecycle", payload="bar")
+    assert drain_queues(timeout=5.0) is True
+
+    assert "Received: foo" in caplog.messages
+    assert "Received: bar" in caplog.messages
+    assert get_service_health() == {"tests.acme.lifecycle": {"calls": 2}}
+
+    teardown_services()
+    assert "Tearing down after 2 calls" in caplog.messages
+    assert get_service_health() == {"tests.acme.lifecycle": False}
+
+
+def test_process_job_reuses_service_object(tmp_ini, mocker):
+    """
+    Verify the service object of a plugin is created once, and reused for each job.
+    """
+
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = log
+
+[config:log]
+targets = {'info': ['info']}
+
+[test/reuse]
+targets = log:info
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+    plugin = mocker.spy(mqttwarn.core.service_plugins["log"]["module"], "plugin")
+
+    # Signal mocked MQTT messages to the core machinery for processing.
+    send_message(topic="test/reuse", payload="foo")
+    send_message(topic="test/reuse", payload="bar")
+    assert drain_queues(timeout=5.0) is True
+
+    assert plugin.call_count == 2
+    first, second = [call.args[0] for call in plugin.call_args_list]
+    assert first is second is mqttwarn.core.service_plugins["log"]["srv"]
+    assert [call.args[1].message for call in plugin.call_args_list] == ["foo", "bar"]
+
+
+def test_process_job_batch_option(tmp_ini, caplog):
+    """
+    Verify the `batch` option selects the targets whose jobs are accumulated into batches.
+    """
+
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = tests.acme.batch
+
+[config:tests.acme.batch]
+batch = ['telemetry']
+batch_linger = 0.1
+targets = {'default': ['default'], 'telemetry': ['telemetry']}
+
+[test/batch]
+targets = tests.acme.batch:default, tests.acme.batch:telemetry
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT messages to the core machinery for processing.
+    send_message(topic="test/batch", payload="foo")
+    delay(0.2)
+    assert drain_queues(timeout=5.0) is True
+
+    assert caplog.messages.count("Plugin invoked") == 1
+    assert "Batch plugin invoked with 1 items" in caplog.messages
+    assert list(get_service_stats()["tests.acme.batch"]["batch"].keys()) == ["telemetry"]
@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 # (c) 2018-2023 The mqttwarn developers
+import asyncio
 import io
 import json
 import os
 import sys
 import tempfile
+import time
 
 import pytest
 
+import mqttwarn.core
 from mqttwarn.core import decode_payload
 from tests import configfile_full, configfile_logging_levels, configfile_service_loading
 from tests.util import core_bootstrap, send_message
@@ -74,6 +77,40 @@ def test_decode_payload_alldata(caplog):
     assert outcome["alldata-key"] == "alldata-value"
 
 
+def test_decode_payload_once_per_message(tmp_ini, caplog):
+    """
+    Verify a message matching multiple sections is decoded only once.
+    """
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = log
+
+[config:log]
+targets = {'info': ['info']}
+
+[test/decode-once]
+targets = log:info
+format = first: {payload}
+
+[test/+]
+targets = log:info
+format = second: {payload}
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT message to the core machinery for processing.
+    send_message(topic="test/decode-once", payload="foobar")
+
+    # Proof that the message has been decoded once, and routed to both sections.
+    assert len([message for message in caplog.messages if message.startswith("Decoding JSON failed")]) == 1
+    assert ("mqttwarn.services.log", 20, "first: foobar") in caplog.record_tuples
+    assert ("mqttwarn.services.log", 20, "second: foobar") in caplog.record_tuples
+
+
 @pytest.mark.parametrize("topic", ["test/filter-1", "test/filter-2"])
 def test_filter_valid_accept(topic, caplog):
     """
@@ -293,6 +330,220 @@ def test_xform_func_failure(caplog):
     assert "Invoking function failed: unknown_func()" in caplog.messages
 
 
+def test_routing_workers(tmp_ini, caplog):
+    """
+    Verify inbound messages are routed by routing workers, off the network thread, when enabled.
+    """
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = log
+routing_workers = 2
+queue_max_jobs = 10
+
+[config:log]
+targets = {'info': ['info']}
+
+[test/routing]
+targets = log:info
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT message to the core machinery for processing.
+    send_message(topic="test/routing", payload="foobar")
+
+    assert "Starting 2 routing threads" in caplog.messages
+    # The ingest queue is never bounded, so that the network loop does not block.
+    assert mqttwarn.core.ingest_queue.maxsize == 0
+    assert ("mqttwarn.services.log", 20, "foobar") in caplog.record_tuples
+    records = [record for record in caplog.records if record.getMessage() == "Message received on test/routing: foobar"]
+    assert len(records) == 1
+    assert records[0].threadName.startswith("mqttwarn-router-")
+
+    # Bootstrapping again resets to routing inline.
+    core_bootstrap(configfile=configfile_full)
+    assert mqttwarn.core.routers == []
+
+
+def test_routing_workers_asyncio(tmp_ini, caplog):
+    """
+    Verify inbound messages are routed off the event loop, when the MQTT client is driven by it.
+    """
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = log
+runtime = asyncio
+
+[config:log]
+targets = {'info': ['info']}
+
+[test/routing]
+targets = log:info
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    send_message(topic="test/routing", payload="foobar")
+
+    assert "Starting 1 routing threads" in caplog.messages
+    assert ("mqttwarn.services.log", 20, "foobar") in caplog.record_tuples
+
+    # Bootstrapping again resets to routing inline.
+    core_bootstrap(configfile=configfile_full)
+    assert mqttwarn.core.routers == []
+
+
+def test_on_disconnect_asyncio(mocker):
+    """
+    Verify handling a lost connection does not block the event loop driving the MQTT client.
+    """
+    send_failover = mocker.patch.object(mqttwarn.core, "send_failover")
+
+    async def main():
+        started = time.monotonic()
+        mqttwarn.core.on_disconnect(None, {}, 1)  # ty: ignore[invalid-argument-type]
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) < 1.0
+    message = b"Broker connection lost. Will attempt to reconnect in 5s"
+    send_failover.assert_called_once_with("brokerdisconnected", message)
+
+
+def test_sharded_service_dispatch(tmp_ini, caplog, mocker):
+    """
+    Verify jobs of sharded services are submitted to their job queue in order,
+    while other services are dispatched by all dispatcher threads.
+    """
+    tmp_ini.write_text(
+        """
+[defaults]
+launch = log, file
+num_workers = 3
+
+[config:log]
+targets = {'info': ['info']}
+shard_key = topic
+workers = 2
+
+[config:file]
+targets = {'f01': ['/dev/null']}
+
+[test/sharded]
+targets = log:info
+
+[test/file]
+targets = file:f01
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+    assert "Starting 3 worker threads" in caplog.messages
+
+    q_in_put = mocker.spy(mqttwarn.core.q_in, "put")
+    for number in range(10):
+        send_message(topic="test/sharded", payload=f"message {number}")
+    assert q_in_put.call_count == 0
+
+    messages = [record.getMessage() for record in caplog.records if record.name == "mqttwarn.services.log"]
+    messages = [message for message in messages if not message.startswith("*** MODULE")]
+    assert messages == [f"message {number}" for number in range(10)]
+
+    send_message(topic="test/file", payload="foobar")
+    assert q_in_put.call_count == 1
+
+
+def test_routing_processes(tmp_ini, caplog):
+    """
+    Verify inbound messages are routed and rendered by routing processes, when enabled.
+    """
+    tmp_ini.write_text(
+        """
+[defaults]
+functions = 'tests/etc/functions_good.py'
+launch = log
+routing_processes = 2
+
+[config:log]
+targets = {'info': ['info']}
+
+[test/routing]
+targets = log:info
+alldata = alldata_dummy()
+format = {payload}: {alldata-key}
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT message to the core machinery for processing.
+    send_message(topic="test/routing", payload="foobar")
+    assert mqttwarn.core.drain_queues(timeout=5.0) is True
+
+    assert "Starting 2 routing processes" in caplog.messages
+    assert ("mqttwarn.services.log", 20, "foobar: alldata-value") in caplog.record_tuples
+    pool = mqttwarn.core.routing_pool
+    assert pool is not None
+    assert sum(pool.stats()["processed"]) == 1
+
+    # Bootstrapping again stops the routing processes.
+    core_bootstrap(configfile=configfile_full)
+    assert mqttwarn.core.routing_pool is None
+    assert pool.stats()["alive"] == 0
+
+
+def test_init_routing_process(mocker):
+    """
+    Verify a routing process closes the socket of the MQTT client, and the spool, inherited from the parent process.
+    """
+    mqttc = mocker.patch.object(mqttwarn.core, "mqttc")
+    spool = mocker.patch.object(mqttwarn.core, "spool")
+    mqttwarn.core.init_routing_process()
+    mqttc.socket.return_value.close.assert_called_once_with()
+    mqttc.disconnect.assert_not_called()
+    spool.release.assert_called_once_with()
+    spool.close.assert_not_called()
+    assert mqttwarn.core.spool is None
+
+
+def test_render_once_per_section(tmp_ini, caplog):
+    """
+    Verify the outbound message is rendered only once for all targets of a section.
+    """
+    tmp_ini.write_text(
+        """
+[defaults]
+functions = 'tests/etc/functions_good.py'
+launch = log
+
+[config:log]
+targets = {'info': ['info'], 'warn': ['warn']}
+
+[test/render-once]
+targets = log:info, log:warn
+format = unknown_func()
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT message to the core machinery for processing.
+    send_message(topic="test/render-once", payload="foobar")
+
+    # Proof that the message has been rendered once, and dispatched to both targets.
+    assert caplog.messages.count("Invoking function failed: unknown_func()") == 1
+    assert ("mqttwarn.services.log", 20, "unknown_func()") in caplog.record_tuples
+    assert ("mqttwarn.services.log", 30, "unknown_func()") in caplog.record_tuples
+
+
 def test_no_targets(tmp_ini, caplog):
     """
     Verify behavior of mqttwarn when no targets are specified.
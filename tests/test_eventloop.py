@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import asyncio
+import socket
+import threading
+import time
+from unittest.mock import Mock
+
+import paho.mqtt.client as paho
+
+from mqttwarn.eventloop import CoroutineRunner, EventLoopThread, MqttEventLoopDriver
+
+
+async def sleepy(seconds, result=True):
+    await asyncio.sleep(seconds)
+    return result
+
+
+async def failing():
+    raise ValueError("Something went wrong")
+
+
+def test_coroutine_runner_concurrency():
+    """
+    Verify coroutines run concurrently, bounded by the concurrency of the runner.
+    """
+    loop = EventLoopThread()
+    loop.start()
+    runner = CoroutineRunner(name="test", loop=loop, concurrency=10, timeout=1.0)
+    outcomes = []
+
+    started = time.monotonic()
+    for _ in range(20):
+        runner.submit(sleepy, (0.1,), on_done=lambda result, exception: outcomes.append(result))
+    assert loop.join_pending(timeout=5.0) is True
+    assert time.monotonic() - started < 1.0
+
+    assert outcomes == [True] * 20
+    assert runner.stats() == {"concurrency": 10, "in_flight": 0, "calls": 20, "timeouts": 0, "failures": 0}
+    loop.stop()
+    assert loop.is_alive() is False
+
+
+def test_coroutine_runner_timeout_and_failure(caplog):
+    loop = EventLoopThread()
+    loop.start()
+    runner = CoroutineRunner(name="test", loop=loop, timeout=0.1)
+    outcomes = []
+    done = threading.Event()
+
+    def on_done(result, exception):
+        outcomes.append((result, type(exception)))
+        if len(outcomes) == 2:
+            done.set()
+
+    runner.submit(sleepy, (10,), on_done=on_done)
+    runner.submit(failing, on_done=on_done)
+    assert done.wait(5.0) is True
+    assert sorted(outcomes, key=str) == sorted([(None, asyncio.TimeoutError), (None, ValueError)], key=str)
+    assert runner.stats()["timeouts"] == 1
+    assert runner.stats()["failures"] == 1
+    assert "Invoking service plugin timed out after 0.1 seconds. service=test" in caplog.messages
+    loop.stop()
+
+
+def test_mqtt_event_loop_driver():
+    """
+    Verify the driver reads from the socket of the client when it becomes readable, and stops on request.
+    """
+    reader, writer = socket.socketpair()
+    client = Mock(spec=paho.Client)
+    client.socket.return_value = reader
+    client.want_write.return_value = False
+    client.loop_misc.return_value = paho.MQTT_ERR_SUCCESS
+
+    stopped = threading.Event()
+
+    def loop_read():
+        reader.recv(1)
+        stopped.set()
+
+    client.loop_read.side_effect = loop_read
+
+    async def main():
+        driver = MqttEventLoopDriver(client=client)
+        task = asyncio.ensure_future(driver.run(stopped=stopped.is_set))
+        await asyncio.sleep(0.05)
+        writer.send(b"x")
+        await asyncio.wait_for(task, timeout=5.0)
+
+    asyncio.run(main())
+    assert client.loop_read.call_count == 1
+    assert client.loop_misc.called
+    reader.close()
+    writer.close()
+
+
+def test_mqtt_event_loop_driver_threadsafe():
+    """
+    Verify socket callbacks invoked by other threads, like when publishing messages, are handed over to the event loop.
+    """
+    reader, writer = socket.socketpair()
+    client = Mock(spec=paho.Client)
+    client.socket.return_value = reader
+    client.want_write.return_value = False
+    client.loop_misc.return_value = paho.MQTT_ERR_SUCCESS
+
+    stopped = threading.Event()
+    threads = []
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        add_writer = loop.add_writer
+
+        def record_add_writer(*args):
+            threads.append(threading.get_ident())
+            return add_writer(*args)
+
+        loop.add_writer = record_add_writer  # ty: ignore[invalid-assignment]
+
+        def loop_write():
+            threads.append(threading.get_ident())
+            client.on_socket_unregister_write(client, None, reader)
+            stopped.set()
+
+        client.loop_write.side_effect = loop_write
+
+        driver = MqttEventLoopDriver(client=client)
+        task = asyncio.ensure_future(driver.run(stopped=stopped.is_set))
+        await asyncio.sleep(0.05)
+        publisher = threading.Thread(target=client.on_socket_register_write, args=(client, None, reader))
+        publisher.start()
+        publisher.join()
+        await asyncio.wait_for(task, timeout=5.0)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert threads == [loop_thread, loop_thread]
+    reader.close()
+    writer.close()
+
+
+def test_mqtt_event_loop_driver_tls_pending():
+    """
+    Verify the driver keeps reading while records are pending in the TLS buffer of the socket.
+    """
+    client = Mock(spec=paho.Client)
+    client.loop_read.return_value = paho.MQTT_ERR_SUCCESS
+    client.socket.return_value.pending.side_effect = [2, 1, 0]
+
+    driver = MqttEventLoopDriver(client=client)
+    driver._read()
+    assert client.loop_read.call_count == 3
@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from mqttwarn.execution import Batcher, DeadlineMonitor, PluginCall, ServiceExecutor, ServiceOverloaded, ServiceQueue
+
+
+@pytest.fixture(scope="module")
+def monitor():
+    monitor = DeadlineMonitor()
+    monitor.start()
+    return monitor
+
+
+def test_executor_call_success(monitor):
+    executor = ServiceExecutor(name="test", monitor=monitor, timeout=1.0)
+    assert executor.call(lambda a, b: a + b, (40, 2)) == 42
+    assert executor.stats()["calls"] == 1
+    assert executor.stats()["timeouts"] == 0
+    executor.shutdown()
+
+
+def test_executor_call_exception(monitor):
+    def errfunc():
+        raise ValueError("Something went wrong")
+
+    executor = ServiceExecutor(name="test", monitor=monitor, timeout=1.0)
+    with pytest.raises(ValueError) as excinfo:
+        executor.call(errfunc, default="foobar")
+    assert str(excinfo.value) == "Something went wrong"
+    executor.shutdown()
+
+
+def test_executor_call_timeout(monitor, caplog):
+    """
+    Verify a call exceeding its deadline is accounted as hung, and its thread
+    is replaced, until it returns.
+    """
+    release = threading.Event()
+
+    executor = ServiceExecutor(name="test", monitor=monitor, timeout=0.1, max_hung=2)
+    assert executor.call(release.wait, default="foobar") == "foobar"
+    assert executor.stats()["timeouts"] == 1
+    assert executor.stats()["hung"] == 1
+    assert executor.stats()["threads"] == 2
+    assert "Invoking service plugin timed out after 0.1 seconds. service=test, hung=1/2" in caplog.messages
+
+    # The pool keeps its capacity while a call is hanging.
+    assert executor.call(lambda: 42) == 42
+
+    # When the hung call returns, the surplus thread is retired.
+    release.set()
+    for _ in range(50):
+        if executor.stats()["hung"] == 0 and executor.stats()["threads"] == 1:
+            break
+        threading.Event().wait(0.01)
+    assert executor.stats()["hung"] == 0
+    assert executor.stats()["threads"] == 1
+    executor.shutdown()
+
+
+def test_executor_replacement_keeps_serving(monitor):
+    """
+    Verify the replacement of a hung worker keeps serving the queue, while the call is still hanging.
+    """
+    release = threading.Event()
+
+    executor = ServiceExecutor(name="test", monitor=monitor, workers=1, timeout=0.2)
+    assert executor.call(release.wait) is False
+    assert executor.call(lambda: 42) == 42
+
+    # The second quick call must not be stuck behind the hung one.
+    outcome = []
+    done = threading.Event()
+
+    def call():
+        outcome.append(executor.call(lambda: 43))
+        done.set()
+
+    threading.Thread(target=call, daemon=True).start()
+    assert done.wait(1.0) is True
+    assert outcome == [43]
+    assert executor.stats()["threads"] == 2
+
+    release.set()
+    for _ in range(50):
+        if executor.stats()["threads"] == 1:
+            break
+        threading.Event().wait(0.01)
+    assert executor.stats()["hung"] == 0
+    assert executor.stats()["threads"] == 1
+    assert executor.call(lambda: 44) == 44
+    executor.shutdown()
+
+
+def test_executor_deadline_starts_when_running(monitor):
+    """
+    Verify the deadline of a call starts when it starts running, not while it waits for a worker.
+    """
+    executor = ServiceExecutor(name="test", monitor=monitor, workers=1, timeout=0.3)
+    calls = [executor.submit(time.sleep, (0.2,)) for _ in range(3)]
+    for call in calls:
+        call.wait()
+    assert [call.state for call in calls] == [PluginCall.DONE] * 3
+    assert executor.stats()["timeouts"] == 0
+    executor.shutdown()
+
+
+def test_executor_rejects_when_overloaded(monitor):
+    """
+    Verify a service with too many hung calls rejects new work, until they return.
+    """
+    release = threading.Event()
+
+    executor = ServiceExecutor(name="test", monitor=monitor, timeout=0.05, max_hung=2)
+    assert executor.call(release.wait) is False
+    assert executor.call(release.wait) is False
+    with pytest.raises(ServiceOverloaded) as excinfo:
+        executor.call(lambda: 42)
+    assert str(excinfo.value) == "Service 'test' has 2 hung calls, rejecting new work until they return"
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["threads"] == 3
+
+    release.set()
+    for _ in range(50):
+        if executor.stats()["hung"] == 0:
+            break
+        threading.Event().wait(0.01)
+    assert executor.call(lambda: 42) == 42
+    executor.shutdown()
+
+
+def test_service_queue_stats():
+    processed = []
+    queue = ServiceQueue(name="test", handler=lambda job, worker_id: processed.append(job), workers=2)
+    queue.put("foo")
+    queue.put("bar")
+    queue.join()
+    assert sorted(processed) == ["bar", "foo"]
+
+    stats = queue.stats()
+    assert stats["queued"] == 0
+    assert stats["workers"] == 2
+    assert stats["busy"] == 0
+    assert stats["processed"] == 2
+    assert 0 <= stats["utilization"] <= 1
+    queue.shutdown()
+
+
+def test_service_queue_isolation():
+    """
+    Verify a stalled service does not stall other services.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+
+    def stall(job, worker_id):
+        started.set()
+        release.wait()
+
+    slow = ServiceQueue(name="slow", handler=stall, workers=1)
+    fast = ServiceQueue(name="fast", handler=lambda job, worker_id: processed.append(job), workers=1)
+
+    slow.put("foo")
+    slow.put("bar")
+    started.wait()
+    fast.put("baz")
+    fast.join()
+
+    assert processed == ["baz"]
+    assert slow.stats()["busy"] == 1
+    assert slow.stats()["queued"] == 1
+
+    release.set()
+    slow.join()
+    slow.shutdown()
+    fast.shutdown()
+
+
+def test_service_queue_priority():
+    """
+    Verify more urgent jobs are scheduled first, and less urgent ones are aging.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+
+    def handler(job, worker_id):
+        if job.name == "blocker":
+            started.set()
+            release.wait()
+        processed.append(job.name)
+
+    queue = ServiceQueue(name="test", handler=handler, workers=1, aging=10.0)
+    queue.put(SimpleNamespace(name="blocker", prio=0))
+    started.wait()
+    queue.put(SimpleNamespace(name="telemetry", prio=0))
+    queue.put(SimpleNamespace(name="alarm", prio=2))
+    queue.put(SimpleNamespace(name="warning", prio=1))
+    release.set()
+    queue.join()
+    assert processed == ["blocker", "alarm", "warning", "telemetry"]
+
+    stats = queue.stats()
+    assert list(stats["wait"].keys()) == [0, 1, 2]
+    assert stats["wait"][0]["count"] == 2
+    assert stats["wait"][2]["count"] == 1
+    assert stats["wait"][2]["max"] >= stats["wait"][2]["mean"] >= 0
+    queue.shutdown()
+
+
+def test_service_queue_priority_aging():
+    """
+    Verify a less urgent job which has waited long enough is scheduled before a more urgent one.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+
+    def handler(job, worker_id):
+        if job.name == "blocker":
+            started.set()
+            release.wait()
+        processed.append(job.name)
+
+    queue = ServiceQueue(name="test", handler=handler, workers=1, aging=0.05)
+    queue.put(SimpleNamespace(name="blocker", prio=0))
+    started.wait()
+    queue.put(SimpleNamespace(name="telemetry", prio=0))
+    threading.Event().wait(0.1)
+    queue.put(SimpleNamespace(name="alarm", prio=1))
+    release.set()
+    queue.join()
+    assert processed == ["blocker", "telemetry", "alarm"]
+    queue.shutdown()
+
+
+def stalled_queue(**kwargs):
+    """
+    Provide a queue whose single worker is stalled, until the returned event is set.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+
+    def handler(job, worker_id):
+        if job.name == "blocker":
+            started.set()
+            release.wait()
+        processed.append(job.name)
+
+    queue = ServiceQueue(name="test", handler=handler, workers=1, **kwargs)
+    queue.put(SimpleNamespace(name="blocker", prio=0, section="test/blocker", payload=b""))
+    started.wait()
+    return queue, release, processed
+
+
+def make_job(name, prio=0, payload=b"", section="test/section"):
+    return SimpleNamespace(name=name, prio=prio, section=section, payload=payload)
+
+
+def test_service_queue_overflow_drop_newest():
+    queue, release, processed = stalled_queue(max_jobs=2, overflow="drop_newest")
+    assert queue.put(make_job("foo")) is True
+    assert queue.put(make_job("bar")) is True
+    assert queue.put(make_job("baz")) is False
+    assert queue.stats()["dropped"] == {"test/section": 1}
+    release.set()
+    queue.join()
+    assert processed == ["blocker", "foo", "bar"]
+    queue.shutdown()
+
+
+def test_service_queue_overflow_drop_oldest():
+    queue, release, processed = stalled_queue(max_jobs=2, overflow="drop_oldest")
+    assert queue.put(make_job("foo")) is True
+    assert queue.put(make_job("bar")) is True
+    assert queue.put(make_job("baz")) is True
+    assert queue.stats()["dropped"] == {"test/section": 1}
+    release.set()
+    queue.join()
+    assert processed == ["blocker", "bar", "baz"]
+    queue.shutdown()
+
+
+def test_service_queue_overflow_drop_oldest_sustained():
+    """
+    Verify evicting the oldest jobs from a full queue keeps the queue compact, and the order of the remaining jobs.
+    """
+    queue, release, processed = stalled_queue(max_jobs=10, overflow="drop_oldest", drop_below=1)
+    for index in range(5):
+        assert queue.put(make_job(f"telemetry-{index}", prio=0, section="test/telemetry")) is True
+    for index in range(1000):
+        assert queue.put(make_job(f"alarm-{index}", prio=1, section="test/alarm")) is True
+    assert queue.stats()["queued"] == 10
+    assert queue.stats()["dropped"] == {"test/telemetry": 5, "test/alarm": 990}
+    assert sum(len(heap) for heap in queue._shards) < 200
+    assert len(queue._oldest) < 200
+    release.set()
+    queue.join()
+    assert processed == ["blocker"] + [f"alarm-{index}" for index in range(990, 1000)]
+    queue.shutdown()
+
+
+def test_service_queue_overflow_bytes():
+    """
+    Verify the queue is bounded by the size of the payloads.
+    """
+    queue, release, processed = stalled_queue(max_bytes=1000, overflow="drop_newest")
+    assert queue.put(make_job("foo", payload=b"x" * 600)) is True
+    assert queue.put(make_job("bar", payload=b"x" * 600, section="test/snapshot")) is False
+    assert queue.put(make_job("baz", payload=b"x" * 300)) is True
+    assert queue.stats()["queued_bytes"] == 900
+    assert queue.stats()["dropped"] == {"test/snapshot": 1}
+    release.set()
+    queue.join()
+    assert processed == ["blocker", "foo", "baz"]
+    queue.shutdown()
+
+
+def test_service_queue_overflow_drop_below_priority():
+    """
+    Verify less urgent jobs are dropped first, before applying the overflow policy.
+    """
+    queue, release, processed = stalled_queue(max_jobs=2, overflow="drop_newest", drop_below=1)
+    assert queue.put(make_job("telemetry-1", prio=0, section="test/telemetry")) is True
+    assert queue.put(make_job("telemetry-2", prio=0, section="test/telemetry")) is True
+    assert queue.put(make_job("telemetry-3", prio=0, section="test/telemetry")) is False
+    assert queue.put(make_job("alarm-1", prio=2, section="test/alarm")) is True
+    assert queue.put(make_job("alarm-2", prio=2, section="test/alarm")) is True
+    assert queue.put(make_job("alarm-3", prio=2, section="test/alarm")) is False
+    assert queue.stats()["dropped"] == {"test/telemetry": 3, "test/alarm": 1}
+    release.set()
+    queue.join()
+    assert processed == ["blocker", "alarm-1", "alarm-2"]
+    queue.shutdown()
+
+
+def test_service_queue_overflow_block():
+    """
+    Verify submitting a job to a full queue blocks, until there is room for it.
+    """
+    queue, release, processed = stalled_queue(max_jobs=1, overflow="block")
+    assert queue.put(make_job("foo")) is True
+
+    submitted = threading.Event()
+
+    def submit():
+        queue.put(make_job("bar"))
+        submitted.set()
+
+    threading.Thread(target=submit, daemon=True).start()
+    assert submitted.wait(0.1) is False
+
+    release.set()
+    assert submitted.wait(1.0) is True
+    queue.join()
+    assert processed == ["blocker", "foo", "bar"]
+    assert queue.stats()["dropped"] == {}
+    queue.shutdown()
+
+
+def test_service_queue_overflow_block_shutdown():
+    """
+    Verify producers blocked on a full queue are released when it is shut down, without queueing their jobs.
+    """
+    queue, release, processed = stalled_queue(max_jobs=1, overflow="block")
+    assert queue.put(make_job("foo")) is True
+
+    outcome = []
+    submitted = threading.Event()
+
+    def submit():
+        outcome.append(queue.put(make_job("bar")))
+        submitted.set()
+
+    threading.Thread(target=submit, daemon=True).start()
+    assert submitted.wait(0.1) is False
+
+    queue.shutdown()
+    assert submitted.wait(1.0) is True
+    assert outcome == [False]
+    release.set()
+    queue.join()
+    assert processed == ["blocker", "foo"]
+
+
+def test_service_queue_overflow_invalid():
+    with pytest.raises(ValueError) as excinfo:
+        ServiceQueue(name="test", handler=None, overflow="foo")  # ty: ignore[invalid-argument-type]
+    assert str(excinfo.value) == "Invalid overflow policy 'foo', use one of block, drop_oldest, drop_newest"
+
+
+def test_service_queue_sharded_ordering():
+    """
+    Verify jobs with the same shard key are processed in order, while being spread across workers.
+    """
+    processed = []
+    workers = {}
+
+    def handler(job, worker_id):
+        time.sleep(random.uniform(0, 0.002))
+        workers.setdefault(job.topic, set()).add(worker_id)
+        processed.append((job.topic, job.seq))
+
+    queue = ServiceQueue(name="test", handler=handler, workers=4, shard=lambda job: job.topic)
+    topics = [f"test/device-{index}" for index in range(8)]
+    for seq in range(20):
+        for topic in topics:
+            queue.put(SimpleNamespace(topic=topic, seq=seq, prio=0))
+    queue.join()
+
+    for topic in topics:
+        assert [seq for processed_topic, seq in processed if processed_topic == topic] == list(range(20))
+        assert len(workers[topic]) == 1
+    assert len(set.union(*workers.values())) > 1
+
+    stats = queue.stats()["shards"]
+    assert sum(stats["assigned"]) == 160
+    assert stats["queued"] == [0, 0, 0, 0]
+    assert stats["imbalance"] >= 1.0
+    queue.shutdown()
+
+
+def test_service_queue_sharded_priority():
+    """
+    Verify jobs of a shard are processed in the order they have been submitted, regardless of their priority.
+    """
+    release = threading.Event()
+    processed = []
+
+    def handler(job, worker_id):
+        if job.seq == 0:
+            release.wait(1.0)
+        processed.append(job.seq)
+
+    queue = ServiceQueue(name="test", handler=handler, workers=2, shard=lambda job: "foo")
+    for seq, prio in enumerate([0, 1, 5, 0, 9, 2]):
+        queue.put(SimpleNamespace(seq=seq, prio=prio))
+    release.set()
+    queue.join()
+    assert processed == [0, 1, 2, 3, 4, 5]
+    queue.shutdown()
+
+
+def test_service_queue_sharded_imbalance():
+    """
+    Verify the imbalance of shards is reported, when all jobs share the same key.
+    """
+    queue = ServiceQueue(name="test", handler=lambda job, worker_id: None, workers=2, shard=lambda job: "foo")
+    assert queue.stats()["shards"]["imbalance"] == 1.0
+    for _ in range(4):
+        queue.put(SimpleNamespace(prio=0))
+    queue.join()
+    assert sorted(queue.stats()["shards"]["assigned"]) == [0, 4]
+    assert queue.stats()["shards"]["imbalance"] == 2.0
+    queue.shutdown()
+
+    queue = ServiceQueue(name="test", handler=lambda job, worker_id: None, workers=2)
+    assert "shards" not in queue.stats()
+    queue.shutdown()
+
+
+def test_batcher_size_and_linger():
+    flushed = []
+    done = threading.Event()
+
+    def flush(entries):
+        flushed.append(entries)
+        if len(flushed) == 2:
+            done.set()
+        return [entry != "fail" for entry in entries]
+
+    batcher = Batcher(name="test", flush=flush, size=2, linger=0.05)
+    batcher.add("foo")
+    batcher.add("fail")
+    batcher.add("bar")
+    assert flushed == [["foo", "fail"]]
+    assert done.wait(1.0) is True
+    assert flushed == [["foo", "fail"], ["bar"]]
+    assert batcher.stats() == {"pending": 0, "batches": 2, "delivered": 2, "failed": 1}
+    batcher.close()
+
+
+def test_batcher_flush_failure(caplog):
+    def flush(entries):
+        raise ValueError("Something went wrong")
+
+    batcher = Batcher(name="test", flush=flush, size=10, linger=10)
+    batcher.add("foo")
+    batcher.flush()
+    assert batcher.stats() == {"pending": 0, "batches": 1, "delivered": 0, "failed": 1}
+    assert "Flushing batch failed. name=test, size=1" in caplog.messages
+    batcher.close()
+
+
+def test_batcher_single_flusher_thread():
+    """
+    Verify lingering batches are flushed by one long-lived thread, which flushes the pending batch when closed.
+    """
+    flushed = []
+
+    batcher = Batcher(name="test", flush=lambda entries: flushed.append(entries) or [True] * len(entries), linger=0.01)
+    for index in range(5):
+        batcher.add(index)
+        for _ in range(100):
+            if len(flushed) > index:
+                break
+            threading.Event().wait(0.01)
+        assert not any(isinstance(thread, threading.Timer) for thread in threading.enumerate())
+        assert [thread.name for thread in threading.enumerate()].count("mqttwarn-batcher-test") == 1
+    assert flushed == [[0], [1], [2], [3], [4]]
+
+    batcher.linger = 10
+    batcher.add("foo")
+    batcher.close()
+    assert flushed[-1] == ["foo"]
+    assert not any(thread.name == "mqttwarn-batcher-test" for thread in threading.enumerate())
+
+    # Entries added after closing are flushed right away.
+    batcher.add("bar")
+    assert flushed[-1] == ["bar"]
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 # (c) 2018-2022 The mqttwarn developers
+import json
+import pickle
 from copy import deepcopy
 
 from mqttwarn.core import make_service
-from mqttwarn.model import Job, ProcessorItem, Struct
+from mqttwarn.model import Job, MessageEnvelope, ProcessorItem, Struct, TransformationData
 
 JOB_PRIO1 = dict(
     prio=1, service="service", section="section", topic="topic", payload="payload", data="data", target="target"
@@ -62,6 +64,31 @@ def test_struct():
     assert struct.enum() == data
 
 
+def test_struct_compact():
+    """
+    Verify the fields populated by the core are slotted, while other attributes are still accepted.
+    """
+    data = {"foo": "bar"}
+    struct = Struct(service="log", message="Hello", data=data, priority=None)
+    assert struct.__dict__ == {}
+    assert struct.data is data
+    assert struct.get("message") == "Hello"
+    assert struct.get("priority", default=0) == 0
+    assert struct.get("title") is None
+    assert struct.get("enum") is None
+
+    struct.extra = 42  # ty: ignore[unresolved-attribute]
+    assert struct.get("extra") == 42
+    assert struct.enum() == {"service": "log", "data": data, "message": "Hello", "priority": None, "extra": 42}
+
+
+def test_job_slots():
+    job = Job(1, "log", "test/section", "test/topic", "foo", {}, "info")
+    assert not hasattr(job, "__dict__")
+    assert job.rendering is None
+    assert job.spool_id is None
+
+
 def test_processoritem():
     item = ProcessorItem()
     assert item.asdict() == {
@@ -77,3 +104,67 @@ def test_processoritem():
         "data": None,
     }
     assert item.get("foo") is None
+
+
+def test_message_envelope_json():
+    envelope = MessageEnvelope(topic="foo", payload=b'{"hello": "world"}\x00')
+    assert envelope.text == '{"hello": "world"}\x00'
+    assert envelope.payload_data == {"hello": "world"}
+    assert envelope.payload_data is envelope.payload_data
+
+
+def test_message_envelope_copy_payload_data():
+    envelope = MessageEnvelope(topic="foo", payload=b'{"sensor": {"values": [1, 2]}, "name": "foo"}')
+    data = envelope.copy_payload_data()
+    assert data is not None
+    data["sensor"]["values"].append(3)
+    data["sensor"]["unit"] = "C"
+    assert envelope.payload_data == {"sensor": {"values": [1, 2]}, "name": "foo"}
+    assert envelope.copy_payload_data() == {"sensor": {"values": [1, 2]}, "name": "foo"}
+    assert MessageEnvelope(topic="foo", payload=b"bar").copy_payload_data() is None
+
+
+def test_message_envelope_binary(caplog):
+    envelope = MessageEnvelope(topic="foo", payload=b"\xff\xfe")
+    assert envelope.text == b"\xff\xfe"
+    assert envelope.payload_data is None
+    assert envelope.payload_data is None
+    assert len([message for message in caplog.messages if message.startswith("Decoding from UTF-8 failed")]) == 1
+
+
+def test_transformation_data_lazy_timestamps():
+    data = TransformationData(topic="foo").defer_timestamps(1392628581.910691)
+    assert dict.keys(data) == {"topic"}
+    assert "_dtepoch" in data
+
+    # Looking up individual keys computes only the requested field.
+    assert "{topic} at {_dtepoch}".format_map(data) == "foo at 1392628581"
+    assert data["_dtiso"] == "2014-02-17T09:16:21.910691Z"
+    assert data.get("_dthhmm") is not None
+    assert dict.keys(data) == {"topic", "_dtepoch", "_dtiso", "_dthhmm"}
+
+    # Copies keep pending fields lazy.
+    copy = data.copy()
+    assert dict.keys(copy) == {"topic", "_dtepoch", "_dtiso", "_dthhmm"}
+    assert copy["_dthhmmss"] == data["_dthhmmss"]
+
+
+def test_transformation_data_whole_mapping():
+    data = TransformationData(topic="foo").defer_timestamps(1392628581.0)
+    assert "{topic} {_ltiso}".format(**data).startswith("foo 2014-02-")
+    assert len(data) == 6
+    assert sorted(data) == ["_dtepoch", "_dthhmm", "_dthhmmss", "_dtiso", "_ltiso", "topic"]
+    assert json.loads(json.dumps(TransformationData(topic="foo").defer_timestamps(1.0)))["_dtepoch"] == 1
+    assert dict(TransformationData(topic="foo").defer_timestamps(1.0))["_dtepoch"] == 1
+    assert pickle.loads(pickle.dumps(TransformationData(topic="foo").defer_timestamps(1.0)))["_dtepoch"] == 1
+
+
+def test_transformation_data_mutable():
+    data = TransformationData(topic="foo").defer_timestamps(1.0)
+    data["_dtepoch"] = 42
+    data.update({"bar": "baz"})
+    del data["_dtiso"]
+    assert data["_dtepoch"] == 42
+    assert "_dtiso" not in data
+    assert data.pop("bar") == "baz"
+    assert data.setdefault("qux", 1) == 1
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import pytest
+
+from mqttwarn.configuration import Config
+from mqttwarn.context import RuntimeContext
+from mqttwarn.plan import UserFunction, compile_section, compile_service, compile_template
+from tests import funcfile_good
+
+
+@pytest.fixture
+def plan_config(tmp_path) -> Config:
+    """
+    Provide a configuration object to the plan compiler test cases.
+    """
+    ini_file = tmp_path.joinpath("test-plan.ini")
+    ini_file.write_text(
+        f"""
+    [defaults]
+    functions = {funcfile_good}
+
+    [config:log]
+    targets = {{"info": ["info"]}}
+    decode_utf8 = False
+
+    [test/list]
+    topic   = test/#
+    qos     = 2
+    targets = log:info, log:warn
+    filter  = filter_dummy_v2()
+    datamap = unknown_function()
+    format  = {{name}}: {{value}}
+
+    [test/dict]
+    targets = {{"test/foo": "log:info"}}
+
+    [test/function]
+    targets = get_targets_valid()
+    alldata = invalid-function-name
+    """
+    )
+    return Config(configuration_file=ini_file)
+
+
+def test_compile_section_list_targets(plan_config):
+    """
+    Verify compiling a section with a list of targets and user-defined functions.
+    """
+    plan = compile_section(plan_config, "test/list")
+    assert plan.exists is True
+    assert plan.topic == "test/#"
+    assert plan.qos == 2
+    assert plan.targets_list == ("log:info", "log:warn")
+    assert plan.targets_dict is None
+    assert plan.targets_function is None
+    assert plan.get("format") == "{name}: {value}"
+    assert plan.get("unknown") is None
+
+    assert isinstance(plan.filter, UserFunction)
+    assert plan.filter.name == "filter_dummy_v2"
+    assert plan.filter.resolve() is plan_config.functions.filter_dummy_v2
+
+    assert plan.datamap is not None
+    assert plan.datamap.name == "unknown_function"
+    with pytest.raises(AttributeError) as ex:
+        plan.datamap.resolve()
+    assert ex.match("Function 'unknown_function' does not exist")
+
+
+def test_compile_section_dict_and_function_targets(plan_config):
+    """
+    Verify compiling sections with a dispatcher dictionary or a function as targets.
+    """
+    plan = compile_section(plan_config, "test/dict")
+    assert plan.targets_dict == {"test/foo": "log:info"}
+    assert plan.targets_list is None
+
+    plan = compile_section(plan_config, "test/function")
+    assert plan.targets_function is not None
+    assert plan.targets_function.name == "get_targets_valid"
+    assert plan.alldata is not None
+    assert str(plan.alldata) == "invalid-function-name"
+    with pytest.raises(ValueError) as ex:
+        plan.alldata.resolve()
+    assert ex.match("Invalid function name: invalid-function-name")
+
+
+def test_compile_section_unknown(plan_config):
+    """
+    Verify compiling an unknown section yields an empty plan.
+    """
+    plan = compile_section(plan_config, "unknown")
+    assert plan.exists is False
+    assert plan.topic == "unknown"
+    assert plan.targets_list is None
+
+
+def test_compile_service(plan_config):
+    """
+    Verify compiling a `[config:<service>]` section.
+    """
+    plan = compile_service(plan_config, "log")
+    assert plan.exists is True
+    assert plan.config == {"decode_utf8": False}
+    assert plan.targets == {"info": ["info"]}
+    assert plan.decode_utf8 is False
+    assert plan.plugin_timeout == 10.0
+    assert plan.plugin_max_hung == 5
+
+    assert compile_service(plan_config, "unknown").exists is False
+
+
+def test_runtime_context_plans_recompiled(plan_config):
+    """
+    Verify the `RuntimeContext` recompiles its plans when the configuration has been modified.
+    """
+    context = RuntimeContext(config=plan_config, invoker=None)
+    context.compile()
+    assert context.get_plan("test/list").qos == 2
+    assert context.get_plan("test/list") is context.get_plan("test/list")
+
+    plan_config.set("test/list", "qos", "1")
+    assert context.get_plan("test/list").qos == 1
+
+
+def test_compile_template(plan_config):
+    """
+    Verify compiling format strings and function references.
+    """
+    template = compile_template(plan_config, "{name}: {value}")
+    assert template.function is None
+    assert template.format.format({"name": "foo", "value": 42}) == "foo: 42"
+
+    template = compile_template(plan_config, "xform_func()")
+    assert str(template) == "xform_func()"
+    assert template.function is not None
+    assert template.function.resolve() is plan_config.functions.xform_func
+
+    plan = compile_section(plan_config, "test/list")
+    assert plan.format is not None
+    assert plan.format.value == "{name}: {value}"
+    assert plan.title is None
+
+
+def test_runtime_context_job_priority(plan_config):
+    """
+    Verify the scheduling priority of jobs is derived from the section, or from the service.
+    """
+    plan_config.add_section("test/priority-constant")
+    plan_config.set("test/priority-constant", "priority", "2")
+    plan_config.add_section("test/priority-template")
+    plan_config.set("test/priority-template", "priority", "{level}")
+
+    context = RuntimeContext(config=plan_config, invoker=None)
+    assert context.get_job_priority("test/priority-constant", "log") == 2
+    assert context.get_job_priority("test/priority-template", "log") == 0
+    assert context.get_job_priority("test/list", "log") == 0
+
+    plan_config.set("config:log", "job_priority", "1")
+    assert context.get_job_priority("test/priority-constant", "log") == 2
+    assert context.get_job_priority("test/priority-template", "log") == 1
+
+
+def test_compile_service_shard_key(plan_config):
+    """
+    Verify the `shard_key` option of a service is validated.
+    """
+    assert compile_service(plan_config, "log").shard_key is None
+
+    plan_config.set("config:log", "shard_key", "data:device")
+    assert compile_service(plan_config, "log").shard_key == "data:device"
+
+    plan_config.set("config:log", "shard_key", "foo")
+    with pytest.raises(ValueError) as excinfo:
+        compile_service(plan_config, "log")
+    assert str(excinfo.value) == "Invalid shard key 'foo', use one of topic, section, data:<field>"
+
+
+def test_compile_service_batch(plan_config):
+    """
+    Verify the `batch` option of a service is a boolean, or a list of target names.
+    """
+    assert compile_service(plan_config, "log").batch is None
+
+    plan_config.set("config:log", "batch", "False")
+    assert compile_service(plan_config, "log").batch is False
+
+    plan_config.set("config:log", "batch", "['info']")
+    assert compile_service(plan_config, "log").batch == ("info",)
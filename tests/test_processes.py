@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import os
+import signal
+import threading
+import zlib
+
+import pytest
+
+from mqttwarn.processes import ProcessPool
+
+state = {}
+
+
+def handle(item):
+    key, seq = item
+    if seq == "crash":
+        os._exit(1)
+    return [(key, seq, os.getpid())]
+
+
+def initialize():
+    state["initialized"] = True
+
+
+def handle_initialized(item):
+    key, seq = item
+    return [(key, seq, "initialized" if state.get("initialized") else None)]
+
+
+def test_process_pool_ordering():
+    """
+    Verify items are handled in worker processes, in order per key.
+    """
+    delivered = []
+    pool = ProcessPool(name="test", handler=handle, deliver=delivered.extend, processes=2)
+    for seq in range(20):
+        for key in ["foo", "bar", "baz"]:
+            pool.submit((key, seq), key=key)
+    assert pool.join(timeout=5.0) is True
+
+    for key in ["foo", "bar", "baz"]:
+        assert [seq for item_key, seq, _ in delivered if item_key == key] == list(range(20))
+    assert os.getpid() not in {pid for _, _, pid in delivered}
+
+    stats = pool.stats()
+    assert stats["processes"] == 2
+    assert stats["alive"] == 2
+    assert sum(stats["processed"]) == 60
+    assert stats["in_flight"] == [0, 0]
+    pool.shutdown()
+    assert pool.stats()["alive"] == 0
+
+
+def test_process_pool_respawn(caplog):
+    """
+    Verify a crashed worker process is replaced by a new one, forked from the supervisor process, taking over its keys.
+    """
+    delivered = []
+    pool = ProcessPool(name="test", handler=handle, deliver=delivered.extend, processes=2)
+    index = zlib.crc32(b"foo") % 2
+    pool.submit(("foo", 0), key="foo")
+    assert pool.join(timeout=5.0) is True
+    [(_, _, crashed)] = delivered
+
+    pool.submit(("foo", "crash"), key="foo")
+    assert pool.join(timeout=5.0) is True
+    assert pool.stats()["lost"] == 1
+    message = f"Worker process exited unexpectedly. name=test, process={index}, pid={crashed}, lost=1"
+    assert message in caplog.messages
+
+    pool.submit(("foo", 1), key="foo")
+    assert pool.join(timeout=5.0) is True
+    [(_, _, respawned)] = delivered[1:]
+    assert respawned not in [crashed, os.getpid()]
+    assert pool._workers[index].pid == respawned
+    assert f"Respawned worker process. name=test, process={index}, pid={respawned}" in caplog.messages
+
+    # Also when a worker process is killed from outside.
+    os.kill(respawned, signal.SIGKILL)
+    for _ in range(100):
+        if pool.stats()["respawned"] == 2:
+            break
+        threading.Event().wait(0.01)
+    pool.submit(("foo", 2), key="foo")
+    assert pool.join(timeout=5.0) is True
+    assert delivered[-1][:2] == ("foo", 2)
+
+    stats = pool.stats()
+    assert stats["alive"] == 2
+    assert stats["respawned"] == 2
+    assert pool.is_alive() is True
+    pool.shutdown()
+    assert pool.stats()["alive"] == 0
+    assert pool.is_alive() is False
+
+
+def test_process_pool_supervisor_exited(caplog):
+    """
+    Verify the keys of a worker process which could not be replaced are handed over to the remaining worker processes.
+    """
+    delivered = []
+    pool = ProcessPool(name="test", handler=handle, deliver=delivered.extend, processes=2)
+    pool._supervisor.kill()
+    pool._supervisor.join()
+
+    pool.submit(("foo", "crash"), key="foo")
+    assert pool.join(timeout=5.0) is True
+    for _ in range(100):
+        if pool.stats()["alive"] == 1:
+            break
+        threading.Event().wait(0.01)
+    assert pool.stats()["alive"] == 1
+    assert pool.is_alive() is True
+    assert "Respawning worker process failed. name=test, process=%s" % (zlib.crc32(b"foo") % 2) in caplog.messages
+
+    pool.submit(("foo", 1), key="foo")
+    assert pool.join(timeout=5.0) is True
+    assert delivered[0][:2] == ("foo", 1)
+
+    # Once all worker processes have exited, submitting fails.
+    pool.submit(("foo", "crash"), key="foo")
+    assert pool.join(timeout=5.0) is True
+    for _ in range(100):
+        if not pool.is_alive():
+            break
+        threading.Event().wait(0.01)
+    assert pool.is_alive() is False
+    with pytest.raises(RuntimeError) as excinfo:
+        pool.submit(("foo", 2), key="foo")
+    assert str(excinfo.value) == "All worker processes of pool 'test' have exited"
+    pool.shutdown()
+
+
+def test_process_pool_initializer():
+    """
+    Verify the initializer runs in each worker process, before handling items.
+    """
+    delivered = []
+    pool = ProcessPool(name="test", handler=handle_initialized, deliver=delivered.extend, initializer=initialize)
+    pool.submit(("foo", 1), key="foo")
+    assert pool.join(timeout=5.0) is True
+    assert delivered == [("foo", 1, "initialized")]
+    assert state == {}
+    pool.shutdown()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import threading
+import time
+
+import pytest
+
+from mqttwarn.model import Job, TransformationData
+from mqttwarn.spool import JobSpool
+from tests.util import core_bootstrap, send_message
+
+
+def make_job(payload="foo"):
+    data = TransformationData(topic="test/spool", payload=payload).defer_timestamps(time.time())
+    return Job(1, "log", "test/spool", "test/spool", payload, data, "info")
+
+
+def test_spool_append_acknowledge(tmp_path):
+    spool = JobSpool(path=str(tmp_path / "spool.db"))
+    first = spool.append(make_job("foo"))
+    second = spool.append(make_job("bar"))
+    assert len(spool) == 2
+
+    spool.acknowledge(first)
+    assert len(spool) == 1
+    spool.acknowledge(None)
+    assert spool.stats() == {"pending": 1, "appended": 2, "acknowledged": 1}
+
+    spool.acknowledge(second)
+    assert len(spool) == 0
+    spool.close()
+
+
+def test_spool_replay(tmp_path):
+    """
+    Verify unacknowledged jobs are replayed when opening the spool again, only once.
+    """
+    spool = JobSpool(path=str(tmp_path / "spool.db"))
+    assert list(spool.replay()) == []
+    spool.acknowledge(spool.append(make_job("foo")))
+    spool.append(make_job("bar"))
+    spool.close()
+
+    spool = JobSpool(path=str(tmp_path / "spool.db"), sync="full")
+    spool.append(make_job("baz"))
+    jobs = list(spool.replay())
+    assert len(jobs) == 1
+    job = jobs[0]
+    assert job.spool_id is not None
+    assert (job.prio, job.service, job.section, job.topic, job.payload, job.target) == (
+        1,
+        "log",
+        "test/spool",
+        "test/spool",
+        "bar",
+        "info",
+    )
+    assert job.data["payload"] == "bar"
+    assert "_dtepoch" in job.data
+    assert list(spool.replay()) == []
+    spool.close()
+
+
+def test_spool_unserializable(tmp_path, caplog):
+    spool = JobSpool(path=str(tmp_path / "spool.db"))
+    job = make_job()
+    job.data["lock"] = threading.Lock()
+    assert spool.append(job) is None
+    assert len(spool) == 0
+    assert "Unable to spool job, it will not survive a restart" in caplog.text
+    spool.close()
+
+
+def test_spool_compact(tmp_path):
+    spool = JobSpool(path=str(tmp_path / "spool.db"), compact_every=2)
+    for _ in range(4):
+        spool.acknowledge(spool.append(make_job("foo" * 1000)))
+    spool.compact()
+    assert len(spool) == 0
+    spool.close()
+
+
+def test_spool_release(tmp_path):
+    """
+    Verify releasing the spool, like a forked process does, neither waits for a lock held by another thread,
+    nor removes jobs.
+    """
+    spool = JobSpool(path=str(tmp_path / "spool.db"))
+    spool.append(make_job("foo"))
+    with spool._lock:
+        spool.release()
+
+    spool = JobSpool(path=str(tmp_path / "spool.db"))
+    assert len(spool) == 1
+    spool.close()
+
+
+def test_spool_invalid_sync(tmp_path):
+    with pytest.raises(ValueError) as excinfo:
+        JobSpool(path=str(tmp_path / "spool.db"), sync="foo")
+    assert str(excinfo.value) == "Invalid spool sync policy 'foo', use one of full, normal, off"
+
+
+def test_spool_core(tmp_ini, tmp_path, caplog):
+    """
+    Verify jobs are spooled, acknowledged after processing, and replayed on startup.
+    """
+    spool_file = tmp_path / "spool.db"
+    spool = JobSpool(path=str(spool_file))
+    spool.append(make_job("replayed"))
+    spool.close()
+
+    tmp_ini.write_text(
+        f"""
+[defaults]
+launch = log
+spool = '{spool_file}'
+
+[config:log]
+targets = {{'info': ['info']}}
+
+[test/spool]
+targets = log:info
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT message to the core machinery for processing.
+    send_message(topic="test/spool", payload="foobar")
+
+    assert "Replaying 1 jobs from spool" in caplog.messages
+    assert ("mqttwarn.services.log", 20, "replayed") in caplog.record_tuples
+    assert ("mqttwarn.services.log", 20, "foobar") in caplog.record_tuples
+
+    import mqttwarn.core
+
+    assert mqttwarn.core.spool is not None
+    assert len(mqttwarn.core.spool) == 0
+    # Plugins are told to only report success once their outcome is durable.
+    assert mqttwarn.core.get_plugin_service("log").durable is True
+    assert mqttwarn.core.spool.stats()["acknowledged"] == 2
+
+
+def test_spool_core_failed(tmp_ini, tmp_path, caplog):
+    """
+    Verify jobs whose delivery failed are kept in the spool, and jobs left over from
+    a previous run are replayed before starting to route new messages.
+    """
+    spool_file = tmp_path / "spool.db"
+    spool = JobSpool(path=str(spool_file))
+    spool.append(make_job("replayed"))
+    spool.close()
+
+    tmp_ini.write_text(
+        f"""
+[defaults]
+launch = log, tests.acme.batch
+spool = '{spool_file}'
+routing_workers = 1
+
+[config:log]
+targets = {{'info': ['info']}}
+
+[config:tests.acme.batch]
+batch_size = 3
+targets = {{'default': ['default']}}
+
+[test/spool]
+targets = tests.acme.batch:default
+    """
+    )
+
+    # Bootstrap the core machinery without MQTT.
+    core_bootstrap(configfile=tmp_ini)
+
+    # Signal mocked MQTT messages to the core machinery for processing.
+    send_message(topic="test/spool", payload="foo")
+    send_message(topic="test/spool", payload="fail")
+    send_message(topic="test/spool", payload="bar")
+
+    assert caplog.messages.index("Replaying 1 jobs from spool") < caplog.messages.index("Starting 1 routing threads")
+    assert "Batch plugin invoked with 3 items" in caplog.messages
+
+    import mqttwarn.core
+
+    assert mqttwarn.core.spool is not None
+    assert mqttwarn.core.spool.stats()["acknowledged"] == 3
+
+    # The failed job will be retried on the next start.
+    spool = JobSpool(path=str(spool_file))
+    assert [job.payload for job in spool.replay()] == ["fail"]
+    spool.close()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# (c) 2026 The mqttwarn developers
+import paho.mqtt.client as paho
+import pytest
+
+from mqttwarn.topic import TopicDispatcher, TopicTrie, topic_specificity_key
+
+TOPIC_FILTERS = [
+    "#",
+    "+",
+    "foo",
+    "foo/#",
+    "foo/+",
+    "foo/bar",
+    "foo/+/baz",
+    "+/bar/#",
+    "$SYS/#",
+    "$SYS/+/load",
+    "+/+/+",
+]
+
+
+@pytest.mark.parametrize(
+    "topic",
+    [
+        "foo",
+        "foo/bar",
+        "foo/bar/baz",
+        "foo/qux/baz",
+        "bar",
+        "bar/bar",
+        "/foo",
+        "foo/",
+        "$SYS",
+        "$SYS/broker/load",
+        "$SYS/foo/bar",
+    ],
+)
+def test_topic_trie_matches_like_paho(topic):
+    """
+    Verify the `TopicTrie` resolves the same topic filters like `paho.topic_matches_sub`.
+    """
+    trie = TopicTrie()
+    for topic_filter in TOPIC_FILTERS:
+        trie.add(topic_filter, topic_filter)
+
+    expected = sorted(item for item in TOPIC_FILTERS if paho.topic_matches_sub(item, topic))
+    assert sorted(trie.match(topic)) == expected
+
+
+def test_topic_trie_multiple_values():
+    """
+    Verify the `TopicTrie` can store multiple values per topic filter.
+    """
+    trie = TopicTrie()
+    trie.add("foo/+", 1)
+    trie.add("foo/+", 2)
+    trie.add("bar", 3)
+    assert len(trie) == 3
+    assert sorted(trie.match("foo/bar")) == [1, 2]
+    assert trie.match("baz") == []
+
+
+@pytest.mark.parametrize("topic", ["foo", "foo/bar", "foo/bar/baz", "foo/qux/baz", "bar/bar/bar", "$SYS/foo", "baz"])
+def test_topic_dispatcher_precedence(topic):
+    """
+    Verify the `TopicDispatcher` resolves the same entry like scanning the topic filters
+    in the order of their specificity.
+    """
+    dispatcher_dict = {topic_filter: f"target-{topic_filter}" for topic_filter in TOPIC_FILTERS}
+    dispatcher = TopicDispatcher(dispatcher_dict)
+    assert len(dispatcher) == len(TOPIC_FILTERS)
+
+    expected = None
+    for topic_filter, target in sorted(
+        dispatcher_dict.items(), key=lambda item: topic_specificity_key(item[0]), reverse=True
+    ):
+        if paho.topic_matches_sub(topic_filter, topic):
+            expected = (topic_filter, target)
+            break
+    assert dispatcher.match(topic) == expected
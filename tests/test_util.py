@@ -12,6 +12,7 @@ import pytest
 
 from mqttwarn.util import (
     Formatter,
+    PreparedFormat,
     asbool,
     get_resource_content,
     import_symbol,
@@ -22,6 +23,7 @@ from mqttwarn.util import (
     load_module_from_file,
     parse_cron_options,
     sanitize_function_name,
+    split_field_name,
     timeout,
 )
 from tests import configfile_full, funcfile_bad, funcfile_good
@@ -37,6 +39,51 @@ def test_formatter_json():
     assert result == b'{"bar": "R\\u00e4uber Hotzenplotz"}'
 
 
+@pytest.mark.parametrize(
+    "template",
+    [
+        "",
+        "plain text",
+        "{foo}",
+        "{foo!j} and {bar[baz]} and {bar[list][1]}",
+        "{number:>8.2f}|{number:{width}}",
+        "{{escaped}} {foo}",
+    ],
+)
+def test_prepared_format(template):
+    data = {"foo": "Räuber Hotzenplotz", "bar": {"baz": 42, "list": [1, 2]}, "number": 3.14159, "width": 6}
+    assert PreparedFormat(template).format(data) == Formatter().vformat(template, (), data)
+
+
+def test_prepared_format_failures():
+    with pytest.raises(KeyError):
+        PreparedFormat("{unknown}").format({})
+    with pytest.raises(ValueError):
+        PreparedFormat("{unbalanced").format({})
+    with pytest.raises(IndexError):
+        PreparedFormat("{} {0}").format({})
+
+
+@pytest.mark.parametrize(
+    "field_name,expected",
+    [
+        ("foo", ("foo", [])),
+        ("foo.bar[0][baz]", ("foo", [(True, "bar"), (False, 0), (False, "baz")])),
+        ("foo[a.b]", ("foo", [(False, "a.b")])),
+        ("0.real", (0, [(True, "real")])),
+        ("", ("", [])),
+    ],
+)
+def test_split_field_name(field_name, expected):
+    assert split_field_name(field_name) == expected
+
+
+@pytest.mark.parametrize("field_name", ["foo.", "foo[", "foo[]", "foo[0]bar"])
+def test_split_field_name_invalid(field_name):
+    with pytest.raises(ValueError):
+        split_field_name(field_name)
+
+
 def test_asbool():
     assert asbool(True) is True
     assert asbool(False) is False